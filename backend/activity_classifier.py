@@ -0,0 +1,161 @@
+"""
+Activity classification for presence-based XP.
+Picks the member's highest-priority tracked activity and its XP range.
+discord.py dispatches a presence update once per mutual guild, so results
+are cached per (user_id, fingerprint) for a few seconds and the classifier
+runs once per actual change instead of once per guild.
+"""
+
+import time
+from typing import Dict, Optional, Tuple
+
+import discord
+
+import metrics
+
+# XP ranges for different activities (per hour) - random value in range
+ACTIVITY_XP_RANGES = {
+    "listening": (3, 8),      # Spotify, music - 3-8 XP per hour
+    "playing": (8, 15),       # Games, apps - 8-15 XP per hour
+    "streaming": (12, 20),    # Streaming - 12-20 XP per hour
+    "watching": (5, 10),      # Watching - 5-10 XP per hour
+    "competing": (10, 18),    # Competing in games - 10-18 XP per hour
+    "unknown": (3, 7)         # Unknown activities - 3-7 XP per hour
+}
+
+# Priority (lower wins), emoji and verb per Discord activity type
+ACTIVITY_TYPES = {
+    discord.ActivityType.playing: ("playing", 3, "🎮", "playing"),
+    discord.ActivityType.watching: ("watching", 5, "📺", "watching"),
+    discord.ActivityType.listening: ("listening", 2, "🎵", "listening to"),
+    discord.ActivityType.competing: ("competing", 4, "🏆", "competing in"),
+}
+UNKNOWN_TYPE = ("unknown", 7, "✨", "doing")
+
+CACHE_TTL = 5.0                # Seconds a classification is reused across guilds
+CACHE_MAX_ENTRIES = 10000      # Expired entries are swept once the cache grows past this
+
+class ActivityClassification:
+    """The activity a member is credited for."""
+    __slots__ = ("type_key", "name", "description", "xp_range")
+
+    def __init__(self, type_key: str, name: str, description: str):
+        self.type_key = type_key
+        # Tracked name used for streaks and change detection, e.g. "Playing: Minecraft"
+        self.name = name
+        # Log text, e.g. "🎮 playing **Minecraft**"
+        self.description = description
+        self.xp_range = ACTIVITY_XP_RANGES.get(type_key, ACTIVITY_XP_RANGES["unknown"])
+
+def activity_fingerprint(activities) -> tuple:
+    """
+    Cheap, comparable summary of the activities the cog tracks.
+    Spotify collapses to one entry (track changes don't matter) and custom
+    status is ignored, matching classify_activities().
+    """
+    fingerprint = []
+    for activity in activities:
+        if isinstance(activity, discord.Spotify):
+            fingerprint.append("Spotify")
+        elif isinstance(activity, discord.Streaming):
+            fingerprint.append(("streaming", activity.name))
+        elif isinstance(activity, discord.CustomActivity):
+            continue
+        elif isinstance(activity, (discord.Activity, discord.Game)):
+            fingerprint.append((getattr(activity, "type", None), activity.name))
+    return tuple(fingerprint)
+
+def classify_activities(activities) -> Optional[ActivityClassification]:
+    """
+    Pick the highest priority tracked activity, or None.
+    Priority: Streaming > Listening (Spotify) > Playing > Competing > Watching > other.
+    Custom status is never tracked.
+    """
+    best = None
+    priority = 999
+
+    for activity in activities:
+        # Spotify (Listening)
+        if isinstance(activity, discord.Spotify):
+            if priority > 2:
+                priority = 2
+                # Use generic "Spotify" instead of song name to avoid logging every song change
+                best = ActivityClassification(
+                    "listening", "Spotify",
+                    f"🎵 listening to **{activity.title}** by {activity.artist}"
+                )
+
+        # Streaming
+        elif isinstance(activity, discord.Streaming):
+            if priority > 1:
+                priority = 1
+                best = ActivityClassification(
+                    "streaming", f"Streaming: {activity.name}", f"📺 streaming **{activity.name}**"
+                )
+
+        # Skip Custom Activity - don't track custom status
+        elif isinstance(activity, discord.CustomActivity):
+            continue
+
+        # All other activities (Games, Apps, etc.)
+        elif isinstance(activity, (discord.Activity, discord.Game)):
+            # Game has no explicit type; it is always "playing"
+            activity_type = getattr(activity, "type", discord.ActivityType.playing)
+            type_key, current_priority, emoji, verb = ACTIVITY_TYPES.get(activity_type, UNKNOWN_TYPE)
+            if current_priority < priority:
+                priority = current_priority
+                best = ActivityClassification(
+                    type_key, f"{type_key.title()}: {activity.name}", f"{emoji} {verb} **{activity.name}**"
+                )
+
+    return best
+
+class ClassificationCache:
+    """Short-lived classification results keyed by (user_id, fingerprint)."""
+
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[int, tuple], Tuple[float, Optional[ActivityClassification]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def classify(self, user_id: int, activities, fingerprint: Optional[tuple] = None) -> Optional[ActivityClassification]:
+        """Classify a member's activities, reusing a fresh result for the same fingerprint."""
+        if fingerprint is None:
+            fingerprint = activity_fingerprint(activities)
+        key = (user_id, fingerprint)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        result = classify_activities(activities)
+        if len(self._entries) >= self.max_entries:
+            self._sweep(now)
+        self._entries[key] = (now + self.ttl, result)
+        return result
+
+    def _sweep(self, now: float):
+        """Drop expired entries; if all are fresh, drop everything."""
+        expired = [key for key, (expires, _) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+
+    def clear(self):
+        self._entries.clear()
+
+# Global classifier cache, shared by every guild's presence handler
+classification_cache = ClassificationCache()
+metrics.Gauge(
+    "ayame_activity_classify_cache_hit_ratio", "Share of presence classifications served from the per-user cache",
+    lambda: classification_cache.hits / max(classification_cache.hits + classification_cache.misses, 1)
+)
@@ -0,0 +1,141 @@
+"""
+Hourly activity XP scheduling.
+An activity session starts when a member's tracked activity changes and is
+put on a hashed timer wheel at its next award time. A periodic tick pops
+every session that is due and awards them in one batch, so awards land on
+time even if the member sends no presence updates, and presence updates
+need no cooldown lookup.
+"""
+
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import metrics
+from activity_classifier import ActivityClassification
+
+AWARD_INTERVAL = 3600          # Seconds of continuous activity per award
+TICK_SECONDS = 10              # Wheel resolution; awards land at most one tick late
+WHEEL_SLOTS = 512              # Slots per revolution (~85 min at 10 s ticks)
+
+class TimerWheel:
+    """
+    Hashed timer wheel: O(1) schedule and cancel, and each tick only looks at
+    one slot. Timers more than one revolution out keep their absolute
+    deadline tick and are skipped until it comes round.
+    """
+
+    def __init__(self, tick_seconds: float = TICK_SECONDS, slots: int = WHEEL_SLOTS,
+                 now: Optional[float] = None):
+        self.tick_seconds = tick_seconds
+        self.slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        # key -> (slot index, deadline tick)
+        self._where: Dict[Hashable, Tuple[int, int]] = {}
+        self._tick = int((time.monotonic() if now is None else now) // tick_seconds)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, when: float):
+        """(Re)schedule key to fire at monotonic time `when`."""
+        self.cancel(key)
+        # Never in the past: a late timer fires on the next tick
+        deadline = max(int(-(-when // self.tick_seconds)), self._tick + 1)
+        slot = deadline % len(self.slots)
+        self.slots[slot][key] = deadline
+        self._where[key] = (slot, deadline)
+
+    def cancel(self, key: Hashable) -> bool:
+        where = self._where.pop(key, None)
+        if where is None:
+            return False
+        del self.slots[where[0]][key]
+        return True
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """Move the wheel up to `now` and return every key that fired."""
+        target = int((time.monotonic() if now is None else now) // self.tick_seconds)
+        fired = []
+        # After a long stall, one pass over every slot covers all ticks
+        last = min(target, self._tick + len(self.slots))
+        while self._tick < last:
+            self._tick += 1
+            bucket = self.slots[self._tick % len(self.slots)]
+            due = [key for key, deadline in bucket.items() if deadline <= target]
+            for key in due:
+                del bucket[key]
+                del self._where[key]
+            fired.extend(due)
+        self._tick = max(self._tick, target)
+        return fired
+
+class ActivitySession:
+    """One member's continuous activity in one guild."""
+    __slots__ = ("activity", "started", "streak", "next_award")
+
+    def __init__(self, activity: ActivityClassification, started: float, next_award: float):
+        self.activity = activity
+        self.started = started
+        # Streak hours so far; a new activity counts as 1
+        self.streak = 1
+        self.next_award = next_award
+
+class AwardScheduler:
+    """Active sessions keyed by (guild_id, user_id), driven by a TimerWheel."""
+
+    def __init__(self, interval: float = AWARD_INTERVAL, tick_seconds: float = TICK_SECONDS):
+        self.interval = interval
+        self.wheel = TimerWheel(tick_seconds)
+        self.sessions: Dict[Tuple[int, int], ActivitySession] = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def start(self, guild_id: int, user_id: int, activity: ActivityClassification) -> ActivitySession:
+        """Begin (or restart) a session; the first award is one interval away."""
+        key = (guild_id, user_id)
+        now = time.monotonic()
+        session = self.sessions[key] = ActivitySession(activity, now, now + self.interval)
+        self.wheel.schedule(key, session.next_award)
+        return session
+
+    def get(self, guild_id: int, user_id: int) -> Optional[ActivitySession]:
+        return self.sessions.get((guild_id, user_id))
+
+    def stop(self, guild_id: int, user_id: int) -> Optional[ActivitySession]:
+        key = (guild_id, user_id)
+        self.wheel.cancel(key)
+        return self.sessions.pop(key, None)
+
+    def stop_guild(self, guild_id: int) -> int:
+        """End every session in a guild (XP disabled or reset)."""
+        keys = [key for key in self.sessions if key[0] == guild_id]
+        for key in keys:
+            self.stop(*key)
+        return len(keys)
+
+    def due(self, now: Optional[float] = None) -> List[Tuple[Tuple[int, int], ActivitySession]]:
+        """
+        Pop sessions whose award time has come, bump their streak and
+        reschedule them for the next interval.
+        """
+        now = time.monotonic() if now is None else now
+        result = []
+        for key in self.wheel.advance(now):
+            session = self.sessions.get(key)
+            if session is None:
+                continue
+            session.streak += 1
+            session.next_award += self.interval
+            if session.next_award <= now:
+                # Loop was stalled for over an interval; don't award the backlog
+                session.next_award = now + self.interval
+            self.wheel.schedule(key, session.next_award)
+            result.append((key, session))
+        return result
+
+# Global scheduler shared by every guild's presence handler
+award_scheduler = AwardScheduler()
+metrics.Gauge("ayame_activity_sessions", "Activity sessions waiting for their next hourly award", lambda: len(award_scheduler))
@@ -0,0 +1,71 @@
+"""
+Per-call latency of Database methods: pooled per-thread connections versus
+opening a fresh connection for every query (the behaviour before pooling).
+
+    python bench/bench_db.py [--users 1000] [--calls 5000]
+
+Runs in a temporary directory, so it never touches bot_database.db.
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database creates its global instance on import; keep it out of the working tree
+os.chdir(tempfile.mkdtemp(prefix="ayame-bench-"))
+
+from database import Database
+
+GUILD_ID = 1
+
+class ConnectPerCall(Database):
+    """Database with the old connection handling: connect on every call, no tuning."""
+
+    def get_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path)
+
+def seed(database: Database, users: int):
+    rows = [(GUILD_ID, user_id, random.randint(0, 5000), None) for user_id in range(users)]
+    database.apply_xp_batch(rows, [])
+    database.update_guild_config(GUILD_ID, enabled=True, log_channel=10)
+    for level in (1, 5, 10, 20):
+        database.add_custom_role(GUILD_ID, level, 100 + level)
+
+def per_call_us(func, calls: int, users: int) -> float:
+    user_ids = [random.randrange(users) for _ in range(calls)]
+    started = time.perf_counter()
+    for user_id in user_ids:
+        func(user_id)
+    return (time.perf_counter() - started) / calls * 1e6
+
+def run(database: Database, calls: int, users: int) -> dict:
+    seed(database, users)
+    return {
+        "get_user_xp": per_call_us(lambda u: database.get_user_xp(GUILD_ID, u), calls, users),
+        "get_guild_config + get_custom_roles": per_call_us(
+            lambda u: (database.get_guild_config(GUILD_ID), database.get_custom_roles(GUILD_ID)), calls, users),
+        "add_xp": per_call_us(lambda u: database.add_xp(GUILD_ID, u, 10), calls, users),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    before = run(ConnectPerCall("before.db"), args.calls, args.users)
+    pooled = Database("after.db")
+    after = run(pooled, args.calls, args.users)
+    pooled.close()
+
+    print(f"{args.users} users, {args.calls} calls each, per call:")
+    for name in before:
+        print(f"  {name:<38} {before[name]:8.1f}us -> {after[name]:6.1f}us  ({before[name] / after[name]:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+CPU spent on presence logging: the sampled presence_log.event() calls as
+shipped versus an INFO line for every event, as the handler logged before.
+
+    python bench/bench_logging.py [--events 10000] [--repeat 5]
+
+Reuses the gateway replay of bench_presence.py. The INFO variant is the
+same handler source with each presence_log.event(reason, msg, *args) turned
+into logger.info(msg, *args). Logging is configured as main.py does it
+(INFO, the bot's format) but writes to os.devnull. Only updates that get
+past the pre-filter log anything, so only those scenarios are replayed.
+"""
+
+import os
+import ast
+import time
+import asyncio
+import logging
+import argparse
+
+from bench_presence import ENABLED_GUILD, DISABLED_GUILD, add_guild, recompiled, replay, scenarios
+
+import discord
+from discord.ext import commands
+
+from guild_cache import guild_cache
+from storage import storage
+
+LOGGED_SCENARIOS = ("new activity", "start / stop")
+
+class InfoPerEvent(ast.NodeTransformer):
+    """presence_log.event(reason, msg, *args) -> logger.info(msg, *args)"""
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if (isinstance(func, ast.Attribute) and func.attr == "event"
+                and isinstance(func.value, ast.Attribute) and func.value.attr == "presence_log"):
+            info = ast.Attribute(value=ast.Name(id="logger", ctx=ast.Load()), attr="info", ctx=ast.Load())
+            return ast.Call(func=info, args=node.args[1:], keywords=[])
+        return node
+
+class CountingHandler(logging.StreamHandler):
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.lines = 0
+
+    def emit(self, record):
+        self.lines += 1
+        super().emit(record)
+
+async def run(events: int, repeat: int):
+    await storage.update_guild_config(ENABLED_GUILD, enabled=True, log_channel=10)
+    await guild_cache.warm_enabled()
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
+    await bot._async_setup_hook()
+    for guild_id in (ENABLED_GUILD, DISABLED_GUILD):
+        add_guild(bot._connection, guild_id)
+
+    # As main.py sets it up, minus the terminal
+    devnull = open(os.devnull, "w")
+    handler = CountingHandler(devnull)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    logging.basicConfig(level=logging.INFO, handlers=[handler], force=True)
+    # discord.py's own loggers stay quiet; only the cog's lines are compared
+    logging.getLogger("discord").setLevel(logging.WARNING)
+
+    handlers = ("on_presence_update", "process_presence_update")
+    variants = {
+        "INFO per event": recompiled(*handlers, transformer=InfoPerEvent())(bot),
+        "sampled (shipped)": recompiled(*handlers)(bot),
+    }
+
+    async def cpu(cog, frames: list) -> float:
+        bot.add_listener(cog.on_presence_update)
+        try:
+            started = time.process_time()
+            await replay(bot, frames)
+            return time.process_time() - started
+        finally:
+            bot.remove_listener(cog.on_presence_update)
+
+    runs = {name: frames for name, frames in scenarios(events).items() if name in LOGGED_SCENARIOS}
+    events = len(next(iter(runs.values())))
+    print(f"{events} presence updates per run, best of {repeat}, CPU per 10k updates:")
+    for scenario, frames in runs.items():
+        results = {}
+        for name, cog in variants.items():
+            await cpu(cog, frames)  # Warm up
+            handler.lines = 0
+            seconds = min([await cpu(cog, frames) for _ in range(repeat)])
+            results[name] = seconds, handler.lines / repeat
+        (before, _), (after, _) = results.values()
+        print(f"  {scenario}:")
+        for name, (seconds, lines) in results.items():
+            print(f"    {name:<20} {seconds / events * 1e4 * 1000:8.1f}ms  {lines / events * 1e4:7.0f} log lines")
+        print(f"    saved {(before - after) / events * 1e6:.1f}us CPU per update")
+    devnull.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.events, args.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Cost of the presence metrics: on_presence_update as shipped versus the same
+handler with every metrics and timing statement stripped from its source.
+
+    python bench/bench_presence.py [--events 800] [--repeat 200]
+
+PRESENCE_UPDATE frames are fed to discord.py's own DiscordWebSocket, as
+they arrive off the zlib-compressed gateway, so each event costs what it
+costs the bot: inflate, JSON decoding, member copy, activity parsing, the
+listener task and the handler. Both handlers replay the same events in
+back-to-back runs; the overhead is the median ratio over all rounds.
+Nothing is sent to Discord and the streak buffer never fills, so no
+database writes happen. Runs in a temporary directory.
+
+Each round also runs a second copy of the shipped handler. Its median
+ratio to the shipped one, and the spread of those ratios between the first
+and last quarter of rounds, are printed next to each overhead as the noise
+floor to read it against.
+"""
+
+import os
+import gc
+import ast
+import sys
+import json
+import zlib
+import time
+import asyncio
+import inspect
+import logging
+import argparse
+import tempfile
+import textwrap
+import statistics
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="ayame-bench-"))
+
+import discord
+from discord.gateway import DiscordWebSocket
+from discord.ext import commands
+
+from cogs import activity_xp
+from cogs.activity_xp import ActivityXP
+from storage import storage
+from guild_cache import guild_cache
+
+ENABLED_GUILD = 1
+DISABLED_GUILD = 2
+LOG_CHANNEL = 10
+USERS = 400  # Below xp_buffer.MAX_PENDING, so replays never flush to the database
+
+# Names only the instrumentation uses in the handler
+INSTRUMENTATION = {"metrics", "clock", "started", "time", "PRESENCE_TIMING_SAMPLE"}
+
+class StripMetrics(ast.NodeTransformer):
+    """Drop every statement that touches INSTRUMENTATION; sampling branches keep their untimed side."""
+
+    @staticmethod
+    def _instrumentation(node) -> bool:
+        if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Attribute) and node.target.attr == "value":
+            return True  # counter.value += 1
+        return any(isinstance(n, ast.Name) and n.id in INSTRUMENTATION for n in ast.walk(node))
+
+    def _body(self, statements):
+        kept = []
+        for statement in statements:
+            if hasattr(statement, "body"):
+                statement = self.visit(statement)
+                if isinstance(statement, ast.If) and self._instrumentation(statement.test):
+                    # Sampling or timing branch: keep the untimed side
+                    untimed = statement.body
+                    if all(isinstance(s, ast.Pass) for s in untimed):
+                        untimed = statement.orelse
+                    kept.extend(s for s in untimed if not isinstance(s, ast.Pass))
+                    continue
+                kept.append(statement)
+            else:
+                statement = self.visit(statement)
+                if not self._instrumentation(statement):
+                    kept.append(statement)
+        return kept or [ast.Pass()]
+
+    def generic_visit(self, node):
+        for field in ("body", "orelse", "finalbody"):
+            statements = getattr(node, field, None)
+            if isinstance(statements, list) and statements and isinstance(statements[0], ast.stmt):
+                setattr(node, field, self._body(statements))
+        return super().generic_visit(node)
+
+def recompiled(*methods, transformer: Optional[ast.NodeTransformer] = None) -> type:
+    """
+    ActivityXP subclass with `methods` recompiled from source, optionally
+    rewritten by `transformer`. Both sides of a comparison go through here,
+    so they only differ by what the transformer changed.
+    """
+    namespace = {}
+    for name in methods:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(getattr(ActivityXP, name))))
+        tree.body[0].decorator_list = []
+        if transformer is not None:
+            tree = ast.fix_missing_locations(transformer.visit(tree))
+        scope = dict(vars(activity_xp))
+        exec(compile(tree, f"<{name}>", "exec"), scope)
+        namespace[name] = scope[name]
+    label = type(transformer).__name__ if transformer is not None else "Shipped"
+    return type(f"{label}ActivityXP", (ActivityXP,), namespace)
+
+def add_guild(state, guild_id: int):
+    guild = discord.Guild(state=state, data={
+        "id": guild_id, "name": f"guild-{guild_id}", "roles": [], "emojis": [], "stickers": [],
+        "channels": [{"id": LOG_CHANNEL, "type": 0, "name": "xp-log", "position": 0, "permission_overwrites": []}],
+    })
+    for user_id in range(1, USERS + 1):
+        guild._add_member(discord.Member(state=state, guild=guild, data={
+            "user": {"id": user_id, "username": f"user-{user_id}", "discriminator": "0", "avatar": None},
+            "roles": [], "joined_at": None, "deaf": False, "mute": False, "flags": 0,
+        }))
+    state._add_guild(guild)
+
+def game(name: str) -> dict:
+    return {"type": 0, "name": name}
+
+def spotify(track: str) -> dict:
+    return {
+        "type": 2, "name": "Spotify", "id": "spotify:1", "details": track, "state": "artist",
+        "sync_id": track, "session_id": "session", "party": {"id": "spotify:1"},
+        "assets": {}, "timestamps": {"start": 0, "end": 1},
+    }
+
+def scenarios(events: int) -> dict:
+    """
+    PRESENCE_UPDATE frames for each kind of update. `events` is rounded to
+    whole pairs of passes over the members, so every member ends where it started.
+    """
+    events = max(events // (2 * USERS), 1) * 2 * USERS
+
+    def updates(guild_id: int, activities_of):
+        # One zlib stream per run, compressed like Discord's zlib-stream transport
+        stream = zlib.compressobj()
+        return [
+            stream.compress(json.dumps({"op": 0, "t": "PRESENCE_UPDATE", "s": i, "d": {
+                "guild_id": str(guild_id), "user": {"id": str(i % USERS + 1)}, "status": "online",
+                "client_status": {"desktop": "online"}, "activities": activities_of(i // USERS),
+            }}).encode()) + stream.flush(zlib.Z_SYNC_FLUSH)
+            for i in range(events)
+        ]
+
+    minecraft, terraria = [game("Minecraft")], [game("Terraria")]
+    return {
+        # Status flips and track changes: dropped by the in-memory pre-filter
+        "prefiltered (track change)": updates(ENABLED_GUILD, lambda n: [spotify(f"track-{n}")]),
+        "prefiltered (disabled guild)": updates(DISABLED_GUILD, lambda n: minecraft if n % 2 else []),
+        # Every update switches game: classify, log digest entry, streak write
+        "new activity": updates(ENABLED_GUILD, lambda n: minecraft if n % 2 else terraria),
+        # Game on, game off: half new activities, half ended sessions
+        "start / stop": updates(ENABLED_GUILD, lambda n: minecraft if n % 2 else []),
+    }
+
+async def replay(bot: commands.Bot, frames: list) -> float:
+    ws = DiscordWebSocket(None, loop=bot.loop)
+    ws._discord_parsers = bot._connection.parsers
+    ws._dispatch = bot.dispatch
+    ws.shard_id = None
+    # Collections would land in whichever run crosses the threshold; keep them out of the timing
+    gc.collect()
+    gc.disable()
+    started = time.perf_counter()
+    for frame in frames:
+        await ws.received_message(frame)
+        # Let the listener task run, as the gateway loop does between messages
+        await asyncio.sleep(0)
+    pending = asyncio.all_tasks() - {asyncio.current_task()}
+    if pending:
+        await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - started
+    gc.enable()
+    return elapsed
+
+async def run(events: int, repeat: int):
+    await storage.update_guild_config(ENABLED_GUILD, enabled=True, log_channel=LOG_CHANNEL)
+    await guild_cache.warm_enabled()
+    logging.disable(logging.CRITICAL)
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
+    await bot._async_setup_hook()
+    errors = []
+
+    async def on_error(event, *args, **kwargs):
+        errors.append(sys.exc_info()[1])
+
+    bot.on_error = on_error
+    for guild_id in (ENABLED_GUILD, DISABLED_GUILD):
+        add_guild(bot._connection, guild_id)
+
+    handlers = ("on_presence_update", "process_presence_update")
+    shipped = recompiled(*handlers)(bot)
+    control = recompiled(*handlers)(bot)
+    stripped = recompiled(*handlers, transformer=StripMetrics())(bot)
+    cogs = (shipped, control, stripped)
+
+    async def timed(cog: ActivityXP, frames: list) -> float:
+        bot.add_listener(cog.on_presence_update)
+        try:
+            return await replay(bot, frames)
+        finally:
+            bot.remove_listener(cog.on_presence_update)
+
+    def percent(ratio: float) -> str:
+        return f"{(ratio - 1) * 100:+.2f}%"
+
+    runs = scenarios(events)
+    events = len(next(iter(runs.values())))
+    print(f"{events} presence updates per run, {USERS} members, {repeat} rounds")
+    print("fastest run per event, stripped -> shipped (median overhead; shipped copy -> shipped, and its spread):")
+    for name, frames in runs.items():
+        for cog in cogs:
+            await timed(cog, frames)
+        times = {cog: [] for cog in cogs}
+        for round_ in range(repeat):
+            # Rotate which handler goes first, so none always runs on a warmer cache
+            order = cogs[round_ % 3:] + cogs[:round_ % 3]
+            for cog in order:
+                times[cog].append(await timed(cog, frames))
+        # Each round runs back to back, so the median ratio shrugs off noisy runs
+        overhead = statistics.median(a / b for a, b in zip(times[shipped], times[stripped]))
+        noise = sorted(a / b for a, b in zip(times[shipped], times[control]))
+        low, _, high = statistics.quantiles(noise, n=4)
+        print(
+            f"  {name:<30} {min(times[stripped]) / events * 1e6:6.2f}us -> {min(times[shipped]) / events * 1e6:6.2f}us"
+            f"  ({percent(overhead)}; control {percent(statistics.median(noise))}, {percent(low)} to {percent(high)})"
+        )
+
+    if errors:
+        raise RuntimeError(f"{len(errors)} presence update(s) failed, first: {errors[0]!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.events, args.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Time for /resetxpsystem's purge_guild to delete a 100k-member guild, next
+to a guild of the same size that must come through untouched.
+
+    python bench/bench_purge.py [--members 100000] [--repeat 3]
+
+Each run seeds both guilds with user_xp and activity_streaks rows, a config
+and reward roles, purges the first through AsyncDatabase (on the writer
+thread, as the command does) and checks the second. Runs in a temporary
+directory.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database creates its global instance on import; keep it out of the working tree
+os.chdir(tempfile.mkdtemp(prefix="ayame-bench-"))
+
+from database import AsyncDatabase, Database
+
+PURGED = 1
+NEIGHBOUR = 2
+
+def seed(database: Database, guild_id: int, members: int):
+    now = datetime.now()
+    database.apply_xp_batch(
+        [(guild_id, user_id, random.randint(0, 50000), now) for user_id in range(1, members + 1)],
+        [(guild_id, user_id, "Playing: Minecraft", random.randint(1, 12), now) for user_id in range(1, members + 1)],
+    )
+    database.update_guild_config(guild_id, enabled=True, log_channel=10)
+    for level in (5, 10, 20, 50):
+        database.add_custom_role(guild_id, level, guild_id * 100 + level)
+
+def counts(database: Database, guild_id: int) -> dict:
+    conn = database.get_connection()
+    return {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE guild_id = ?", (guild_id,)).fetchone()[0]
+        for table in ("user_xp", "activity_streaks", "custom_xp_roles", "guild_config")
+    }
+
+async def run(members: int, repeat: int):
+    print(f"purge a {members}-member guild next to another of {members}:")
+    for i in range(repeat):
+        database = Database(f"bench_{i}.db")
+        for guild_id in (PURGED, NEIGHBOUR):
+            seed(database, guild_id, members)
+        neighbour = counts(database, NEIGHBOUR)
+        adb = AsyncDatabase(database)
+
+        started = time.perf_counter()
+        deleted = await adb.purge_guild(PURGED)
+        elapsed = time.perf_counter() - started
+
+        if any(counts(database, PURGED).values()):
+            raise RuntimeError(f"purged guild has rows left: {counts(database, PURGED)}")
+        if counts(database, NEIGHBOUR) != neighbour:
+            raise RuntimeError(f"neighbour guild changed: {counts(database, NEIGHBOUR)}")
+        print(f"  run {i + 1}: {elapsed * 1000:7.1f}ms  {deleted}")
+        adb.close()
+    print("neighbour guild untouched in every run")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.members, args.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Memory held by per-member presence state for 100k tracked sessions: the
+SessionStore versus the dict of dicts keyed by "{guild}_{user}" strings
+that ActivityXP kept before.
+
+    python bench/bench_sessions.py [--sessions 100000] [--guilds 20]
+
+Measured with tracemalloc. Fingerprints and activity names are built
+before measuring, since both layouts hold the same objects. Snowflake
+sized IDs are used, so the key sizes are realistic.
+"""
+
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+
+from activity_classifier import activity_fingerprint
+from session_store import SessionStore
+
+GAMES = ["Minecraft", "Terraria", "Valorant", "League of Legends", "Fortnite", "Rocket League"]
+
+def members(sessions: int, guilds: int) -> list:
+    guild_ids = [random.randrange(10 ** 17, 10 ** 18) for _ in range(guilds)]
+    result = []
+    for _ in range(sessions):
+        game = random.choice(GAMES)
+        # One fingerprint per member, as each presence update builds its own
+        fingerprint = activity_fingerprint([discord.Game(game)])
+        result.append((random.choice(guild_ids), random.randrange(10 ** 17, 10 ** 18), fingerprint, f"Playing: {game}"))
+    return result
+
+def measured(fill) -> int:
+    """Bytes still allocated by fill() once it returns (its result kept alive)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+def string_keyed(entries: list):
+    last_activity = defaultdict(dict)
+    for guild_id, user_id, fingerprint, name in entries:
+        user_key = f"{guild_id}_{user_id}"
+        last_activity[user_key]["fingerprint"] = fingerprint
+        last_activity[user_key]["current"] = name
+    return last_activity
+
+def session_store(entries: list):
+    store = SessionStore(max_entries=len(entries))
+    for guild_id, user_id, fingerprint, name in entries:
+        state = store.ensure(guild_id, user_id)
+        state.fingerprint = fingerprint
+        state.current = name
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--guilds", type=int, default=20)
+    args = parser.parse_args()
+
+    entries = members(args.sessions, args.guilds)
+    print(f"{args.sessions} sessions across {args.guilds} guilds:")
+    for name, fill in (("dict of dicts, string keys", string_keyed), ("SessionStore", session_store)):
+        used = measured(lambda: fill(entries))
+        print(f"  {name:<28} {used / 2 ** 20:6.1f} MiB  {used / args.sessions:5.0f} B per session")
+
+if __name__ == "__main__":
+    main()
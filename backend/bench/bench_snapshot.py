@@ -0,0 +1,84 @@
+"""
+Time-to-backup and event-loop stall of create_snapshot, against copying
+the whole database in one go on the event loop thread, plus the time to
+restore one guild from the snapshot.
+
+    python bench/bench_snapshot.py [--guilds 50] [--members 4000] [--repeat 3]
+
+The database is seeded with guilds * members user_xp and activity_streaks
+rows (the defaults give 200k of each, about 45 MB). Stalls are measured
+with the same probe create_snapshot uses. Runs in a temporary directory.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database creates its global instance on import; keep it out of the working tree
+os.chdir(tempfile.mkdtemp(prefix="ayame-bench-"))
+
+from database import AsyncDatabase, Database
+from snapshots import _probe_loop_stall, create_snapshot, restore_guild
+
+def seed(database: Database, guilds: int, members: int):
+    now = datetime.now()
+    for guild_id in range(1, guilds + 1):
+        xp_rows = [(guild_id, user_id, random.randint(0, 50000), now) for user_id in range(1, members + 1)]
+        streak_rows = [(guild_id, user_id, "Playing: Minecraft", random.randint(1, 12), now)
+                       for user_id in range(1, members + 1)]
+        database.apply_xp_batch(xp_rows, streak_rows)
+        database.update_guild_config(guild_id, enabled=True, log_channel=10)
+        for level in (5, 10, 20):
+            database.add_custom_role(guild_id, level, guild_id * 100 + level)
+
+async def blocking_copy(database: Database, path: str) -> tuple:
+    """The whole backup in one step, on the event loop thread."""
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe_loop_stall(stop))
+    await asyncio.sleep(0)  # Let the probe start its first sleep
+    started = time.perf_counter()
+    database.snapshot_to(path, pages_per_step=-1)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    return elapsed, await probe
+
+async def run(guilds: int, members: int, repeat: int):
+    database = Database("bench.db")
+    seed(database, guilds, members)
+    adb = AsyncDatabase(database)
+    size = os.path.getsize("bench.db") / 2 ** 20
+    print(f"{guilds} guilds x {members} members ({guilds * members} user_xp + streak rows, {size:.1f} MiB)")
+
+    blocking, shipped = [], []
+    for i in range(repeat):
+        blocking.append(await blocking_copy(database, f"blocking_{i}.db"))
+        stats = await create_snapshot(adb, directory="snapshots", keep=repeat)
+        shipped.append((stats["seconds"], stats["max_loop_stall_ms"] / 1000))
+
+    print("best of", repeat, "(time to backup, worst loop stall):")
+    for name, runs in (("one step on the event loop", blocking), ("create_snapshot", shipped)):
+        seconds = min(r[0] for r in runs)
+        stall = min(r[1] for r in runs)
+        print(f"  {name:<28} {seconds * 1000:8.1f}ms  stall {stall * 1000:7.1f}ms")
+
+    started = time.perf_counter()
+    restored = await restore_guild(adb, stats["name"], 1, directory="snapshots")
+    print(f"restore one guild: {(time.perf_counter() - started) * 1000:.1f}ms {restored}")
+    adb.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--members", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.guilds, args.members, args.repeat))
+
+if __name__ == "__main__":
+    main()
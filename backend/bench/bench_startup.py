@@ -0,0 +1,109 @@
+"""
+Startup-to-ready time with startup recovery awaited inside on_ready (the old
+flow, one recovery notice at a time) against recovery running in the
+background with RECOVERY_NOTIFY_CONCURRENCY notices in flight.
+
+    python bench/bench_startup.py [--guilds 2000] [--enabled 1000] [--send-ms 20]
+
+Every enabled guild has a log channel and two reward roles, one of them
+deleted, so recovery drops a role and sends a notice per guild. Sends sleep
+--send-ms instead of calling Discord. Runs in a temporary directory.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database creates its global instance on import; keep it out of the working tree
+os.chdir(tempfile.mkdtemp(prefix="ayame-bench-"))
+
+import discord
+
+import recovery
+from guild_cache import guild_cache
+from storage import storage
+
+LOG_CHANNEL = 10 ** 6 + 1
+REWARD_ROLE = 10 ** 6 + 2
+DELETED_ROLE = 10 ** 6 + 3
+
+def make_guild(state, guild_id: int) -> discord.Guild:
+    return discord.Guild(data={
+        "id": guild_id, "name": f"guild {guild_id}", "owner_id": 1,
+        "roles": [
+            {"id": guild_id, "name": "@everyone", "position": 0, "permissions": "0"},
+            {"id": REWARD_ROLE, "name": "level 5", "position": 1, "permissions": "0"},
+        ],
+        "channels": [{"id": LOG_CHANNEL, "type": 0, "name": "xp-log", "position": 0}],
+    }, state=state)
+
+class Bot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+
+    async def wait_until_ready(self):
+        pass
+
+    def is_closed(self):
+        return False
+
+async def seed(guilds: int, enabled: int) -> Bot:
+    for guild_id in range(1, enabled + 1):
+        await storage.update_guild_config(guild_id, enabled=True, log_channel=LOG_CHANNEL)
+        await storage.add_custom_role(guild_id, 5, REWARD_ROLE)
+        await storage.add_custom_role(guild_id, 10, DELETED_ROLE)
+    client = discord.Client(intents=discord.Intents.default())
+    return Bot([make_guild(client._connection, guild_id) for guild_id in range(1, guilds + 1)])
+
+async def blocking_on_ready(bot: Bot, started: float) -> float:
+    """Recovery awaited before on_ready goes on, one notice at a time."""
+    recovery.RECOVERY_NOTIFY_CONCURRENCY = 1
+    await recovery.run_recovery(bot, started)
+    return time.monotonic() - started
+
+async def background_on_ready(bot: Bot, started: float) -> float:
+    recovery.start_recovery(bot, started)
+    return time.monotonic() - started
+
+async def run(guilds: int, enabled: int, send_ms: float):
+    async def send(self, *args, **kwargs):
+        await asyncio.sleep(send_ms / 1000)
+
+    discord.TextChannel.send = send
+    # One warning per dropped role would dominate the output
+    logging.disable(logging.CRITICAL)
+    print(f"{guilds} guilds, {enabled} enabled, {send_ms:g}ms per recovery notice")
+
+    for name, on_ready in (("awaited in on_ready, serial notices", blocking_on_ready),
+                           ("background recovery", background_on_ready)):
+        # Seeding again puts back the deleted roles the previous run dropped
+        guild_cache.clear()
+        recovery.recovery_ready = asyncio.Event()
+        recovery._recovery_task = None
+        recovery.RECOVERY_NOTIFY_CONCURRENCY = 10
+        bot = await seed(guilds, enabled)
+
+        started = time.monotonic()
+        returned = await on_ready(bot, started)
+        await recovery.recovery_ready.wait()
+        ready = time.monotonic() - started
+        configs = await storage.get_enabled_guild_configs()
+        if len(configs) != enabled or any(DELETED_ROLE in roles.values() for _, roles in configs.values()):
+            raise RuntimeError(f"{name}: recovery did not drop the deleted reward roles")
+        print(f"  {name:<36} on_ready returned {returned * 1000:8.1f}ms  ready {ready:6.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=2000)
+    parser.add_argument("--enabled", type=int, default=1000)
+    parser.add_argument("--send-ms", type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.guilds, args.enabled, args.send_ms))
+
+if __name__ == "__main__":
+    main()
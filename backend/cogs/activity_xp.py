@@ -1,14 +1,53 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
-from datetime import datetime, timedelta
-from collections import defaultdict
+from discord.ext import commands, tasks
+from datetime import datetime
+import asyncio
 import logging
 import random
-from database import db
+import os
+import time
+import metrics
+from sampled_log import SampledLogger
+from activity_classifier import activity_fingerprint, classification_cache
+from storage import storage, is_sqlite
+from award_scheduler import award_scheduler, TICK_SECONDS as AWARD_TICK_SECONDS
+from session_store import presence_sessions
+from role_sync import role_sync, reconcile_member_roles
+from log_digest import log_digest, FLUSH_SECONDS as LOG_FLUSH_SECONDS, LOW, HIGH
+from xp_buffer import XPWriteBuffer, FLUSH_INTERVAL
+from guild_cache import guild_cache
+from leaderboard_index import leaderboard_index
+from snapshots import create_snapshot, list_snapshots, restore_guild, SNAPSHOT_INTERVAL_HOURS
 
 logger = logging.getLogger(__name__)
 
+# Presence counters and per-stage histograms, looked up once per process.
+# Counters are bumped in place (.value += 1): on_presence_update runs for
+# every presence change, and a method call there costs more than the rest
+# of its instrumentation together.
+SKIP_BOT = metrics.PRESENCE_PREFILTERED.labels("bot")
+SKIP_GUILD_DISABLED = metrics.PRESENCE_PREFILTERED.labels("guild_disabled")
+SKIP_UNCHANGED = metrics.PRESENCE_PREFILTERED.labels("unchanged")
+FILTERED_DISABLED = metrics.PRESENCE_FILTERED.labels("disabled")
+FILTERED_NO_LOG_CHANNEL = metrics.PRESENCE_FILTERED.labels("no_log_channel")
+FILTERED_LOG_CHANNEL_MISSING = metrics.PRESENCE_FILTERED.labels("log_channel_missing")
+FILTERED_TARGET_ROLE = metrics.PRESENCE_FILTERED.labels("target_role")
+FILTERED_NO_ACTIVITY = metrics.PRESENCE_FILTERED.labels("no_activity")
+FILTERED_CONTINUING = metrics.PRESENCE_FILTERED.labels("continuing")
+NEW_ACTIVITY = metrics.PRESENCE_NEW_ACTIVITY.labels()
+STAGE_LOOKUP = metrics.PRESENCE_STAGE.labels("lookup")
+STAGE_DB_WRITE = metrics.PRESENCE_STAGE.labels("db_write")
+STAGE_RENDER = metrics.PRESENCE_STAGE.labels("render")
+PRESENCE_TOTAL = metrics.PRESENCE_LATENCY.labels()
+
+# Latency sampling: updates of 1 in N members (by user ID) are timed; counters are exact
+PRESENCE_TIMING_SAMPLE = 100
+
+# Presence log sampling: 1 in N debug lines per reason (default 100), plus a summary
+PRESENCE_LOG_SAMPLING = {"new_activity": 10, "awarded": 1}
+PRESENCE_SUMMARY_MINUTES = 1
+
 # Role themes for auto-generation
 ROLE_THEMES = {
     "anime": [
@@ -91,52 +130,142 @@ ROLE_THEMES = {
     ]
 }
 
-# XP ranges for different activities (per hour) - random value in range
-ACTIVITY_XP_RANGES = {
-    "listening": (3, 8),      # Spotify, music - 3-8 XP per hour
-    "playing": (8, 15),       # Games, apps - 8-15 XP per hour
-    "streaming": (12, 20),    # Streaming - 12-20 XP per hour
-    "watching": (5, 10),      # Watching - 5-10 XP per hour
-    "competing": (10, 18),    # Competing in games - 10-18 XP per hour
-    "unknown": (3, 7)         # Unknown activities - 3-7 XP per hour
-}
+# Where /backupxp writes and /importxp reads guild exports
+BACKUP_DIR = "backups"
 
 class ActivityXP(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.last_activity = defaultdict(dict)
-        self.cooldowns = defaultdict(lambda: datetime.now() - timedelta(hours=2))
-        self.streaks = defaultdict(lambda: {"count": 0, "activity": None, "last_time": None})
+        # Presence-driven XP/streak writes are coalesced and flushed in batches
+        self.xp_buffer = XPWriteBuffer(storage, leaderboard=leaderboard_index)
+        # Per-event presence logging is sampled; counts go out in a periodic summary
+        self.presence_log = SampledLogger(logger, PRESENCE_LOG_SAMPLING)
+    
+    async def cog_load(self):
+        # Lets the presence pre-filter drop disabled guilds without a query
+        enabled = await guild_cache.warm_enabled()
+        logger.info(f"Activity XP enabled in {enabled} guild(s)")
+        self.flush_xp_buffer.start()
+        self.award_due_sessions.start()
+        self.flush_log_digest.start()
+        self.log_presence_summary.start()
+        if is_sqlite(storage):
+            self.snapshot_database.start()
+        # Guilds aren't cached until the bot is ready
+        self.resume_task = asyncio.create_task(self.resume_after_restart())
+    
+    async def cog_unload(self):
+        self.flush_xp_buffer.cancel()
+        self.award_due_sessions.cancel()
+        self.flush_log_digest.cancel()
+        self.log_presence_summary.cancel()
+        self.snapshot_database.cancel()
+        self.resume_task.cancel()
+        # Persist anything still buffered before the cog goes away
+        await self.xp_buffer.flush()
+        await log_digest.flush()
+    
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_xp_buffer(self):
+        """Periodically write buffered XP and streak updates."""
+        await self.xp_buffer.flush()
+    
+    @tasks.loop(seconds=AWARD_TICK_SECONDS)
+    async def award_due_sessions(self):
+        """Award hourly XP to every activity session that came due this tick."""
+        with metrics.AWARD_TICK.time():
+            presence_sessions.expire()
+            for (guild_id, user_id), session in award_scheduler.due():
+                try:
+                    await self.award_session(guild_id, user_id, session)
+                except Exception as e:
+                    logger.error(f"Failed to award activity XP to {user_id} in {guild_id}: {e}")
+    
+    @tasks.loop(seconds=LOG_FLUSH_SECONDS)
+    async def flush_log_digest(self):
+        """Send queued activity log entries, batched per channel."""
+        try:
+            await log_digest.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush activity log: {e}")
+    
+    @tasks.loop(minutes=PRESENCE_SUMMARY_MINUTES)
+    async def log_presence_summary(self):
+        """Aggregated presence event counts since the last summary."""
+        self.presence_log.summary("Presence events")
+    
+    @tasks.loop(hours=SNAPSHOT_INTERVAL_HOURS)
+    async def snapshot_database(self):
+        """Periodic hot snapshot of the whole database."""
+        try:
+            await self.xp_buffer.flush()
+            await create_snapshot(storage)
+        except Exception as e:
+            logger.error(f"Scheduled snapshot failed: {e}")
+    
+    async def resume_after_restart(self):
+        """Restart reward role syncs and activity sessions that a restart interrupted."""
+        await self.bot.wait_until_ready()
+        resumed = await role_sync.resume(self.bot)
+        if resumed:
+            logger.info(f"Resumed {resumed} reward role sync(s)")
+        seeded = await self.seed_sessions()
+        if seeded:
+            logger.info(f"Resumed {seeded} activity session(s) from current presences")
+    
+    async def seed_sessions(self) -> int:
+        """
+        Start award sessions for members who are already active in enabled
+        guilds. Presence updates only arrive on change, so after a restart a
+        member who keeps playing would otherwise never be awarded again.
+        Sessions are started silently: the activity was logged before the restart.
+        """
+        seeded = 0
+        for guild_id in await storage.get_enabled_guild_ids():
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild.unavailable:
+                continue
+            config = await self.get_guild_config(guild_id)
+            if not config.get("enabled") or not guild.get_channel(config.get("log_channel") or 0):
+                continue
+            target_role = guild.get_role(config.get("target_role") or 0)
+            
+            for member in guild.members:
+                if member.bot or not member.activities or (target_role and target_role not in member.roles):
+                    continue
+                # A presence update may have started the session already
+                if award_scheduler.get(guild_id, member.id) is not None:
+                    continue
+                fingerprint = activity_fingerprint(member.activities)
+                classification = classification_cache.classify(member.id, member.activities, fingerprint)
+                if not classification:
+                    continue
+                state = presence_sessions.ensure(guild_id, member.id)
+                state.fingerprint = fingerprint
+                state.current = classification.name
+                award_scheduler.start(guild_id, member.id, classification)
+                seeded += 1
+            # Large guilds: let gateway events through between guilds
+            await asyncio.sleep(0)
+        return seeded
     
-    def get_guild_config(self, guild_id: int):
-        """Get configuration for a specific guild."""
-        config = db.get_guild_config(guild_id)
-        # Add custom_roles from database
-        config["custom_roles"] = db.get_custom_roles(guild_id)
-        return config
+    async def get_guild_config(self, guild_id: int):
+        """Get configuration for a specific guild (cached, includes custom_roles)."""
+        settings = await guild_cache.get(guild_id)
+        return settings.config
     
-    def get_user_xp(self, guild_id: int, user_id: int):
-        """Get XP for a user in a guild."""
-        return db.get_user_xp(guild_id, user_id)
+    async def get_user_xp(self, guild_id: int, user_id: int):
+        """Get XP for a user in a guild, including buffered awards."""
+        return await self.xp_buffer.get_user_xp(guild_id, user_id)
     
-    def add_xp(self, guild_id: int, user_id: int, amount: int):
-        """Add XP to a user."""
-        return db.add_xp(guild_id, user_id, amount)
+    async def add_xp(self, guild_id: int, user_id: int, amount: int):
+        """Add XP to a user (buffered, flushed in batches)."""
+        return await self.xp_buffer.add_xp(guild_id, user_id, amount)
     
-    def get_role_for_level(self, guild_id: int, level: int):
-        """Get the appropriate role for a level from custom roles."""
-        custom_roles = db.get_custom_roles(guild_id)
-        
-        # Find the highest level role that user qualifies for
-        appropriate_level = None
-        for role_level in sorted([int(l) for l in custom_roles.keys()], reverse=True):
-            if level >= role_level:
-                appropriate_level = role_level
-                break
-        
-        if appropriate_level:
-            return {"level": appropriate_level, "role_id": custom_roles[str(appropriate_level)]}
-        return None
+    async def get_role_for_level(self, guild_id: int, level: int):
+        """Get (level, role_id) of the reward role for a level, or None."""
+        settings = await guild_cache.get(guild_id)
+        return settings.ladder.current_for(level)
     
     @app_commands.command(name="setxpsystem", description="Setup activity XP system.")
     @app_commands.default_permissions(administrator=True)
@@ -163,13 +292,14 @@ class ActivityXP(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Save configuration
-        db.update_guild_config(
+        await storage.update_guild_config(
             interaction.guild.id,
             enabled=True,
             log_channel=channel.id,
             target_role=None,  # Track everyone
             auto_roles=create_roles
         )
+        guild_cache.invalidate(interaction.guild.id)
         
         embed = discord.Embed(
             title="✅ XP System Setup",
@@ -191,10 +321,11 @@ class ActivityXP(commands.Cog):
                         color=discord.Color(role_data["color"]),
                         reason=f"XP reward role - {theme} theme"
                     )
-                    db.add_custom_role(interaction.guild.id, role_data["level"], new_role.id)
+                    await storage.add_custom_role(interaction.guild.id, role_data["level"], new_role.id)
                     created.append(f"Lv.{role_data['level']} → {new_role.mention}")
                 except Exception as e:
                     logger.error(f"Failed to create role: {e}")
+            guild_cache.invalidate(interaction.guild.id)
             
             if created:
                 roles_text = "\n".join(created[:5])
@@ -238,79 +369,75 @@ class ActivityXP(commands.Cog):
             return
         
         guild_id = interaction.guild.id
-        custom_roles = db.get_custom_roles(guild_id)
+        custom_roles = (await self.get_guild_config(guild_id))["custom_roles"]
         
         # Check if this level already has a reward role
         old_role = None
-        is_update = str(level) in custom_roles
+        is_update = level in custom_roles
         if is_update:
-            old_role_id = custom_roles[str(level)]
+            old_role_id = custom_roles[level]
             old_role = interaction.guild.get_role(old_role_id)
         
         # Update role in database
-        db.add_custom_role(guild_id, level, role.id)
+        await storage.add_custom_role(guild_id, level, role.id)
+        guild_cache.invalidate(guild_id)
         
-        # Sync: Update all qualifying users
-        leaderboard_data = db.get_leaderboard(guild_id, limit=10000)
+        # Levels must include buffered awards before members are selected
+        await self.xp_buffer.flush()
         
-        added = 0
-        removed = 0
-        skipped = 0
+        # Sync runs in the background; this response is edited with its progress
+        embed = self.role_sync_embed(level, role, old_role, is_update, None)
+        message = await interaction.followup.send(embed=embed, ephemeral=True, wait=True)
         
-        for user_id, xp, user_level in leaderboard_data:
-            if user_level < level:
-                continue
-            
-            member = interaction.guild.get_member(user_id)
-            if not member:
-                continue
-            
+        async def report(job):
             try:
-                # Remove old role if updating
-                if is_update and old_role and old_role in member.roles:
-                    await member.remove_roles(old_role, reason=f"Reward role updated for Level {level}")
-                    removed += 1
-                
-                # Add new role
-                if role not in member.roles:
-                    await member.add_roles(role, reason=f"Reward role for Level {level}")
-                    added += 1
-                else:
-                    skipped += 1
-            except Exception as e:
-                logger.error(f"Failed to update role for {member.name}: {e}")
+                await message.edit(embed=self.role_sync_embed(level, role, old_role, is_update, job))
+            except Exception:
+                pass  # Interaction token expired (15 minutes); the job keeps going
         
-        # Create response embed
+        await role_sync.start(interaction.guild, level, role, old_role, progress=report)
+        if is_update:
+            logger.info(f"{interaction.user} updated reward role: Level {level} → {role.name}, syncing in background")
+        else:
+            logger.info(f"{interaction.user} set reward role: Level {level} → {role.name}, syncing in background")
+    
+    def role_sync_embed(self, level, role, old_role, is_update, job):
+        """Result embed for /setrewardrole, showing sync progress while the job runs."""
         if is_update:
             embed = discord.Embed(
                 title="✅ Reward Role Updated",
                 description=f"Level **{level}**\n{old_role.mention if old_role else 'Old role'} → {role.mention}",
                 color=discord.Color.green()
             )
-            embed.add_field(name="Added", value=str(added), inline=True)
-            embed.add_field(name="Removed Old", value=str(removed), inline=True)
-            if skipped > 0:
-                embed.add_field(name="Already Had", value=str(skipped), inline=True)
-            logger.info(f"{interaction.user} updated reward role: Level {level} → {role.name}, added={added}, removed={removed}")
         else:
             embed = discord.Embed(
                 title="✅ Reward Role Set",
                 description=f"Level **{level}** → {role.mention}",
                 color=discord.Color.green()
             )
-            embed.add_field(name="Synced", value=f"{added} users got the role", inline=True)
-            if skipped > 0:
-                embed.add_field(name="Already Had", value=str(skipped), inline=True)
-            logger.info(f"{interaction.user} set reward role: Level {level} → {role.name}, synced to {added} users")
         
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        if job is None or not job.finished:
+            progress = f"{job.done:,}/{job.total:,} members checked" if job and job.total else "Starting…"
+            embed.add_field(name="⏳ Syncing roles", value=progress, inline=False)
+            return embed
+        
+        if is_update:
+            embed.add_field(name="Added", value=str(job.added), inline=True)
+            embed.add_field(name="Removed Old", value=str(job.removed), inline=True)
+        else:
+            embed.add_field(name="Synced", value=f"{job.added} users got the role", inline=True)
+        if job.skipped > 0:
+            embed.add_field(name="Already Had", value=str(job.skipped), inline=True)
+        if job.failed > 0:
+            embed.add_field(name="Failed", value=str(job.failed), inline=True)
+        return embed
     
 
     @app_commands.command(name="xp", description="Check your XP and level.")
     @app_commands.describe(member="Member to check (optional)")
     async def xp(self, interaction: discord.Interaction, member: discord.Member = None):
         # Check if XP system is configured
-        config = self.get_guild_config(interaction.guild.id)
+        config = await self.get_guild_config(interaction.guild.id)
         if not config.get("enabled"):
             await interaction.response.send_message(
                 "❌ Activity XP system is not configured in this server.\n"
@@ -330,19 +457,11 @@ class ActivityXP(commands.Cog):
             return
         
         target = member or interaction.user
-        data = self.get_user_xp(interaction.guild.id, target.id)
+        data = await self.get_user_xp(interaction.guild.id, target.id)
         
-        # Get custom roles for this server
-        custom_roles = db.get_custom_roles(interaction.guild.id)
-        
-        current_role_info = self.get_role_for_level(interaction.guild.id, data["level"])
-        next_role_info = None
-        
-        # Find next role
-        for level in sorted([int(l) for l in custom_roles.keys()]):
-            if level > data["level"]:
-                next_role_info = {"level": level, "role_id": custom_roles[str(level)]}
-                break
+        # Get reward roles for this server
+        settings = await guild_cache.get(interaction.guild.id)
+        current_role_info = settings.ladder.current_for(data["level"])
         
         # Clean, minimal XP card
         embed = discord.Embed(
@@ -358,7 +477,7 @@ class ActivityXP(commands.Cog):
         
         # Roles if available
         if current_role_info:
-            role = interaction.guild.get_role(current_role_info["role_id"])
+            role = interaction.guild.get_role(current_role_info[1])
             if role:
                 embed.add_field(name="Role", value=role.mention, inline=False)
         
@@ -368,7 +487,7 @@ class ActivityXP(commands.Cog):
     async def rewardslist(self, interaction: discord.Interaction):
         """Show all reward roles configured for this server."""
         # Check if XP system is configured
-        config = self.get_guild_config(interaction.guild.id)
+        config = await self.get_guild_config(interaction.guild.id)
         if not config.get("enabled"):
             await interaction.response.send_message(
                 "❌ Activity XP system is not configured in this server.\n"
@@ -378,9 +497,9 @@ class ActivityXP(commands.Cog):
             return
         
         guild_id = interaction.guild.id
-        custom_roles = db.get_custom_roles(guild_id)
+        ladder = (await guild_cache.get(guild_id)).ladder
         
-        if not custom_roles:
+        if not ladder:
             embed = discord.Embed(
                 title="Reward Roles",
                 description="No reward roles configured yet.\n\nAdmins can add roles using `/setrewardrole`",
@@ -389,9 +508,6 @@ class ActivityXP(commands.Cog):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
         
-        # Sort roles by level
-        sorted_roles = sorted(custom_roles.items(), key=lambda x: int(x[0]))
-        
         # Create embed
         embed = discord.Embed(
             title="🎁 Reward Roles",
@@ -401,8 +517,7 @@ class ActivityXP(commands.Cog):
         
         # Add roles to embed
         roles_text = ""
-        for level_str, role_id in sorted_roles:
-            level = int(level_str)
+        for level, role_id in ladder:
             role = interaction.guild.get_role(role_id)
             
             if role:
@@ -415,17 +530,12 @@ class ActivityXP(commands.Cog):
         embed.description = roles_text
         
         # Add user's progress
-        user_data = self.get_user_xp(guild_id, interaction.user.id)
+        user_data = await self.get_user_xp(guild_id, interaction.user.id)
         current_level = user_data["level"]
         current_xp = user_data["xp"]
         
         # Find next reward
-        next_reward = None
-        for level_str, role_id in sorted_roles:
-            level = int(level_str)
-            if level > current_level:
-                next_reward = (level, role_id)
-                break
+        next_reward = ladder.next_after(current_level)
         
         if next_reward:
             next_level, next_role_id = next_reward
@@ -447,7 +557,7 @@ class ActivityXP(commands.Cog):
                 inline=False
             )
         
-        embed.set_footer(text=f"Total Rewards: {len(sorted_roles)}")
+        embed.set_footer(text=f"Total Rewards: {len(ladder)}")
         
         await interaction.response.send_message(embed=embed)
     
@@ -455,7 +565,7 @@ class ActivityXP(commands.Cog):
     @app_commands.describe(page="Page number (default: 1)")
     async def leaderboard(self, interaction: discord.Interaction, page: int = 1):
         # Check if XP system is configured
-        config = self.get_guild_config(interaction.guild.id)
+        config = await self.get_guild_config(interaction.guild.id)
         if not config.get("enabled"):
             await interaction.response.send_message(
                 "❌ Activity XP system is not configured in this server.\n"
@@ -476,29 +586,22 @@ class ActivityXP(commands.Cog):
         
         guild_id = interaction.guild.id
         
-        # Get all users in this guild from database
-        leaderboard_data = db.get_leaderboard(guild_id, limit=1000)
-        guild_users = []
-        for user_id, xp, level in leaderboard_data:
-            member = interaction.guild.get_member(user_id)
-            if member:
-                guild_users.append((member, xp, level))
-        
-        if not guild_users:
+        # Pagination
+        per_page = 10
+        total_users = await leaderboard_index.get_total_users(guild_id)
+        if not total_users:
             await interaction.response.send_message("❌ No users with XP yet!", ephemeral=True)
             return
         
-        # Sort by XP
-        guild_users.sort(key=lambda x: x[1], reverse=True)
-        
-        # Pagination
-        per_page = 10
-        total_pages = (len(guild_users) + per_page - 1) // per_page
+        total_pages = (total_users + per_page - 1) // per_page
         page = max(1, min(page, total_pages))
         
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        page_users = guild_users[start_idx:end_idx]
+        # Only this page's rows are fetched; SQL already returns them sorted
+        page_rows = await leaderboard_index.get_leaderboard_page(guild_id, (page - 1) * per_page, per_page)
+        
+        # Find user's rank
+        standing = await leaderboard_index.get_rank_and_neighbors(guild_id, interaction.user.id, radius=0)
+        user_rank = standing["rank"] if standing else None
         
         # Clean leaderboard
         embed = discord.Embed(
@@ -506,18 +609,11 @@ class ActivityXP(commands.Cog):
             color=0xFEE75C
         )
         
-        # Find user's rank
-        user_rank = None
-        for i, (member, _, _) in enumerate(guild_users, 1):
-            if member.id == interaction.user.id:
-                user_rank = i
-                break
-        
         # Get custom roles for role display
-        custom_roles = db.get_custom_roles(guild_id)
+        settings = await guild_cache.get(guild_id)
         
         leaderboard_text = ""
-        for i, (member, xp, level) in enumerate(page_users, start_idx + 1):
+        for i, user_id, xp, level in page_rows:
             # Medal for top 3
             if i == 1:
                 medal = "🥇"
@@ -529,23 +625,26 @@ class ActivityXP(commands.Cog):
                 medal = f"`{i:02d}`"
             
             # Get user's reward role
-            role_info = self.get_role_for_level(guild_id, level)
+            role_info = settings.ladder.current_for(level)
             role_display = ""
             if role_info:
-                role = interaction.guild.get_role(role_info["role_id"])
+                role = interaction.guild.get_role(role_info[1])
                 if role:
                     role_display = f" • {role.mention}"
             
+            member = interaction.guild.get_member(user_id)
+            name = member.display_name if member else f"<@{user_id}>"
+            
             # Highlight current user
-            if member.id == interaction.user.id:
-                leaderboard_text += f"{medal} **{member.display_name}** • Lv.{level} • {xp:,} XP{role_display}\n"
+            if user_id == interaction.user.id:
+                leaderboard_text += f"{medal} **{name}** • Lv.{level} • {xp:,} XP{role_display}\n"
             else:
-                leaderboard_text += f"{medal} {member.display_name} • Lv.{level} • {xp:,} XP{role_display}\n"
+                leaderboard_text += f"{medal} {name} • Lv.{level} • {xp:,} XP{role_display}\n"
         
         embed.description = leaderboard_text
         
         # Footer with user's rank and pagination
-        footer_text = f"Page {page}/{total_pages} • {len(guild_users)} total members"
+        footer_text = f"Page {page}/{total_pages} • {total_users} total members"
         if user_rank:
             footer_text += f" • Your rank: #{user_rank}"
         embed.set_footer(text=footer_text)
@@ -556,7 +655,7 @@ class ActivityXP(commands.Cog):
     @app_commands.describe(member="Member to check (optional)")
     async def rank(self, interaction: discord.Interaction, member: discord.Member = None):
         # Check if XP system is configured
-        config = self.get_guild_config(interaction.guild.id)
+        config = await self.get_guild_config(interaction.guild.id)
         if not config.get("enabled"):
             await interaction.response.send_message(
                 "❌ Activity XP system is not configured in this server.\n"
@@ -579,34 +678,16 @@ class ActivityXP(commands.Cog):
         guild_id = interaction.guild.id
         
         # Get user data
-        data = self.get_user_xp(guild_id, target.id)
-        
-        # Get all users for ranking from database
-        leaderboard_data = db.get_leaderboard(guild_id, limit=1000)
-        guild_users = []
-        for user_id, xp, _ in leaderboard_data:
-            guild_member = interaction.guild.get_member(user_id)
-            if guild_member:
-                guild_users.append((guild_member, xp))
-        
-        # Sort and find rank
-        guild_users.sort(key=lambda x: x[1], reverse=True)
-        rank = None
-        for i, (m, _) in enumerate(guild_users, 1):
-            if m.id == target.id:
-                rank = i
-                break
+        data = await self.get_user_xp(guild_id, target.id)
         
-        # Get role info
-        custom_roles = db.get_custom_roles(guild_id)
-        current_role_info = self.get_role_for_level(guild_id, data["level"])
-        next_role_info = None
+        # Rank comes from the in-memory index (or an indexed count), not the whole leaderboard
+        standing = await leaderboard_index.get_rank_and_neighbors(guild_id, target.id, radius=1)
+        rank = standing["rank"] if standing else None
         
-        # Find next role
-        for level in sorted([int(l) for l in custom_roles.keys()]):
-            if level > data["level"]:
-                next_role_info = {"level": level, "role_id": custom_roles[str(level)]}
-                break
+        # Get role info
+        settings = await guild_cache.get(guild_id)
+        current_role_info = settings.ladder.current_for(data["level"])
+        next_role_info = settings.ladder.next_after(data["level"])
         
         # Calculate progress to next level
         current_level_xp = data["level"] * 100
@@ -625,7 +706,7 @@ class ActivityXP(commands.Cog):
         
         embed = discord.Embed(
             title=f"{rank_emoji} {target.display_name}",
-            description=f"Rank **#{rank}** • Level **{data['level']}** • {data['xp']:,} XP",
+            description=f"Rank **#{rank or '-'}** • Level **{data['level']}** • {data['xp']:,} XP",
             color=0x5865F2
         )
         embed.set_thumbnail(url=target.display_avatar.url)
@@ -639,7 +720,7 @@ class ActivityXP(commands.Cog):
         
         # Show current reward role if user has one
         if current_role_info:
-            role = interaction.guild.get_role(current_role_info["role_id"])
+            role = interaction.guild.get_role(current_role_info[1])
             if role:
                 embed.add_field(
                     name="Reward Role",
@@ -649,14 +730,27 @@ class ActivityXP(commands.Cog):
         
         # Show next reward role if available
         if next_role_info:
-            next_role = interaction.guild.get_role(next_role_info["role_id"])
+            next_role_level, next_role_id = next_role_info
+            next_role = interaction.guild.get_role(next_role_id)
             if next_role:
                 embed.add_field(
                     name="Next Role",
-                    value=f"{next_role.mention} • Lv.{next_role_info['level']}",
+                    value=f"{next_role.mention} • Lv.{next_role_level}",
                     inline=True
                 )
         
+        # Members directly above and below on the leaderboard
+        if standing and len(standing["neighbors"]) > 1:
+            nearby_text = ""
+            for i, user_id, xp, _ in standing["neighbors"]:
+                neighbor = interaction.guild.get_member(user_id)
+                name = neighbor.display_name if neighbor else f"<@{user_id}>"
+                if user_id == target.id:
+                    nearby_text += f"`#{i}` **{name}** • {xp:,} XP\n"
+                else:
+                    nearby_text += f"`#{i}` {name} • {xp:,} XP\n"
+            embed.add_field(name="Nearby", value=nearby_text, inline=False)
+        
         embed.set_footer(text=f"Keep being active to earn more XP!")
         
         await interaction.response.send_message(embed=embed)
@@ -672,7 +766,7 @@ class ActivityXP(commands.Cog):
     ])
     async def top(self, interaction: discord.Interaction, category: str):
         # Check if XP system is configured
-        config = self.get_guild_config(interaction.guild.id)
+        config = await self.get_guild_config(interaction.guild.id)
         if not config.get("enabled"):
             await interaction.response.send_message(
                 "❌ Activity XP system is not configured in this server.\n"
@@ -695,7 +789,7 @@ class ActivityXP(commands.Cog):
         
         if category == "streak":
             # Get users with active streaks from database
-            streak_data = db.get_top_streaks(guild_id, limit=100)
+            streak_data = await storage.get_top_streaks(guild_id, limit=100)
             streak_users = []
             for user_id, activity_name, streak_count in streak_data:
                 # Filter out custom status entries
@@ -729,39 +823,25 @@ class ActivityXP(commands.Cog):
             embed.description = streak_text
         
         else:
-            # Get all users from database
-            leaderboard_data = db.get_leaderboard(guild_id, limit=1000)
-            guild_users = []
-            for user_id, xp, level in leaderboard_data:
-                member = interaction.guild.get_member(user_id)
-                if member:
-                    guild_users.append((member, xp, level))
+            # Level is derived from XP, so both categories share the XP ordering
+            top_rows = await leaderboard_index.get_leaderboard_page(guild_id, 0, 10)
             
-            if not guild_users:
+            if not top_rows:
                 await interaction.response.send_message("❌ No users with XP yet!", ephemeral=True)
                 return
             
-            # Sort by category
-            if category == "xp":
-                guild_users.sort(key=lambda x: x[1], reverse=True)
-                title = "Top XP"
-            else:  # level
-                guild_users.sort(key=lambda x: x[2], reverse=True)
-                title = "Top Levels"
-            
+            title = "Top XP" if category == "xp" else "Top Levels"
             embed = discord.Embed(
                 title=title,
                 color=0xFEE75C
             )
             
             top_text = ""
-            for i, (member, xp, level) in enumerate(guild_users[:10], 1):
+            for i, user_id, xp, level in top_rows:
                 medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"`{i:02d}`"
-                
-                if category == "xp":
-                    top_text += f"{medal} **{member.display_name}** • Lv.{level} • {xp:,} XP\n"
-                else:
-                    top_text += f"{medal} **{member.display_name}** • Lv.{level} • {xp:,} XP\n"
+                member = interaction.guild.get_member(user_id)
+                name = member.display_name if member else f"<@{user_id}>"
+                top_text += f"{medal} **{name}** • Lv.{level} • {xp:,} XP\n"
             
             embed.description = top_text
         
@@ -770,30 +850,67 @@ class ActivityXP(commands.Cog):
     @commands.Cog.listener()
     async def on_presence_update(self, before, after):
         """Monitor user activity changes."""
-        # Debug logging
-        logger.info(f"Presence update detected for {after.name}")
-        
-        if after.bot:
-            logger.info(f"Skipping bot: {after.name}")
+        fingerprint = activity_fingerprint(after.activities)
+        skipped = self.prefilter_presence(before, after, fingerprint)
+        if skipped:
+            # The only metric on this path; events seen is derived from it
+            skipped.value += 1
             return
         
+        # Counted where processing ends, so every update bumps exactly one counter
+        if after.id % PRESENCE_TIMING_SAMPLE:
+            await self.process_presence_update(before, after, fingerprint)
+        else:
+            await self.process_presence_update(before, after, fingerprint, time.perf_counter_ns())
+    
+    def prefilter_presence(self, before, after, fingerprint):
+        """
+        Counter of the reason to drop an update that cannot change tracked
+        state (the caller bumps it), or None to process it. Uses only in-memory state, so no-op updates (status flips, Spotify
+        track changes) never reach the database or the logging system.
+        """
+        if after.bot:
+            return SKIP_BOT
+        if not guild_cache.may_be_enabled(after.guild.id):
+            return SKIP_GUILD_DISABLED
+        
+        if fingerprint != activity_fingerprint(before.activities):
+            return None
+        
+        state = presence_sessions.get(after.guild.id, after.id)
+        if not fingerprint:
+            # Nothing tracked before or after; only a stale "current" needs clearing
+            return None if state and state.current else SKIP_UNCHANGED
+        if state is None or state.fingerprint != fingerprint:
+            return None  # Not processed with these activities yet
+        
+        # Same activity as last processed: hourly awards are the scheduler's job
+        return SKIP_UNCHANGED
+    
+    async def process_presence_update(self, before, after, fingerprint, started: int = 0):
+        """
+        Classify the member's activity, update their streak and award XP.
+        `started` (perf_counter_ns) marks a sampled update: if it logs a new
+        activity, its stage latencies are recorded. Early returns only count.
+        """
         guild = after.guild
-        config = self.get_guild_config(guild.id)
-        
-        logger.info(f"Config for {guild.name}: enabled={config.get('enabled')}, channel={config.get('log_channel')}")
+        config = await self.get_guild_config(guild.id)
         
         if not config.get("enabled"):
-            logger.info(f"Activity XP not enabled for {guild.name}")
+            self.presence_log.event("disabled", "Activity XP not enabled for %s", guild.name)
+            FILTERED_DISABLED.value += 1
             return
         
         log_channel_id = config.get("log_channel")
         if not log_channel_id:
-            logger.info(f"No log channel set for {guild.name}")
+            self.presence_log.event("no_log_channel", "No log channel set for %s", guild.name)
+            FILTERED_NO_LOG_CHANNEL.value += 1
             return
         
         log_channel = guild.get_channel(log_channel_id)
         if not log_channel:
-            logger.info(f"Log channel {log_channel_id} not found in {guild.name}")
+            self.presence_log.event("log_channel_missing", "Log channel %s not found in %s", log_channel_id, guild.name)
+            FILTERED_LOG_CHANNEL_MISSING.value += 1
             return
         
         # Check if user has target role (if specified)
@@ -801,158 +918,135 @@ class ActivityXP(commands.Cog):
         if target_role_id:
             target_role = guild.get_role(target_role_id)
             if target_role and target_role not in after.roles:
-                logger.info(f"{after.name} doesn't have target role")
+                self.presence_log.event("target_role", "%s doesn't have target role", after.name)
+                FILTERED_TARGET_ROLE.value += 1
                 return
         
-        logger.info(f"{after.name} has {len(after.activities)} activities")
-        
-        # Detect ANY activity automatically
-        user_key = f"{guild.id}_{after.id}"
-        activity_detected = None
-        xp_range = None
-        activity_name = None
-        activity_type_key = None
-        
-        # Check all activities and pick the highest priority one
-        # Priority: Streaming > Listening (Spotify) > Playing/Competing > Watching > Custom
-        selected_activity = None
-        priority = 999
-        
-        for activity in after.activities:
-            logger.info(f"Activity type: {type(activity).__name__}, Activity: {activity}")
-            
-            current_priority = 999
-            
-            # Spotify (Listening)
-            if isinstance(activity, discord.Spotify):
-                current_priority = 2
-                if current_priority < priority:
-                    priority = current_priority
-                    selected_activity = activity
-                    activity_type_key = "listening"
-                    # Use generic "Spotify" instead of song name to avoid logging every song change
-                    activity_name = "Spotify"
-                    activity_detected = f"🎵 listening to **{activity.title}** by {activity.artist}"
-            
-            # Streaming
-            elif isinstance(activity, discord.Streaming):
-                current_priority = 1
-                if current_priority < priority:
-                    priority = current_priority
-                    selected_activity = activity
-                    activity_type_key = "streaming"
-                    activity_name = f"Streaming: {activity.name}"
-                    activity_detected = f"📺 streaming **{activity.name}**"
-            
-            # Skip Custom Activity - don't track custom status
-            elif isinstance(activity, discord.CustomActivity):
-                continue  # Ignore custom status
-            
-            # All other activities (Games, Apps, etc.)
-            elif isinstance(activity, (discord.Activity, discord.Game)):
-                # Determine activity type from Discord's ActivityType
-                if hasattr(activity, 'type'):
-                    if activity.type == discord.ActivityType.playing:
-                        current_priority = 3
-                        activity_type_key = "playing"
-                        emoji = "🎮"
-                        verb = "playing"
-                    elif activity.type == discord.ActivityType.watching:
-                        current_priority = 5
-                        activity_type_key = "watching"
-                        emoji = "📺"
-                        verb = "watching"
-                    elif activity.type == discord.ActivityType.listening:
-                        current_priority = 2
-                        activity_type_key = "listening"
-                        emoji = "🎵"
-                        verb = "listening to"
-                    elif activity.type == discord.ActivityType.competing:
-                        current_priority = 4
-                        activity_type_key = "competing"
-                        emoji = "🏆"
-                        verb = "competing in"
-                    else:
-                        current_priority = 7
-                        activity_type_key = "unknown"
-                        emoji = "✨"
-                        verb = "doing"
-                else:
-                    # Default to playing for Game type
-                    current_priority = 3
-                    activity_type_key = "playing"
-                    emoji = "🎮"
-                    verb = "playing"
-                
-                if current_priority < priority:
-                    priority = current_priority
-                    selected_activity = activity
-                    activity_name = f"{activity_type_key.title()}: {activity.name}"
-                    activity_detected = f"{emoji} {verb} **{activity.name}**"
-        
-        # Get XP range for the activity type
-        if activity_type_key:
-            xp_range = ACTIVITY_XP_RANGES.get(activity_type_key, ACTIVITY_XP_RANGES["unknown"])
-        
-        logger.info(f"Activity detected: {activity_detected}, XP range: {xp_range}")
+        # Detect ANY activity automatically (classified once per change, shared across guilds)
+        classification = classification_cache.classify(after.id, after.activities, fingerprint)
         
         # If no activity detected, user might have stopped activity
-        if not activity_detected or not xp_range:
-            # Check if user had activity before and now stopped
-            if self.last_activity[user_key].get("current"):
-                logger.info(f"{after.name} stopped activity: {self.last_activity[user_key].get('current')}")
-                self.last_activity[user_key]["current"] = None
+        if not classification:
+            # Nothing left to track: the member's state is dropped, not kept around
+            state = self.end_session(guild.id, after.id)
+            if state and state.current:
+                self.presence_log.event("stopped", "%s stopped activity: %s", after.name, state.current)
+            else:
+                self.presence_log.event("no_activity", "%s has no tracked activity", after.name)
+            FILTERED_NO_ACTIVITY.value += 1
             return
         
+        activity_name = classification.name
+        activity_detected = classification.description
+        
         # Check if this is a NEW activity or continuation
-        last_logged_activity = self.last_activity[user_key].get("current")
-        is_new_activity = (last_logged_activity != activity_name)
+        state = presence_sessions.ensure(guild.id, after.id)
+        state.fingerprint = fingerprint
+        is_new_activity = (state.current != activity_name)
         
         # Update last activity
-        self.last_activity[user_key]["current"] = activity_name
+        state.current = activity_name
+        
+        # For SAME activity, awards come from the scheduler; just make sure a session exists
+        if not is_new_activity:
+            if award_scheduler.get(guild.id, after.id) is None:
+                award_scheduler.start(guild.id, after.id, classification)
+            self.presence_log.event("continuing", "%s continuing %s", after.name, activity_name)
+            FILTERED_CONTINUING.value += 1
+            return
         
-        # Check for streak from database
-        streak_data = db.get_streak(guild.id, after.id)
+        NEW_ACTIVITY.value += 1
+        if started:
+            clock = metrics.StageClock(started)
+            clock.lap(STAGE_LOOKUP)
         
-        # Check cooldown for XP (1 hour)
-        user_data = db.get_user_xp(guild.id, after.id)
-        can_earn_xp = True
+        # For NEW activity, log immediately (no XP) and start the hourly award clock
+        award_scheduler.start(guild.id, after.id, classification)
         
-        if user_data.get("last_xp_time"):
-            try:
-                last_time = datetime.fromisoformat(user_data["last_xp_time"])
-                time_since_last = datetime.now() - last_time
-                if time_since_last < timedelta(hours=1):
-                    can_earn_xp = False
-            except:
-                pass
-        
-        # For NEW activity, always log immediately (no XP)
-        if is_new_activity:
-            # Fixed-width embed with consistent formatting
-            embed = discord.Embed(
-                description=f"{after.mention} {activity_detected}\n\n"
-                           f"XP awarded after 1 hour of activity",
-                color=0x5865F2
-            )
-            
-            try:
-                await log_channel.send(embed=embed)
-                logger.info(f"New activity logged for {after.name}: {activity_detected}")
-            except Exception as e:
-                logger.error(f"Failed to send activity log: {e}")
-            
-            # Update streak to 1 (new activity)
-            db.update_streak(guild.id, after.id, activity_name, 1)
+        # Fixed-width embed with consistent formatting
+        embed = discord.Embed(
+            description=f"{after.mention} {activity_detected}\n\n"
+                       f"XP awarded after 1 hour of activity",
+            color=0x5865F2
+        )
+        # Queued for the next digest; a newer activity before the flush replaces it
+        log_digest.post(
+            log_channel, embed, f"{after.mention} {activity_detected}",
+            key=("activity", after.id), priority=LOW
+        )
+        self.presence_log.event("new_activity", "New activity logged for %s: %s", after.name, activity_detected)
+        if started:
+            clock.lap(STAGE_RENDER)
+        
+        # Update streak to 1 (new activity)
+        await self.xp_buffer.update_streak(guild.id, after.id, activity_name, 1)
+        if started:
+            clock.lap(STAGE_DB_WRITE)
+            clock.total(PRESENCE_TOTAL)
+    
+    def end_session(self, guild_id: int, user_id: int):
+        """Forget a member's presence state and cancel their hourly award."""
+        award_scheduler.stop(guild_id, user_id)
+        return presence_sessions.discard(guild_id, user_id)
+    
+    def forget_guild(self, guild_id: int):
+        """
+        Drop a guild's in-memory state: sessions first, so no award or role
+        sync can queue anything new, then cached config, then unsaved awards.
+        """
+        award_scheduler.stop_guild(guild_id)
+        presence_sessions.discard_guild(guild_id)
+        role_sync.cancel_guild(guild_id)
+        guild_cache.invalidate(guild_id)
+        leaderboard_index.invalidate(guild_id)
+        self.xp_buffer.discard_guild(guild_id)
+    
+    async def reset_guild(self, guild_id: int) -> dict:
+        """
+        Delete a guild's XP, streaks, reward roles and config (set-based, one
+        transaction). Returns rows deleted per table. In-memory state is
+        dropped before the purge, so an award tick during it finds no session
+        and a later flush can't bring purged rows back. It is dropped again
+        afterwards, for presence updates that read the old config meanwhile.
+        """
+        self.forget_guild(guild_id)
+        deleted = await storage.purge_guild(guild_id)
+        self.forget_guild(guild_id)
+        return deleted
+    
+    async def award_session(self, guild_id: int, user_id: int, session):
+        """Award one hour of activity XP for a session the scheduler popped."""
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(user_id) if guild else None
+        if not member:
+            self.end_session(guild_id, user_id)
+            return
+        
+        # Config may have changed since the session started
+        config = await self.get_guild_config(guild_id)
+        log_channel = guild.get_channel(config.get("log_channel") or 0)
+        target_role = guild.get_role(config.get("target_role") or 0)
+        if not config.get("enabled") or not log_channel or (target_role and target_role not in member.roles):
+            self.end_session(guild_id, user_id)
+            metrics.PRESENCE_FILTERED.inc("session_ended")
             return
         
-        # For SAME activity, check if we can award XP (1 hour passed)
-        if not can_earn_xp:
-            logger.info(f"{after.name} continuing same activity, on cooldown")
+        # Missed a presence update somewhere: don't pay for an activity that ended
+        current = classification_cache.classify(member.id, member.activities)
+        if not current or current.name != session.activity.name:
+            self.end_session(guild_id, user_id)
+            metrics.PRESENCE_FILTERED.inc("session_ended")
             return
         
+        # Still active: keep the member's presence state from expiring
+        presence_sessions.get(guild_id, user_id)
+        
+        activity_name = session.activity.name
+        activity_detected = current.description
+        xp_range = session.activity.xp_range
+        
         # Award XP with streak bonus (2x per hour)
-        streak_hours = streak_data["count"] + 1
+        streak_hours = session.streak
         streak_multiplier = 1.0 + (1.0 * (streak_hours - 1))  # 2x per hour: 1x, 2x, 3x, 4x...
         
         # Generate random XP from range
@@ -960,100 +1054,72 @@ class ActivityXP(commands.Cog):
         final_xp = int(base_xp * streak_multiplier)
         
         # Update streak
-        db.update_streak(guild.id, after.id, activity_name, streak_hours)
+        await self.xp_buffer.update_streak(guild_id, user_id, activity_name, streak_hours)
         
         # Add XP
-        leveled_up, new_level = self.add_xp(guild.id, after.id, final_xp)
+        leveled_up, new_level = await self.add_xp(guild_id, user_id, final_xp)
         
         # Send log message with XP - Fixed width format
-        user_data = self.get_user_xp(guild.id, after.id)
+        user_data = await self.get_user_xp(guild_id, user_id)
+        metrics.PRESENCE_AWARDED.inc()
+        metrics.PRESENCE_XP.inc(amount=final_xp)
         
         if streak_hours > 1:
             # Streak message with fixed width
             embed = discord.Embed(
-                description=f"{after.mention} • **{streak_hours}h streak**\n\n"
+                description=f"{member.mention} • **{streak_hours}h streak**\n\n"
                            f"`XP:` +{final_xp} • `Total:` {user_data['xp']} • `Level:` {user_data['level']}\n"
                            f"🔥 {streak_multiplier:.0f}x multiplier",
                 color=0xFEE75C
             )
+            line = f"🔥 {member.mention} • **{streak_hours}h streak** • +{final_xp} XP ({streak_multiplier:.0f}x)"
         else:
             # First hour with fixed width
             embed = discord.Embed(
-                description=f"{after.mention} {activity_detected}\n\n"
+                description=f"{member.mention} {activity_detected}\n\n"
                            f"`XP:` +{final_xp} • `Total:` {user_data['xp']} • `Level:` {user_data['level']}",
                 color=0x57F287
             )
+            line = f"{member.mention} {activity_detected} • +{final_xp} XP"
         
-        try:
-            await log_channel.send(embed=embed)
-            logger.info(f"Activity logged: {after.name} - {activity_detected} - {final_xp} XP")
-        except Exception as e:
-            logger.error(f"Failed to send activity log: {e}")
+        log_digest.post(log_channel, embed, line)
+        self.presence_log.event("awarded", "Activity logged: %s - %s - %d XP", member.name, activity_detected, final_xp)
         
         # Handle level up
         if leveled_up:
-            await self.handle_level_up(after, new_level, log_channel)
+            await self.handle_level_up(member, new_level, log_channel)
+
     
-    async def assign_role_for_level(self, member, level, custom_roles, silent=False):
+    async def assign_role_for_level(self, member, level, ladder, silent=False):
         """Assign appropriate role for a user's level."""
-        # Find the highest role the user qualifies for
-        qualified_role_level = None
-        for role_level in sorted([int(l) for l in custom_roles.keys()], reverse=True):
-            if level >= role_level:
-                qualified_role_level = role_level
-                break
-        
-        if not qualified_role_level:
-            return False
-        
-        role_id = custom_roles[str(qualified_role_level)]
-        role = member.guild.get_role(role_id)
-        
-        if not role:
-            return False
-        
-        # Check if user already has this role
-        if role in member.roles:
-            return False
-        
         try:
-            # Remove all lower level roles
-            for level_str, old_role_id in custom_roles.items():
-                if int(level_str) != qualified_role_level:
-                    old_role = member.guild.get_role(old_role_id)
-                    if old_role and old_role in member.roles:
-                        await member.remove_roles(old_role)
-            
-            # Add the appropriate role
-            await member.add_roles(role)
-            logger.info(f"Assigned {role.name} to {member.name} (Level {level})")
-            return True
+            # Highest qualifying role in, every other reward role out, in one request
+            plan = await reconcile_member_roles(member, level, ladder, reason=f"Reward role for Level {level}")
         except Exception as e:
             logger.error(f"Failed to assign role to {member.name}: {e}")
             return False
+        
+        if plan is None or plan.added is None:
+            return False
+        logger.info(f"Assigned {plan.added.name} to {member.name} (Level {level})")
+        return True
     
     async def handle_level_up(self, member, new_level, log_channel):
         """Handle level up and role assignment."""
-        guild_id = member.guild.id
-        custom_roles = db.get_custom_roles(guild_id)
+        ladder = (await guild_cache.get(member.guild.id)).ladder
         
-        if not custom_roles:
+        if not ladder:
             return
         
         # Assign appropriate role
-        role_assigned = await self.assign_role_for_level(member, new_level, custom_roles)
+        role_assigned = await self.assign_role_for_level(member, new_level, ladder)
         
         if role_assigned:
             # Find which role was assigned
-            qualified_role_level = None
-            for role_level in sorted([int(l) for l in custom_roles.keys()], reverse=True):
-                if new_level >= role_level:
-                    qualified_role_level = role_level
-                    break
+            role_info = ladder.current_for(new_level)
             
-            if qualified_role_level:
-                role_id = custom_roles[str(qualified_role_level)]
-                role = member.guild.get_role(role_id)
+            if role_info:
+                role = member.guild.get_role(role_info[1])
                 
                 if role:
                     # Send level up message
@@ -1065,23 +1131,138 @@ class ActivityXP(commands.Cog):
                     embed.add_field(name="New Role", value=role.mention, inline=True)
                     embed.set_thumbnail(url=member.display_avatar.url)
                     
-                    try:
-                        await log_channel.send(embed=embed)
-                    except:
-                        pass
+                    log_digest.post(
+                        log_channel, embed, f"🎉 {member.mention} reached **Level {new_level}** • {role.mention}",
+                        key=("level_up", member.id), priority=HIGH
+                    )
 
-    @app_commands.command(name="backupxp", description="Backup XP database to JSON (admin only).")
+    @app_commands.command(name="backupxp", description="Backup this server's XP data (admin only).")
     @app_commands.default_permissions(administrator=True)
     async def backupxp(self, interaction: discord.Interaction):
-        """Backup XP database to JSON file."""
+        """Stream this guild's XP data to a compressed NDJSON export."""
         await interaction.response.defer(ephemeral=True)
         
+        if not is_sqlite(storage):
+            await interaction.followup.send("❌ Backups are only available with the SQLite backend", ephemeral=True)
+            return
+        
         try:
-            filename = db.backup_to_json(f"xp_backup_{interaction.guild.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-            await interaction.followup.send(f"✅ Database backed up to `{filename}`", ephemeral=True)
+            # Make sure buffered awards are included
+            await self.xp_buffer.flush()
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            filename = os.path.join(
+                BACKUP_DIR,
+                f"xp_backup_{interaction.guild.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz"
+            )
+            stats = await storage.export_ndjson(filename, guild_id=interaction.guild.id, compress=True)
+            await interaction.followup.send(
+                f"✅ Backed up {stats['rows']:,} rows to `{os.path.basename(filename)}`\n"
+                f"{stats['bytes'] / 1024:,.1f} KiB in {stats['seconds']:.2f}s "
+                f"({stats['rows_per_sec']:,.0f} rows/s)",
+                ephemeral=True
+            )
+            logger.info(f"{interaction.user} backed up XP data for {interaction.guild.name}: {stats}")
         except Exception as e:
             await interaction.followup.send(f"❌ Backup failed: {str(e)}", ephemeral=True)
     
+    @app_commands.command(name="importxp", description="Restore this server's XP data from a /backupxp file (admin only).")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.describe(filename="Backup file name shown by /backupxp")
+    async def importxp(self, interaction: discord.Interaction, filename: str):
+        """Bulk-load a guild export; only this guild's rows are imported."""
+        await interaction.response.defer(ephemeral=True)
+        
+        if not is_sqlite(storage):
+            await interaction.followup.send("❌ Backups are only available with the SQLite backend", ephemeral=True)
+            return
+        
+        guild_id = interaction.guild.id
+        path = os.path.join(BACKUP_DIR, os.path.basename(filename))
+        if not os.path.isfile(path):
+            await interaction.followup.send(f"❌ Backup `{os.path.basename(filename)}` not found", ephemeral=True)
+            return
+        
+        try:
+            self.xp_buffer.discard_guild(guild_id)
+            stats = await storage.import_ndjson(path, guild_id=guild_id)
+            guild_cache.invalidate(guild_id)
+            leaderboard_index.invalidate(guild_id)
+            await interaction.followup.send(
+                f"✅ Imported {stats['rows']:,} rows in {stats['seconds']:.2f}s",
+                ephemeral=True
+            )
+            logger.info(f"{interaction.user} imported XP data for {interaction.guild.name}: {stats}")
+        except Exception as e:
+            await interaction.followup.send(f"❌ Import failed: {str(e)}", ephemeral=True)
+    
+    @app_commands.command(name="snapshotxp", description="Take a full database snapshot now (bot owner only).")
+    @app_commands.default_permissions(administrator=True)
+    async def snapshotxp(self, interaction: discord.Interaction):
+        """Hot snapshot of the database, including configs, roles, streaks and timestamps."""
+        await interaction.response.defer(ephemeral=True)
+        
+        # The snapshot covers every guild and rotates out old ones, so a single
+        # server's admin must not be able to push other guilds' restore points out
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.followup.send("❌ Only the bot owner can snapshot the shared database", ephemeral=True)
+            return
+        
+        if not is_sqlite(storage):
+            await interaction.followup.send("❌ Snapshots are only available with the SQLite backend", ephemeral=True)
+            return
+        
+        try:
+            await self.xp_buffer.flush()
+            stats = await create_snapshot(storage)
+            await interaction.followup.send(
+                f"✅ Snapshot `{stats['name']}` saved\n"
+                f"{stats['bytes'] / 1024:,.1f} KiB in {stats['seconds']:.2f}s",
+                ephemeral=True
+            )
+            logger.info(f"{interaction.user} took a database snapshot: {stats}")
+        except Exception as e:
+            await interaction.followup.send(f"❌ Snapshot failed: {str(e)}", ephemeral=True)
+    
+    @app_commands.command(name="restorexp", description="Restore this server's XP data from a snapshot (admin only).")
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.describe(snapshot="Snapshot name (leave empty to list available snapshots)")
+    async def restorexp(self, interaction: discord.Interaction, snapshot: str = None):
+        """Replace this guild's XP, streaks, config and reward roles with a snapshot's."""
+        await interaction.response.defer(ephemeral=True)
+        
+        if not is_sqlite(storage):
+            await interaction.followup.send("❌ Snapshots are only available with the SQLite backend", ephemeral=True)
+            return
+        
+        if not snapshot:
+            names = list_snapshots()
+            if not names:
+                await interaction.followup.send("❌ No snapshots yet. Use `/snapshotxp` to take one.", ephemeral=True)
+                return
+            listing = "\n".join(f"`{name}`" for name in names)
+            await interaction.followup.send(f"**Available snapshots** (newest first)\n{listing}", ephemeral=True)
+            return
+        
+        guild_id = interaction.guild.id
+        try:
+            self.xp_buffer.discard_guild(guild_id)
+            restored = await restore_guild(storage, snapshot, guild_id)
+            guild_cache.invalidate(guild_id)
+            leaderboard_index.invalidate(guild_id)
+            
+            embed = discord.Embed(
+                title="✅ XP Data Restored",
+                description=f"Restored from `{snapshot}`",
+                color=discord.Color.green()
+            )
+            embed.add_field(name="Users", value=str(restored["user_xp"]), inline=True)
+            embed.add_field(name="Streaks", value=str(restored["activity_streaks"]), inline=True)
+            embed.add_field(name="Reward Roles", value=str(restored["custom_xp_roles"]), inline=True)
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            logger.info(f"{interaction.user} restored {interaction.guild.name} from {snapshot}: {restored}")
+        except Exception as e:
+            await interaction.followup.send(f"❌ Restore failed: {str(e)}", ephemeral=True)
+    
     @app_commands.command(name="resetxpsystem", description="Reset XP system - deletes ALL data!")
     @app_commands.default_permissions(administrator=True)
     async def resetxpsystem(self, interaction: discord.Interaction):
@@ -1136,40 +1317,9 @@ class ActivityXP(commands.Cog):
         try:
             guild_id = interaction.guild.id
             
-            # Get all users with XP
-            leaderboard_data = db.get_leaderboard(guild_id, limit=10000)
-            user_count = len(leaderboard_data)
-            
-            # Get reward roles
-            custom_roles = db.get_custom_roles(guild_id)
-            role_count = len(custom_roles)
-            
-            # Delete all user XP data
-            for user_id, _, _ in leaderboard_data:
-                db.conn.execute(
-                    "DELETE FROM user_xp WHERE guild_id = ? AND user_id = ?",
-                    (guild_id, user_id)
-                )
-            
-            # Delete all streaks
-            db.conn.execute("DELETE FROM streaks WHERE guild_id = ?", (guild_id,))
-            
-            # Delete all custom roles
-            db.conn.execute("DELETE FROM custom_roles WHERE guild_id = ?", (guild_id,))
-            
-            # Disable XP system
-            db.conn.execute(
-                "UPDATE guild_config SET enabled = 0, log_channel = NULL, target_role = NULL, auto_roles = 0 WHERE guild_id = ?",
-                (guild_id,)
-            )
-            
-            db.conn.commit()
-            
-            # Clear in-memory caches
-            if hasattr(self, 'last_activity'):
-                keys_to_remove = [k for k in self.last_activity.keys() if k.startswith(f"{guild_id}_")]
-                for key in keys_to_remove:
-                    del self.last_activity[key]
+            deleted = await self.reset_guild(guild_id)
+            user_count = deleted["user_xp"]
+            role_count = deleted["custom_xp_roles"]
             
             # Success message
             embed = discord.Embed(
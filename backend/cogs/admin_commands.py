@@ -358,8 +358,8 @@ class AdminCommands(commands.Cog):
         is_admin = interaction.user.guild_permissions.administrator
         
         # Check if XP system is configured
-        from database import db
-        config = db.get_guild_config(interaction.guild.id)
+        from guild_cache import guild_cache
+        config = (await guild_cache.get(interaction.guild.id)).config
         xp_enabled = config.get("enabled", False)
         log_channel_id = config.get("log_channel")
         
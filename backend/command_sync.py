@@ -0,0 +1,108 @@
+"""
+Application command sync that skips unchanged command trees.
+bot.tree.sync() hits a global, heavily rate-limited endpoint, and on_ready
+fires again on every gateway reconnect. The payload a sync would send is
+hashed, and the hash of the last successful sync is kept on disk next to
+the database, so the tree is synced at most once per process and only when
+the commands actually changed. Delete the file to force a sync.
+The payloads come from discord.py's command serializers, whose signatures
+changed in 2.4; if they can't be called, every startup syncs instead.
+"""
+
+import os
+import json
+import time
+import inspect
+import hashlib
+import logging
+from typing import Optional
+
+from discord import app_commands
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COMMAND_HASH_FILE = "command_tree.json"
+
+# Set once the tree is known to match Discord for this process
+_in_sync = False
+
+async def command_payload(command, tree: app_commands.CommandTree) -> dict:
+    """
+    The payload sync() sends for one command. discord.py 2.4 added a `tree`
+    argument to to_dict() and get_translated_payload(); both forms work.
+    """
+    if "tree" in inspect.signature(command.to_dict).parameters:
+        if tree.translator:
+            return await command.get_translated_payload(tree, tree.translator)
+        return command.to_dict(tree)
+    if tree.translator:
+        return await command.get_translated_payload(tree.translator)
+    return command.to_dict()
+
+async def command_tree_hash(tree: app_commands.CommandTree) -> str:
+    """SHA-256 of the global command payloads, as sync() would send them."""
+    payloads = [await command_payload(command, tree) for command in tree.get_commands()]
+    # Registration order doesn't matter to Discord
+    payloads.sort(key=lambda p: (p.get("type", 1), p["name"]))
+    blob = json.dumps(
+        {"application_id": tree.client.application_id, "commands": payloads},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def load_sync_state(path: str = COMMAND_HASH_FILE) -> dict:
+    """Last successful sync: {"hash", "commands", "seconds"}; empty if unknown."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_sync_state(state: dict, path: str = COMMAND_HASH_FILE):
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not save command sync state to {path}: {e}")
+
+async def sync_command_tree(tree: app_commands.CommandTree, path: str = COMMAND_HASH_FILE) -> Optional[list]:
+    """
+    Sync global commands unless this process already did, or the saved hash
+    matches the current tree. Returns the synced commands, or None if the
+    sync was skipped. Sync errors propagate and leave the next call free to
+    retry.
+    """
+    global _in_sync
+    if _in_sync:
+        metrics.COMMAND_SYNCS.inc("skipped")
+        return None
+
+    try:
+        digest = await command_tree_hash(tree)
+    except (TypeError, AttributeError) as e:
+        # Serializer signatures changed again: syncing is safe, skipping might not be
+        logger.warning(f"Could not hash the command tree, syncing without the check: {e!r}")
+        digest = None
+    state = load_sync_state(path) if digest else {}
+    if digest and state.get("hash") == digest:
+        _in_sync = True
+        metrics.COMMAND_SYNCS.inc("skipped")
+        logger.info(
+            f"✅ Command tree unchanged ({state.get('commands', '?')} command(s), {digest[:12]}), "
+            f"skipped sync (saved ~{state.get('seconds', 0):.1f}s)"
+        )
+        return None
+
+    started = time.monotonic()
+    synced = await tree.sync()
+    elapsed = time.monotonic() - started
+    _in_sync = True
+    metrics.COMMAND_SYNCS.inc("synced")
+    if digest:
+        save_sync_state({"hash": digest, "commands": len(synced), "seconds": round(elapsed, 3)}, path)
+    logger.info(f"✅ Synced {len(synced)} command(s) in {elapsed:.1f}s ({(digest or 'unhashed')[:12]})")
+    return synced
@@ -1,18 +1,122 @@
+import os
+import gzip
+import json
+import time
 import sqlite3
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Connection tuning - applied once per pooled connection
+CACHE_SIZE_KIB = 16384           # 16 MiB page cache per connection
+MMAP_SIZE = 64 * 1024 * 1024     # 64 MiB memory-mapped I/O
+STATEMENT_CACHE_SIZE = 256       # Prepared statements kept per connection
+
+# AsyncDatabase tuning
+READ_WORKERS = 4                 # Reader threads (WAL lets them run alongside the writer)
+MAX_PENDING_QUERIES = 1000       # Bound on queued + running queries before callers wait
+
+# Streaming export/import: columns per table and the key used to upsert rows
+EXPORT_TABLES = {
+    "user_xp": (("guild_id", "user_id", "xp", "level", "last_xp_time", "created_at"), ("guild_id", "user_id")),
+    "activity_streaks": (("guild_id", "user_id", "activity_name", "streak_count", "last_activity_time"), ("guild_id", "user_id")),
+    "guild_config": (("guild_id", "enabled", "log_channel", "target_role", "auto_roles", "created_at"), ("guild_id",)),
+    "custom_xp_roles": (("guild_id", "level", "role_id"), ("guild_id", "level")),
+}
+EXPORT_CHUNK_SIZE = 1000         # Rows fetched / inserted per round trip
+SNAPSHOT_PAGES_PER_STEP = 256    # Pages copied per sqlite3 backup step
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# have run; append new entries, never edit or reorder existing ones.
+MIGRATIONS = [
+    # 1: Covering composite indexes for leaderboard, rank and streak queries.
+    # The single-column guild/xp indexes can't serve WHERE guild_id ORDER BY xp.
+    [
+        'CREATE INDEX IF NOT EXISTS idx_user_xp_rank ON user_xp(guild_id, xp DESC, user_id, level)',
+        'CREATE INDEX IF NOT EXISTS idx_streaks_top ON activity_streaks(guild_id, streak_count DESC, user_id, activity_name)',
+        'DROP INDEX IF EXISTS idx_user_xp_guild',
+        'DROP INDEX IF EXISTS idx_user_xp_xp',
+        'DROP INDEX IF EXISTS idx_user_xp_guild_xp',
+        'DROP INDEX IF EXISTS idx_streaks_guild',
+    ],
+    # 2: Checkpoints for background reward-role syncs, so they resume after a restart.
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS role_sync_jobs (
+            guild_id INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            role_id INTEGER NOT NULL,
+            old_role_id INTEGER,
+            cursor INTEGER DEFAULT 0,
+            added INTEGER DEFAULT 0,
+            removed INTEGER DEFAULT 0,
+            skipped INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, level)
+        )
+        ''',
+    ],
+    # 3: Per-guild progress of the background reward-role audit.
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS role_audits (
+            guild_id INTEGER PRIMARY KEY,
+            cursor INTEGER DEFAULT 0,
+            finished_at INTEGER
+        )
+        ''',
+    ],
+]
+
+ROLE_SYNC_FIELDS = ("guild_id", "level", "role_id", "old_role_id", "cursor", "added", "removed", "skipped", "failed")
+
 class Database:
     def __init__(self, db_path: str = "bot_database.db"):
         self.db_path = db_path
+        # One long-lived connection per thread, reused across queries
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_database()
     
-    def get_connection(self):
-        """Get database connection."""
-        return sqlite3.connect(self.db_path)
+    def get_connection(self) -> sqlite3.Connection:
+        """Get this thread's pooled database connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def close(self):
+        """Close every pooled connection (call on shutdown)."""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to close database connection: {e}")
+            self._connections.clear()
+        self._local = threading.local()
     
     def init_database(self):
         """Initialize database tables."""
@@ -69,16 +173,31 @@ class Database:
             )
         ''')
         
-        # Create indexes for better performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_xp_guild ON user_xp(guild_id)')
+        # Create indexes for better performance (query indexes live in MIGRATIONS)
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_xp_user ON user_xp(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_xp_xp ON user_xp(xp DESC)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_streaks_guild ON activity_streaks(guild_id)')
         
         conn.commit()
-        conn.close()
+        self.run_migrations()
         logger.info("Database initialized successfully")
     
+    def run_migrations(self):
+        """Apply pending MIGRATIONS, each in its own transaction."""
+        conn = self.get_connection()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        
+        for target, statements in enumerate(MIGRATIONS[version:], version + 1):
+            try:
+                conn.execute('BEGIN')
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {target}')
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Database migration {target} failed: {e}")
+                raise
+            logger.info(f"Applied database migration {target}")
+    
     # User XP Methods
     def get_user_xp(self, guild_id: int, user_id: int) -> dict:
         """Get user XP data."""
@@ -91,7 +210,6 @@ class Database:
         ''', (guild_id, user_id))
         
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {
@@ -106,26 +224,20 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Get current XP
-        current_data = self.get_user_xp(guild_id, user_id)
-        new_xp = current_data["xp"] + xp_amount
-        new_level = new_xp // 100
-        leveled_up = new_level > current_data["level"]
-        
-        # Update or insert
-        cursor.execute('''
-            INSERT INTO user_xp (guild_id, user_id, xp, level, last_xp_time)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(guild_id, user_id) DO UPDATE SET
-                xp = ?,
-                level = ?,
-                last_xp_time = ?
-        ''', (guild_id, user_id, new_xp, new_level, datetime.now(),
-              new_xp, new_level, datetime.now()))
-        
-        conn.commit()
-        conn.close()
-        
+        # Atomic increment - level is derived in SQL, so concurrent awards can't lose updates
+        with conn:
+            cursor.execute('''
+                INSERT INTO user_xp (guild_id, user_id, xp, level, last_xp_time)
+                VALUES (?1, ?2, ?3, ?3 / 100, ?4)
+                ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                    xp = xp + excluded.xp,
+                    level = (xp + excluded.xp) / 100,
+                    last_xp_time = excluded.last_xp_time
+                RETURNING xp, level
+            ''', (guild_id, user_id, xp_amount, datetime.now()))
+            new_xp, new_level = cursor.fetchall()[0]
+        
+        leveled_up = new_level > (new_xp - xp_amount) // 100
         return leveled_up, new_level
     
     def get_leaderboard(self, guild_id: int, limit: int = 100) -> List[Tuple]:
@@ -141,9 +253,90 @@ class Database:
         ''', (guild_id, limit))
         
         results = cursor.fetchall()
-        conn.close()
         return results
     
+    def get_leaderboard_page(self, guild_id: int, offset: int = 0, limit: int = 10) -> List[Tuple]:
+        """Get one leaderboard page as (rank, user_id, xp, level) rows."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT user_id, xp, level FROM user_xp
+            WHERE guild_id = ?
+            ORDER BY xp DESC, user_id
+            LIMIT ? OFFSET ?
+        ''', (guild_id, limit, offset))
+        rows = cursor.fetchall()
+        if not rows:
+            return []
+        
+        # Only the first row can tie with rows on earlier pages; after that a
+        # row's rank is its position unless it ties with the row above (RANK()).
+        cursor.execute(
+            'SELECT COUNT(*) + 1 FROM user_xp WHERE guild_id = ? AND xp > ?',
+            (guild_id, rows[0][1])
+        )
+        rank = cursor.fetchone()[0]
+        
+        results = []
+        previous_xp = rows[0][1]
+        for position, (user_id, xp, level) in enumerate(rows, offset + 1):
+            if xp != previous_xp:
+                rank = position
+                previous_xp = xp
+            results.append((rank, user_id, xp, level))
+        return results
+    
+    def get_rank_and_neighbors(self, guild_id: int, user_id: int, radius: int = 2) -> Optional[dict]:
+        """
+        Get a user's rank plus the leaderboard rows around them.
+        Returns {"rank", "position", "neighbors"} or None if the user has no XP.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM user_xp WHERE guild_id = ?1 AND xp > me.xp),
+                (SELECT COUNT(*) FROM user_xp WHERE guild_id = ?1 AND xp = me.xp AND user_id < ?2)
+            FROM user_xp AS me
+            WHERE me.guild_id = ?1 AND me.user_id = ?2
+        ''', (guild_id, user_id))
+        result = cursor.fetchone()
+        if not result:
+            return None
+        
+        above, tied_before = result
+        position = above + tied_before + 1
+        offset = max(0, position - 1 - radius)
+        return {
+            "rank": above + 1,
+            "position": position,
+            "neighbors": self.get_leaderboard_page(guild_id, offset, radius * 2 + 1)
+        }
+    
+    def get_guild_xp_totals(self, guild_id: int) -> List[Tuple]:
+        """Get (user_id, xp) for every user in a guild."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT user_id, xp FROM user_xp WHERE guild_id = ?', (guild_id,))
+        return cursor.fetchall()
+    
+    def get_user_levels(self, guild_id: int, min_level: int = 0, after_user_id: int = 0,
+                        limit: Optional[int] = None) -> List[Tuple]:
+        """Get (user_id, level) for users at min_level or above with user_id > after_user_id, in user_id order."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT user_id, level FROM user_xp
+            WHERE guild_id = ? AND user_id > ? AND level >= ?
+            ORDER BY user_id
+            LIMIT ?
+        ''', (guild_id, after_user_id, min_level, -1 if limit is None else limit))
+        return cursor.fetchall()
+    
     def get_user_rank(self, guild_id: int, user_id: int) -> Optional[int]:
         """Get user's rank in guild."""
         conn = self.get_connection()
@@ -157,7 +350,6 @@ class Database:
         ''', (guild_id, guild_id, user_id))
         
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else None
     
     def get_total_users(self, guild_id: int) -> int:
@@ -167,7 +359,6 @@ class Database:
         
         cursor.execute('SELECT COUNT(*) FROM user_xp WHERE guild_id = ?', (guild_id,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else 0
     
     # Streak Methods
@@ -183,7 +374,6 @@ class Database:
         ''', (guild_id, user_id))
         
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {
@@ -198,18 +388,16 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO activity_streaks (guild_id, user_id, activity_name, streak_count, last_activity_time)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(guild_id, user_id) DO UPDATE SET
-                activity_name = ?,
-                streak_count = ?,
-                last_activity_time = ?
-        ''', (guild_id, user_id, activity_name, streak_count, datetime.now(),
-              activity_name, streak_count, datetime.now()))
-        
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor.execute('''
+                INSERT INTO activity_streaks (guild_id, user_id, activity_name, streak_count, last_activity_time)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                    activity_name = ?,
+                    streak_count = ?,
+                    last_activity_time = ?
+            ''', (guild_id, user_id, activity_name, streak_count, datetime.now(),
+                  activity_name, streak_count, datetime.now()))
     
     def get_top_streaks(self, guild_id: int, limit: int = 10) -> List[Tuple]:
         """Get top streaks in guild."""
@@ -224,9 +412,38 @@ class Database:
         ''', (guild_id, limit))
         
         results = cursor.fetchall()
-        conn.close()
         return results
     
+    # Batched Writes
+    def apply_xp_batch(self, xp_rows: List[Tuple], streak_rows: List[Tuple]):
+        """
+        Apply coalesced XP deltas and streak updates in a single transaction.
+        xp_rows: (guild_id, user_id, xp_delta, last_xp_time)
+        streak_rows: (guild_id, user_id, activity_name, streak_count, last_activity_time)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            if xp_rows:
+                cursor.executemany('''
+                    INSERT INTO user_xp (guild_id, user_id, xp, level, last_xp_time)
+                    VALUES (?1, ?2, ?3, ?3 / 100, ?4)
+                    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                        xp = xp + excluded.xp,
+                        level = (xp + excluded.xp) / 100,
+                        last_xp_time = excluded.last_xp_time
+                ''', xp_rows)
+            if streak_rows:
+                cursor.executemany('''
+                    INSERT INTO activity_streaks (guild_id, user_id, activity_name, streak_count, last_activity_time)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                        activity_name = excluded.activity_name,
+                        streak_count = excluded.streak_count,
+                        last_activity_time = excluded.last_activity_time
+                ''', streak_rows)
+    
     # Guild Config Methods
     def get_guild_config(self, guild_id: int) -> dict:
         """Get guild configuration."""
@@ -239,7 +456,6 @@ class Database:
         ''', (guild_id,))
         
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {
@@ -255,6 +471,42 @@ class Database:
             "auto_roles": False
         }
     
+    def get_enabled_guild_ids(self) -> List[int]:
+        """Get the IDs of every guild with the XP system enabled."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT guild_id FROM guild_config WHERE enabled')
+        return [row[0] for row in cursor.fetchall()]
+    
+    def get_enabled_guild_configs(self) -> Dict[int, Tuple[dict, Dict[int, int]]]:
+        """Get {guild_id: (config, {level: role_id})} for every enabled guild in two queries."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT guild_id, enabled, log_channel, target_role, auto_roles
+            FROM guild_config WHERE enabled
+        ''')
+        configs = {
+            guild_id: ({
+                "enabled": bool(enabled),
+                "log_channel": log_channel,
+                "target_role": target_role,
+                "auto_roles": bool(auto_roles)
+            }, {})
+            for guild_id, enabled, log_channel, target_role, auto_roles in cursor.fetchall()
+        }
+        
+        cursor.execute('''
+            SELECT r.guild_id, r.level, r.role_id FROM custom_xp_roles r
+            JOIN guild_config g ON g.guild_id = r.guild_id
+            WHERE g.enabled
+        ''')
+        for guild_id, level, role_id in cursor.fetchall():
+            configs[guild_id][1][level] = role_id
+        return configs
+    
     def update_guild_config(self, guild_id: int, **kwargs):
         """Update guild configuration."""
         conn = self.get_connection()
@@ -269,21 +521,18 @@ class Database:
                 update_values.append(value)
         
         if not fields:
-            conn.close()
             return
         
         # Prepare values: [guild_id] + insert values + update values
         insert_values = [guild_id] + list(kwargs.values())
         all_values = insert_values + update_values
         
-        cursor.execute(f'''
-            INSERT INTO guild_config (guild_id, {", ".join(kwargs.keys())})
-            VALUES (?, {", ".join(["?" for _ in kwargs])})
-            ON CONFLICT(guild_id) DO UPDATE SET {", ".join(fields)}
-        ''', all_values)
-        
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor.execute(f'''
+                INSERT INTO guild_config (guild_id, {", ".join(kwargs.keys())})
+                VALUES (?, {", ".join(["?" for _ in kwargs])})
+                ON CONFLICT(guild_id) DO UPDATE SET {", ".join(fields)}
+            ''', all_values)
     
     # Custom Roles Methods
     def add_custom_role(self, guild_id: int, level: int, role_id: int):
@@ -291,17 +540,15 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO custom_xp_roles (guild_id, level, role_id)
-            VALUES (?, ?, ?)
-            ON CONFLICT(guild_id, level) DO UPDATE SET role_id = ?
-        ''', (guild_id, level, role_id, role_id))
-        
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor.execute('''
+                INSERT INTO custom_xp_roles (guild_id, level, role_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(guild_id, level) DO UPDATE SET role_id = ?
+            ''', (guild_id, level, role_id, role_id))
     
-    def get_custom_roles(self, guild_id: int) -> dict:
-        """Get all custom roles for guild."""
+    def get_custom_roles(self, guild_id: int) -> Dict[int, int]:
+        """Get all custom roles for guild as {level: role_id}."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -311,65 +558,360 @@ class Database:
         ''', (guild_id,))
         
         results = cursor.fetchall()
-        conn.close()
         
-        return {str(level): role_id for level, role_id in results}
+        return {level: role_id for level, role_id in results}
     
     def remove_custom_role(self, guild_id: int, level: int):
         """Remove custom XP role."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            DELETE FROM custom_xp_roles
-            WHERE guild_id = ? AND level = ?
-        ''', (guild_id, level))
+        with conn:
+            cursor.execute('''
+                DELETE FROM custom_xp_roles
+                WHERE guild_id = ? AND level = ?
+            ''', (guild_id, level))
+    
+    def purge_guild(self, guild_id: int) -> Dict[str, int]:
+        """Delete all XP data and config for a guild in one transaction. Returns rows deleted per table."""
+        conn = self.get_connection()
+        deleted = {}
         
-        conn.commit()
-        conn.close()
+        with conn:
+            for table in ("user_xp", "activity_streaks", "custom_xp_roles", "guild_config"):
+                cursor = conn.execute(f'DELETE FROM {table} WHERE guild_id = ?', (guild_id,))
+                deleted[table] = cursor.rowcount
+            conn.execute('DELETE FROM role_sync_jobs WHERE guild_id = ?', (guild_id,))
+            conn.execute('DELETE FROM role_audits WHERE guild_id = ?', (guild_id,))
+        
+        logger.info(f"Purged guild {guild_id}: {deleted}")
+        return deleted
     
-    # Utility Methods
-    def backup_to_json(self, filename: str = "database_backup.json"):
-        """Backup database to JSON file."""
-        import json
+    # Role Sync Job Methods
+    def save_role_sync_job(self, job: dict):
+        """Insert or update a role sync checkpoint (keys: ROLE_SYNC_FIELDS)."""
+        conn = self.get_connection()
         
+        with conn:
+            conn.execute(f'''
+                INSERT INTO role_sync_jobs ({", ".join(ROLE_SYNC_FIELDS)})
+                VALUES ({", ".join("?" for _ in ROLE_SYNC_FIELDS)})
+                ON CONFLICT(guild_id, level) DO UPDATE SET
+                    {", ".join(f"{field} = excluded.{field}" for field in ROLE_SYNC_FIELDS[2:])}
+            ''', [job[field] for field in ROLE_SYNC_FIELDS])
+    
+    def get_role_sync_jobs(self) -> List[dict]:
+        """Get every unfinished role sync checkpoint."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        backup_data = {
-            "user_xp": [],
-            "streaks": [],
-            "guild_configs": [],
-            "custom_roles": []
-        }
+        cursor.execute(f'SELECT {", ".join(ROLE_SYNC_FIELDS)} FROM role_sync_jobs ORDER BY started_at')
+        return [dict(zip(ROLE_SYNC_FIELDS, row)) for row in cursor.fetchall()]
+    
+    def delete_role_sync_job(self, guild_id: int, level: int):
+        """Remove a finished role sync checkpoint."""
+        conn = self.get_connection()
+        
+        with conn:
+            conn.execute('DELETE FROM role_sync_jobs WHERE guild_id = ? AND level = ?', (guild_id, level))
+    
+    # Role Audit Methods
+    def get_role_audits(self) -> Dict[int, Tuple]:
+        """Get {guild_id: (cursor, finished_at)} for the reward-role audit."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT guild_id, cursor, finished_at FROM role_audits')
+        return {guild_id: (audit_cursor, finished_at) for guild_id, audit_cursor, finished_at in cursor.fetchall()}
+    
+    def save_role_audit(self, guild_id: int, cursor: int, finished_at: Optional[int] = None):
+        """Checkpoint a guild's audit; finished_at (unix time) is only overwritten when given."""
+        conn = self.get_connection()
         
-        # Backup user XP
-        cursor.execute('SELECT * FROM user_xp')
-        for row in cursor.fetchall():
-            backup_data["user_xp"].append({
-                "guild_id": row[1],
-                "user_id": row[2],
-                "xp": row[3],
-                "level": row[4]
-            })
-        
-        # Backup streaks
-        cursor.execute('SELECT * FROM activity_streaks')
-        for row in cursor.fetchall():
-            backup_data["streaks"].append({
-                "guild_id": row[1],
-                "user_id": row[2],
-                "activity": row[3],
-                "count": row[4]
-            })
-        
-        conn.close()
-        
-        with open(filename, 'w') as f:
-            json.dump(backup_data, f, indent=4)
-        
-        logger.info(f"Database backed up to {filename}")
-        return filename
+        with conn:
+            conn.execute('''
+                INSERT INTO role_audits (guild_id, cursor, finished_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(guild_id) DO UPDATE SET
+                    cursor = excluded.cursor,
+                    finished_at = COALESCE(excluded.finished_at, role_audits.finished_at)
+            ''', (guild_id, cursor, finished_at))
+    
+    # Utility Methods
+    def export_ndjson(self, filename: str, guild_id: Optional[int] = None,
+                      compress: bool = False) -> dict:
+        """
+        Stream tables to an NDJSON file, one {"table": ..., <columns>} object per line.
+        Reads run in chunks inside one read transaction, so the export is
+        consistent without loading everything into memory. Optionally limited
+        to one guild and gzip-compressed. Returns rows/bytes/throughput stats.
+        """
+        conn = self.get_connection()
+        started = time.perf_counter()
+        rows_written = 0
+        opener = gzip.open if compress else open
+        
+        conn.execute('BEGIN')
+        try:
+            with opener(filename, 'wt', encoding='utf-8') as f:
+                for table, (columns, _) in EXPORT_TABLES.items():
+                    query = f'SELECT {", ".join(columns)} FROM {table}'
+                    params = ()
+                    if guild_id is not None:
+                        query += ' WHERE guild_id = ?'
+                        params = (guild_id,)
+                    
+                    cursor = conn.execute(query, params)
+                    while True:
+                        chunk = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        for row in chunk:
+                            record = {"table": table}
+                            record.update(zip(columns, row))
+                            f.write(json.dumps(record, default=str) + '\n')
+                        rows_written += len(chunk)
+        finally:
+            conn.rollback()
+        
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        size = os.path.getsize(filename)
+        stats = {
+            "filename": filename,
+            "rows": rows_written,
+            "bytes": size,
+            "seconds": elapsed,
+            "rows_per_sec": rows_written / elapsed,
+            "bytes_per_sec": size / elapsed
+        }
+        logger.info(f"Exported {rows_written} rows ({size} bytes) to {filename} in {elapsed:.2f}s")
+        return stats
+    
+    def import_ndjson(self, filename: str, guild_id: Optional[int] = None) -> dict:
+        """
+        Bulk-load an export_ndjson file with executemany upserts in one transaction.
+        If guild_id is given, rows for other guilds are skipped.
+        """
+        conn = self.get_connection()
+        started = time.perf_counter()
+        statements = {}
+        for table, (columns, keys) in EXPORT_TABLES.items():
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in keys)
+            statements[table] = f'''
+                INSERT INTO {table} ({", ".join(columns)})
+                VALUES ({", ".join("?" for _ in columns)})
+                ON CONFLICT({", ".join(keys)}) DO UPDATE SET {updates}
+            '''
+        
+        batches = {table: [] for table in EXPORT_TABLES}
+        rows_read = 0
+        opener = gzip.open if filename.endswith('.gz') else open
+        
+        with conn:
+            with opener(filename, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    table = record.get("table")
+                    if table not in EXPORT_TABLES:
+                        continue
+                    if guild_id is not None and record.get("guild_id") != guild_id:
+                        continue
+                    
+                    columns = EXPORT_TABLES[table][0]
+                    batch = batches[table]
+                    batch.append(tuple(record.get(c) for c in columns))
+                    rows_read += 1
+                    if len(batch) >= EXPORT_CHUNK_SIZE:
+                        conn.executemany(statements[table], batch)
+                        batch.clear()
+            
+            for table, batch in batches.items():
+                if batch:
+                    conn.executemany(statements[table], batch)
+        
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        logger.info(f"Imported {rows_read} rows from {filename} in {elapsed:.2f}s")
+        return {"filename": filename, "rows": rows_read, "seconds": elapsed,
+                "rows_per_sec": rows_read / elapsed}
+    
+    def snapshot_to(self, filename: str, pages_per_step: int = SNAPSHOT_PAGES_PER_STEP,
+                    progress=None):
+        """
+        Copy the whole database to filename with the SQLite online backup API.
+        Run this on the writer thread: no writes can land mid-copy, so the
+        backup never restarts and the snapshot is consistent.
+        """
+        source = self.get_connection()
+        target = sqlite3.connect(filename)
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress)
+        finally:
+            target.close()
+    
+    def restore_guild_from_snapshot(self, filename: str, guild_id: int) -> Dict[str, int]:
+        """Replace one guild's rows with those from a snapshot file, in one transaction."""
+        conn = self.get_connection()
+        restored = {}
+        
+        conn.execute('ATTACH DATABASE ? AS snapshot', (filename,))
+        try:
+            conn.execute('BEGIN')
+            try:
+                for table, (columns, _) in EXPORT_TABLES.items():
+                    column_list = ", ".join(columns)
+                    conn.execute(f'DELETE FROM {table} WHERE guild_id = ?', (guild_id,))
+                    cursor = conn.execute(f'''
+                        INSERT INTO {table} ({column_list})
+                        SELECT {column_list} FROM snapshot.{table} WHERE guild_id = ?
+                    ''', (guild_id,))
+                    restored[table] = cursor.rowcount
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute('DETACH DATABASE snapshot')
+        
+        logger.info(f"Restored guild {guild_id} from {filename}: {restored}")
+        return restored
+
+class AsyncDatabase:
+    """
+    Awaitable facade over Database so SQLite never blocks the event loop.
+    Writes are serialized on one dedicated writer thread, reads run on a small
+    reader pool. Each thread uses its own pooled connection, so with WAL reads
+    proceed concurrently with writes.
+    """
+    
+    def __init__(self, database: Database, read_workers: int = READ_WORKERS,
+                 max_pending: int = MAX_PENDING_QUERIES):
+        self.db = database
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-reader")
+        # Bounded queue: callers wait here once max_pending queries are in flight
+        self._pending = asyncio.Semaphore(max_pending)
+    
+    async def _run(self, executor: ThreadPoolExecutor, func, *args, **kwargs):
+        """Run a Database call on the given executor once a queue slot is free."""
+        async with self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, lambda: func(*args, **kwargs))
+    
+    async def read(self, func, *args, **kwargs):
+        """Run a read-only Database call on the reader pool."""
+        return await self._run(self._readers, func, *args, **kwargs)
+    
+    async def write(self, func, *args, **kwargs):
+        """Run a Database call that modifies data on the single writer thread."""
+        return await self._run(self._writer, func, *args, **kwargs)
+    
+    def close(self):
+        """Wait for queued queries to finish and close all connections."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.db.close()
+    
+    # User XP Methods
+    async def get_user_xp(self, guild_id: int, user_id: int) -> dict:
+        return await self.read(self.db.get_user_xp, guild_id, user_id)
+    
+    async def add_xp(self, guild_id: int, user_id: int, xp_amount: int) -> Tuple[bool, int]:
+        return await self.write(self.db.add_xp, guild_id, user_id, xp_amount)
+    
+    async def get_leaderboard(self, guild_id: int, limit: int = 100) -> List[Tuple]:
+        return await self.read(self.db.get_leaderboard, guild_id, limit)
+    
+    async def get_leaderboard_page(self, guild_id: int, offset: int = 0, limit: int = 10) -> List[Tuple]:
+        return await self.read(self.db.get_leaderboard_page, guild_id, offset, limit)
+    
+    async def get_rank_and_neighbors(self, guild_id: int, user_id: int, radius: int = 2) -> Optional[dict]:
+        return await self.read(self.db.get_rank_and_neighbors, guild_id, user_id, radius)
+    
+    async def get_guild_xp_totals(self, guild_id: int) -> List[Tuple]:
+        return await self.read(self.db.get_guild_xp_totals, guild_id)
+    
+    async def get_user_levels(self, guild_id: int, min_level: int = 0, after_user_id: int = 0,
+                              limit: Optional[int] = None) -> List[Tuple]:
+        return await self.read(self.db.get_user_levels, guild_id, min_level, after_user_id, limit)
+    
+    async def get_user_rank(self, guild_id: int, user_id: int) -> Optional[int]:
+        return await self.read(self.db.get_user_rank, guild_id, user_id)
+    
+    async def get_total_users(self, guild_id: int) -> int:
+        return await self.read(self.db.get_total_users, guild_id)
+    
+    # Streak Methods
+    async def get_streak(self, guild_id: int, user_id: int) -> dict:
+        return await self.read(self.db.get_streak, guild_id, user_id)
+    
+    async def update_streak(self, guild_id: int, user_id: int, activity_name: str, streak_count: int):
+        return await self.write(self.db.update_streak, guild_id, user_id, activity_name, streak_count)
+    
+    async def get_top_streaks(self, guild_id: int, limit: int = 10) -> List[Tuple]:
+        return await self.read(self.db.get_top_streaks, guild_id, limit)
+    
+    # Batched Writes
+    async def apply_xp_batch(self, xp_rows: List[Tuple], streak_rows: List[Tuple]):
+        return await self.write(self.db.apply_xp_batch, xp_rows, streak_rows)
+    
+    # Guild Config Methods
+    async def get_guild_config(self, guild_id: int) -> dict:
+        return await self.read(self.db.get_guild_config, guild_id)
+    
+    async def get_enabled_guild_ids(self) -> List[int]:
+        return await self.read(self.db.get_enabled_guild_ids)
+    
+    async def get_enabled_guild_configs(self) -> Dict[int, Tuple[dict, Dict[int, int]]]:
+        return await self.read(self.db.get_enabled_guild_configs)
+    
+    async def update_guild_config(self, guild_id: int, **kwargs):
+        return await self.write(self.db.update_guild_config, guild_id, **kwargs)
+    
+    # Custom Roles Methods
+    async def add_custom_role(self, guild_id: int, level: int, role_id: int):
+        return await self.write(self.db.add_custom_role, guild_id, level, role_id)
+    
+    async def get_custom_roles(self, guild_id: int) -> Dict[int, int]:
+        return await self.read(self.db.get_custom_roles, guild_id)
+    
+    async def remove_custom_role(self, guild_id: int, level: int):
+        return await self.write(self.db.remove_custom_role, guild_id, level)
+    
+    async def purge_guild(self, guild_id: int) -> Dict[str, int]:
+        return await self.write(self.db.purge_guild, guild_id)
+    
+    # Role Sync Job Methods
+    async def save_role_sync_job(self, job: dict):
+        return await self.write(self.db.save_role_sync_job, job)
+    
+    async def get_role_sync_jobs(self) -> List[dict]:
+        return await self.read(self.db.get_role_sync_jobs)
+    
+    async def delete_role_sync_job(self, guild_id: int, level: int):
+        return await self.write(self.db.delete_role_sync_job, guild_id, level)
+    
+    # Role Audit Methods
+    async def get_role_audits(self) -> Dict[int, Tuple]:
+        return await self.read(self.db.get_role_audits)
+    
+    async def save_role_audit(self, guild_id: int, cursor: int, finished_at: Optional[int] = None):
+        return await self.write(self.db.save_role_audit, guild_id, cursor, finished_at)
+    
+    # Utility Methods
+    async def export_ndjson(self, filename: str, guild_id: Optional[int] = None,
+                            compress: bool = False) -> dict:
+        return await self.read(self.db.export_ndjson, filename, guild_id, compress)
+    
+    async def import_ndjson(self, filename: str, guild_id: Optional[int] = None) -> dict:
+        return await self.write(self.db.import_ndjson, filename, guild_id)
+    
+    async def snapshot_to(self, filename: str, pages_per_step: int = SNAPSHOT_PAGES_PER_STEP,
+                          progress=None):
+        return await self.write(self.db.snapshot_to, filename, pages_per_step, progress)
+    
+    async def restore_guild_from_snapshot(self, filename: str, guild_id: int) -> Dict[str, int]:
+        return await self.write(self.db.restore_guild_from_snapshot, filename, guild_id)
 
-# Global database instance
+# Global database instances
 db = Database()
+async_db = AsyncDatabase(db)
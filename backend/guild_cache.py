@@ -0,0 +1,127 @@
+"""
+Read-through cache for guild XP configuration and reward roles.
+Presence updates and XP commands read these on every call, so they are kept
+in memory and only reloaded after an explicit invalidation.
+"""
+
+import logging
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from storage import StorageBackend, storage
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class RewardLadder:
+    """
+    Reward roles as parallel int arrays sorted by level.
+    Lookups are O(log n) bisects instead of re-sorting the roles on every call.
+    """
+    __slots__ = ("levels", "role_ids")
+
+    def __init__(self, custom_roles: Dict[int, int]):
+        pairs = sorted(custom_roles.items())
+        self.levels = array("q", [level for level, _ in pairs])
+        self.role_ids = array("q", [role_id for _, role_id in pairs])
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.levels, self.role_ids)
+
+    def current_for(self, level: int) -> Optional[Tuple[int, int]]:
+        """(level, role_id) of the highest reward role the level qualifies for."""
+        i = bisect_right(self.levels, level)
+        if i == 0:
+            return None
+        return self.levels[i - 1], self.role_ids[i - 1]
+
+    def next_after(self, level: int) -> Optional[Tuple[int, int]]:
+        """(level, role_id) of the first reward role above the level."""
+        i = bisect_right(self.levels, level)
+        if i == len(self.levels):
+            return None
+        return self.levels[i], self.role_ids[i]
+
+class GuildSettings:
+    """Cached configuration and reward-role ladder for one guild."""
+    __slots__ = ("config", "ladder")
+
+    def __init__(self, config: dict, custom_roles: Dict[int, int]):
+        self.config = config
+        self.config["custom_roles"] = custom_roles
+        self.ladder = RewardLadder(custom_roles)
+
+class GuildConfigCache:
+    def __init__(self, database: StorageBackend):
+        self.adb = database
+        self._entries: Dict[int, GuildSettings] = {}
+        # Guilds that may have XP enabled: exact after warm_enabled(), and only
+        # ever over-inclusive (invalidated guilds stay in until reloaded)
+        self._maybe_enabled: Set[int] = set()
+        self._enabled_warm = False
+        self.hits = 0
+        self.misses = 0
+
+    async def warm_enabled(self) -> int:
+        """Load the enabled-guild set in one query. Returns how many are enabled."""
+        enabled = await self.adb.get_enabled_guild_ids()
+        # Merge rather than replace, keeping guilds invalidated during the query
+        self._maybe_enabled.update(enabled)
+        self._enabled_warm = True
+        return len(enabled)
+
+    def may_be_enabled(self, guild_id: int) -> bool:
+        """In-memory pre-check: False only if the guild definitely has XP disabled."""
+        return not self._enabled_warm or guild_id in self._maybe_enabled
+
+    async def get(self, guild_id: int) -> GuildSettings:
+        """Get cached settings, loading them from the database on a miss."""
+        settings = self._entries.get(guild_id)
+        if settings is not None:
+            self.hits += 1
+            return settings
+
+        self.misses += 1
+        config = await self.adb.get_guild_config(guild_id)
+        custom_roles = await self.adb.get_custom_roles(guild_id)
+        settings = self._entries[guild_id] = GuildSettings(config, custom_roles)
+        if config["enabled"]:
+            self._maybe_enabled.add(guild_id)
+        else:
+            self._maybe_enabled.discard(guild_id)
+        return settings
+
+    def prime(self, configs: Dict[int, Tuple[dict, Dict[int, int]]]):
+        """Seed entries from a bulk load ({guild_id: (config, custom_roles)}); cached entries win."""
+        for guild_id, (config, custom_roles) in configs.items():
+            if guild_id not in self._entries:
+                self._entries[guild_id] = GuildSettings(dict(config), dict(custom_roles))
+            if config["enabled"]:
+                self._maybe_enabled.add(guild_id)
+
+    def invalidate(self, guild_id: int):
+        """Drop a guild's entry after its config or reward roles change."""
+        self._entries.pop(guild_id, None)
+        # Might have just been enabled; the next get() settles it
+        self._maybe_enabled.add(guild_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._enabled_warm = False
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "guilds": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+# Global cache instance
+guild_cache = GuildConfigCache(storage)
+metrics.Gauge("ayame_guild_cache_hit_ratio", "Guild config cache hit ratio", lambda: guild_cache.stats()["hit_rate"])
@@ -0,0 +1,151 @@
+"""
+In-memory leaderboard index per guild.
+Each guild's XP totals are kept as a sorted list of (-xp, user_id) so rank and
+page lookups are bisects instead of SQLite queries. Guilds are warmed lazily
+from user_xp, updated as buffered XP commits, and evicted LRU.
+"""
+
+import os
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from storage import StorageBackend, storage
+
+logger = logging.getLogger(__name__)
+
+# Guilds kept in memory at once; 0 disables the index and every lookup goes to SQLite
+MAX_GUILDS = int(os.getenv("LEADERBOARD_CACHE_GUILDS", 50))
+
+class GuildLeaderboard:
+    """Sorted XP totals for one guild."""
+    __slots__ = ("keys", "xp")
+
+    def __init__(self, rows: List[Tuple[int, int]]):
+        self.xp: Dict[int, int] = dict(rows)
+        self.keys: List[Tuple[int, int]] = sorted((-xp, user_id) for user_id, xp in rows)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, user_id: int, xp_delta: int):
+        """Apply a committed XP change."""
+        old_xp = self.xp.get(user_id)
+        if old_xp is not None:
+            del self.keys[bisect_left(self.keys, (-old_xp, user_id))]
+        new_xp = (old_xp or 0) + xp_delta
+        self.xp[user_id] = new_xp
+        insort(self.keys, (-new_xp, user_id))
+
+    def rank_of(self, xp: int) -> int:
+        """Competition rank (RANK()) for an XP total: 1 + users with more XP."""
+        return bisect_left(self.keys, (-xp,)) + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple]:
+        """(rank, user_id, xp, level) rows, same shape as Database.get_leaderboard_page."""
+        rows = []
+        for neg_xp, user_id in self.keys[offset:offset + limit]:
+            xp = -neg_xp
+            rows.append((self.rank_of(xp), user_id, xp, xp // 100))
+        return rows
+
+    def standing(self, user_id: int, radius: int) -> Optional[dict]:
+        """Same shape as Database.get_rank_and_neighbors."""
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        position = bisect_left(self.keys, (-xp, user_id)) + 1
+        return {
+            "rank": self.rank_of(xp),
+            "position": position,
+            "neighbors": self.page(max(0, position - 1 - radius), radius * 2 + 1)
+        }
+
+class LeaderboardIndex:
+    """
+    LRU of GuildLeaderboards with the same lookup API as the storage backend.
+    Falls back to SQLite when disabled (max_guilds=0).
+    """
+
+    def __init__(self, database: StorageBackend, max_guilds: int = MAX_GUILDS):
+        self.adb = database
+        self.max_guilds = max_guilds
+        self._guilds: "OrderedDict[int, GuildLeaderboard]" = OrderedDict()
+        # Bumped when a commit starts and when it ends, so a warm-up can tell
+        # its rows may or may not include a batch
+        self._commits = 0
+        # Set while no commit is in flight
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_guilds > 0
+
+    async def _board(self, guild_id: int) -> GuildLeaderboard:
+        board = self._guilds.get(guild_id)
+        if board is not None:
+            self._guilds.move_to_end(guild_id)
+            return board
+
+        while True:
+            await self._idle.wait()
+            commits = self._commits
+            rows = await self.adb.get_guild_xp_totals(guild_id)
+            # Reload if a commit started while reading - it may or may not be in rows
+            if commits == self._commits:
+                break
+
+        # Another caller may have finished warming this guild while we waited
+        board = self._guilds.get(guild_id)
+        if board is None:
+            board = GuildLeaderboard(rows)
+            self._guilds[guild_id] = board
+            while len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+        return board
+
+    def begin_commit(self):
+        """Call before writing XP rows; every call must be followed by apply_committed."""
+        self._commits += 1
+        self._idle.clear()
+
+    def apply_committed(self, xp_rows: List[Tuple]):
+        """
+        Finish a begin_commit: update loaded guilds with the committed
+        (guild_id, user_id, xp_delta, ...) rows, or [] if the write failed.
+        """
+        self._commits += 1
+        self._idle.set()
+        for guild_id, user_id, xp_delta, *_ in xp_rows:
+            board = self._guilds.get(guild_id)
+            if board is not None:
+                board.add(user_id, xp_delta)
+
+    def invalidate(self, guild_id: int):
+        """Drop a guild so it is reloaded after bulk changes (reset, restore)."""
+        self._guilds.pop(guild_id, None)
+
+    def clear(self):
+        self._guilds.clear()
+
+    # Lookups mirroring the storage backend
+    async def get_total_users(self, guild_id: int) -> int:
+        if not self.enabled:
+            return await self.adb.get_total_users(guild_id)
+        return len(await self._board(guild_id))
+
+    async def get_leaderboard_page(self, guild_id: int, offset: int = 0, limit: int = 10) -> List[Tuple]:
+        if not self.enabled:
+            return await self.adb.get_leaderboard_page(guild_id, offset, limit)
+        return (await self._board(guild_id)).page(offset, limit)
+
+    async def get_rank_and_neighbors(self, guild_id: int, user_id: int, radius: int = 2) -> Optional[dict]:
+        if not self.enabled:
+            return await self.adb.get_rank_and_neighbors(guild_id, user_id, radius)
+        return (await self._board(guild_id)).standing(user_id, radius)
+
+# Global index instance
+leaderboard_index = LeaderboardIndex(storage)
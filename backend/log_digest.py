@@ -0,0 +1,175 @@
+"""
+Batched activity log delivery.
+Activity notices, XP awards and level-ups are queued per log channel and
+flushed every few seconds, up to 10 embeds per message. A burst too big
+for a couple of messages is collapsed into multi-line summary embeds, and
+each channel's queue is bounded: newer notices for the same member replace
+older ones, and on overflow the lowest-priority, oldest entries are dropped.
+Rate-limit backoff happens in the flush task, never in the presence handler.
+"""
+
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+import discord
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = 5              # How often queued log entries are sent
+EMBEDS_PER_MESSAGE = 10        # Discord limit
+MESSAGE_CHAR_LIMIT = 6000      # Discord limit on total embed text per message
+DESCRIPTION_LIMIT = 4096       # Discord limit per embed description
+MAX_FULL_EMBEDS = 20           # Larger batches are sent as summary lines
+MAX_PENDING = 1000             # Per channel; beyond this entries are dropped
+DIGEST_COLOR = 0x5865F2
+
+# Priorities: on overflow the lowest is dropped first
+LOW, NORMAL, HIGH = 0, 1, 2
+
+class LogEntry:
+    __slots__ = ("seq", "embed", "line")
+
+    def __init__(self, seq: int, embed: discord.Embed, line: str):
+        self.seq = seq
+        self.embed = embed
+        # One-line form used when the batch is sent as a summary
+        self.line = line
+
+class ChannelQueue:
+    """Pending entries for one channel, one ordered dict per priority."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.pending: List["OrderedDict[Hashable, LogEntry]"] = [OrderedDict() for _ in (LOW, NORMAL, HIGH)]
+        self.dropped = 0
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.pending)
+
+    def take(self) -> List[LogEntry]:
+        """Everything pending, oldest first, leaving the queue empty."""
+        entries = sorted(itertools.chain.from_iterable(p.values() for p in self.pending), key=lambda e: e.seq)
+        for p in self.pending:
+            p.clear()
+        return entries
+
+class LogDigest:
+    def __init__(self, max_pending: int = MAX_PENDING):
+        self.max_pending = max_pending
+        self.queues: Dict[int, ChannelQueue] = {}
+        self._seq = itertools.count()
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def post(self, channel, embed: discord.Embed, line: str,
+             key: Optional[Hashable] = None, priority: int = NORMAL):
+        """
+        Queue an entry for a channel. An entry with the same key still
+        pending is replaced in place (e.g. a member's latest new-activity
+        notice supersedes the previous one).
+        """
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = ChannelQueue(channel)
+        queue.channel = channel
+
+        entries = queue.pending[priority]
+        seq = next(self._seq)
+        if key is None:
+            key = seq
+        elif key in entries:
+            entries[key] = LogEntry(entries[key].seq, embed, line)
+            metrics.PRESENCE_LOGGED.inc("merged")
+            return
+
+        if len(queue) >= self.max_pending and not self._drop_one(queue, priority):
+            # Everything pending outranks this entry
+            queue.dropped += 1
+            metrics.PRESENCE_LOGGED.inc("dropped")
+            return
+        entries[key] = LogEntry(seq, embed, line)
+        metrics.PRESENCE_LOGGED.inc("queued")
+
+    def _drop_one(self, queue: ChannelQueue, priority: int) -> bool:
+        """Drop the oldest entry of the lowest priority not above `priority`."""
+        for entries in queue.pending[:priority + 1]:
+            if entries:
+                entries.popitem(last=False)
+                queue.dropped += 1
+                metrics.PRESENCE_LOGGED.inc("dropped")
+                return True
+        return False
+
+    async def flush(self):
+        """Send everything queued, channels in parallel."""
+        async with self._lock:
+            batches = []
+            for channel_id, queue in list(self.queues.items()):
+                entries = queue.take()
+                if entries or queue.dropped:
+                    batches.append((queue.channel, entries, queue.dropped))
+                # Idle channels are forgotten; post() recreates them
+                del self.queues[channel_id]
+            if batches:
+                await asyncio.gather(*(self._send(channel, entries, dropped) for channel, entries, dropped in batches))
+
+    async def _send(self, channel, entries: List[LogEntry], dropped: int):
+        if len(entries) <= MAX_FULL_EMBEDS and not dropped:
+            messages = pack_embeds([entry.embed for entry in entries])
+        else:
+            lines = [entry.line for entry in entries]
+            if dropped:
+                lines.append(f"… and {dropped} more update(s) not shown")
+            messages = pack_embeds(summary_embeds(lines))
+
+        for embeds in messages:
+            try:
+                await channel.send(embeds=embeds)
+                metrics.LOG_DIGEST_MESSAGES.inc("sent")
+            except Exception as e:
+                metrics.LOG_DIGEST_MESSAGES.inc("failed")
+                logger.error(f"Failed to send activity log to #{getattr(channel, 'name', channel.id)}: {e}")
+                if isinstance(e, (discord.Forbidden, discord.NotFound)):
+                    return  # The rest would fail the same way
+        metrics.PRESENCE_LOGGED.inc("sent", amount=len(entries))
+
+def summary_embeds(lines: List[str]) -> List[discord.Embed]:
+    """Pack lines into as few embeds as the description limit allows."""
+    embeds = []
+    chunk, size = [], 0
+    for line in lines:
+        line = line[:DESCRIPTION_LIMIT]
+        if chunk and size + len(line) + 1 > DESCRIPTION_LIMIT:
+            embeds.append(discord.Embed(description="\n".join(chunk), color=DIGEST_COLOR))
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        embeds.append(discord.Embed(description="\n".join(chunk), color=DIGEST_COLOR))
+    return embeds
+
+def pack_embeds(embeds: List[discord.Embed]) -> List[List[discord.Embed]]:
+    """Group embeds into messages within the per-message count and size limits."""
+    messages = []
+    current, size = [], 0
+    for embed in embeds:
+        length = len(embed)
+        if current and (len(current) == EMBEDS_PER_MESSAGE or size + length > MESSAGE_CHAR_LIMIT):
+            messages.append(current)
+            current, size = [], 0
+        current.append(embed)
+        size += length
+    if current:
+        messages.append(current)
+    return messages
+
+# Global log queue shared by every guild's activity feed
+log_digest = LogDigest()
+metrics.Gauge("ayame_log_digest_pending", "Activity log entries waiting to be sent", lambda: len(log_digest))
@@ -1,4 +1,5 @@
 import os
+import time
 import asyncio
 import discord
 import random
@@ -7,7 +8,10 @@ from discord.ext import commands, tasks
 from dotenv import load_dotenv
 from datetime import datetime
 from aiohttp import web
-from recovery import restore_guild_configs, verify_bot_health
+from recovery import start_recovery, recovery_ready, verify_bot_health, role_audit
+from command_sync import sync_command_tree
+from storage import storage
+import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +20,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Startup-to-ready time is measured from here
+STARTED_AT = time.monotonic()
+
 # Load environment
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -66,12 +73,11 @@ async def on_ready():
     logger.info(f"🤖 Logged in as {bot.user} (ID: {bot.user.id})")
     logger.info(f"📊 Bot is in {len(bot.guilds)} guild(s)")
     
-    # Restore guild configurations on startup
-    logger.info("🔄 Restoring guild configurations...")
-    await restore_guild_configs(bot)
+    # Restore guild configurations and verify bot health in the background
+    start_recovery(bot, STARTED_AT)
     
-    # Verify bot health
-    await verify_bot_health(bot)
+    # Repair drifted reward roles in the background (resumes an interrupted pass)
+    role_audit.start(bot)
     
     # Set initial DND status
     all_statuses = base_statuses + get_seasonal_statuses()
@@ -80,18 +86,20 @@ async def on_ready():
     await bot.change_presence(status=discord.Status.idle, activity=activity)
     logger.info(f" Status set to idle with activity: {status}")
     
-    # Sync slash commands with Discord
+    # Sync slash commands with Discord (once per process, and only if they changed)
     try:
-        synced = await bot.tree.sync()
-        logger.info(f"✅ Synced {len(synced)} command(s)")
-        for cmd in synced:
+        synced = await sync_command_tree(bot.tree)
+        for cmd in synced or ():
             logger.info(f"   - /{cmd.name}")
     except Exception as e:
         logger.error(f"❌ Failed to sync commands: {e}")
         logger.error("   Make sure bot has 'applications.commands' scope!")
     
-    rotate_status.start()
-    health_check_task.start()
+    # on_ready fires again after a reconnect; the loops are already running
+    if not rotate_status.is_running():
+        rotate_status.start()
+    if not health_check_task.is_running():
+        health_check_task.start()
 
 @bot.event
 async def on_guild_join(guild):
@@ -232,6 +240,8 @@ async def health_check_task():
     """Periodic health check to ensure bot is functioning."""
     try:
         await verify_bot_health(bot)
+        # Audits any guild not checked in the last AUDIT_INTERVAL_HOURS
+        role_audit.start(bot)
     except Exception as e:
         logger.error(f"Health check failed: {e}")
 
@@ -247,12 +257,24 @@ async def health_check(request):
     """Health check endpoint for Render."""
     return web.Response(text="Bot is running!")
 
+async def ready_check(request):
+    """Readiness endpoint: 200 once startup recovery has finished, 503 before."""
+    if recovery_ready.is_set():
+        return web.Response(text="Ready")
+    return web.Response(text="Recovering", status=503)
+
+async def metrics_endpoint(request):
+    """Prometheus scrape endpoint."""
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
 async def start_web_server():
     """Start a simple web server for health checks (optional for deployment)."""
     try:
         app = web.Application()
         app.router.add_get('/', health_check)
         app.router.add_get('/health', health_check)
+        app.router.add_get('/ready', ready_check)
+        app.router.add_get('/metrics', metrics_endpoint)
         
         runner = web.AppRunner(app)
         await runner.setup()
@@ -310,3 +332,6 @@ if __name__ == "__main__":
         logger.info("👋 Bot shutting down gracefully...")
     except Exception as e:
         logger.error(f"❌ Bot crashed: {e}")
+    finally:
+        # Drain queued database work and close pooled connections
+        storage.close()
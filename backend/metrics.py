@@ -0,0 +1,292 @@
+"""
+Lightweight in-process metrics with Prometheus text output.
+Counters, callback gauges and HDR-style latency histograms (log-linear
+buckets, so recording is a few integer ops and quantiles stay within a
+fixed relative error). Served from /metrics on the health-check web server.
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Histogram resolution: SUB_BUCKETS linear steps per power of two, which
+# bounds the relative error of any recorded value to 1 / SUB_BUCKETS.
+SUB_BUCKET_BITS = 2
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MIN_NS = 1_000            # Values below 1µs share the first bucket
+MAX_POWER = 26            # Exported bounds run from 1µs to 2**26µs (~67s)
+MAX_UNITS = (1 << (MAX_POWER + 1)) - 1                          # Slower values share the last bucket
+BUCKET_COUNT = ((MAX_POWER - SUB_BUCKET_BITS + 1) << SUB_BUCKET_BITS) + SUB_BUCKETS
+
+_registry: List["Metric"] = []
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        _registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class CounterChild:
+    """One label value set of a Counter."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+class Counter(Metric):
+    """Monotonic counter, optionally split by label values."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._children: Dict[Tuple, CounterChild] = {}
+
+    def labels(self, *label_values) -> CounterChild:
+        """Child counter; look it up once and keep it for hot paths."""
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._children[label_values] = CounterChild()
+        return child
+
+    def inc(self, *label_values, amount: int = 1):
+        self.labels(*label_values).value += amount
+
+    def value(self, *label_values) -> int:
+        child = self._children.get(label_values)
+        return child.value if child else 0
+
+    def total(self) -> int:
+        """Sum across all label values."""
+        return sum(child.value for child in self._children.values())
+
+    def samples(self) -> List[str]:
+        if not self._children and not self.label_names:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_format_labels(self.label_names, key)} {child.value}"
+                for key, child in sorted(self._children.items())]
+
+class DerivedCounter(Metric):
+    """Counter computed at scrape time from other counters, so hot paths bump nothing extra."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], int]):
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def value(self) -> int:
+        return self.callback()
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.callback()}"]
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {self.callback()}"]
+        except Exception:
+            return []
+
+class _Timer:
+    """Context manager recording elapsed time into a histogram."""
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: "LatencyHistogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record_ns(time.perf_counter_ns() - self.started)
+        return False
+
+class StageClock:
+    """
+    Lap timer for one pass through a hot path. Each lap() records the time
+    since the previous lap, so consecutive stages cost one clock read each.
+    Pass `started` (a perf_counter_ns() value) to create the clock only once
+    a path turns out to be worth timing; the first lap then runs from there.
+    """
+    __slots__ = ("started", "last")
+
+    def __init__(self, started: Optional[int] = None):
+        self.started = self.last = time.perf_counter_ns() if started is None else started
+
+    def lap(self, histogram: "LatencyHistogram"):
+        now = time.perf_counter_ns()
+        histogram.record_ns(now - self.last)
+        self.last = now
+
+    def total(self, histogram: "LatencyHistogram"):
+        histogram.record_ns(time.perf_counter_ns() - self.started)
+
+class LatencyHistogram:
+    """One HDR-style log-linear histogram of durations in nanoseconds."""
+    __slots__ = ("counts", "count", "total_ns")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total_ns = 0
+
+    @staticmethod
+    def bucket_of(ns: int) -> int:
+        """Bucket index: SUB_BUCKETS linear steps for each power of two of microseconds."""
+        units = ns // MIN_NS
+        if units < SUB_BUCKETS:
+            return units or 1
+        if units > MAX_UNITS:
+            return BUCKET_COUNT - 1
+        shift = units.bit_length() - 1 - SUB_BUCKET_BITS
+        return (shift << SUB_BUCKET_BITS) + (units >> shift)
+
+    @staticmethod
+    def upper_bound_ns(bucket: int) -> int:
+        """Smallest value that no longer falls in the bucket."""
+        if bucket < SUB_BUCKETS:
+            return (bucket + 1) * MIN_NS
+        shift = bucket // SUB_BUCKETS - 1
+        return ((bucket - shift * SUB_BUCKETS + 1) << shift) * MIN_NS
+
+    def record_ns(self, ns: int):
+        # bucket_of() inlined: this runs several times per presence update
+        units = ns // MIN_NS
+        if units < SUB_BUCKETS:
+            bucket = units or 1
+        elif units > MAX_UNITS:
+            bucket = BUCKET_COUNT - 1
+        else:
+            shift = units.bit_length() - 1 - SUB_BUCKET_BITS
+            bucket = (shift << SUB_BUCKET_BITS) + (units >> shift)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ns += ns
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile in seconds (bucket upper bound)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return self.upper_bound_ns(bucket) / 1e9
+        return 0.0
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(le_seconds, count) at every power-of-two bound from 1µs, for export."""
+        result = []
+        seen = 0
+        bucket = 0
+        for power in range(MAX_POWER + 1):
+            bound_ns = (1 << power) * MIN_NS
+            while bucket < BUCKET_COUNT and self.upper_bound_ns(bucket) <= bound_ns:
+                seen += self.counts[bucket]
+                bucket += 1
+            result.append((bound_ns / 1e9, seen))
+        return result
+
+class Histogram(Metric):
+    """Latency histogram family, one LatencyHistogram per label value set."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._children: Dict[Tuple, LatencyHistogram] = {}
+
+    def labels(self, *label_values) -> LatencyHistogram:
+        """Child histogram; look it up once and keep it for hot paths."""
+        child = self._children.get(label_values)
+        if child is None:
+            child = self._children[label_values] = LatencyHistogram()
+        return child
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in sorted(self._children.items()):
+            labels = _format_labels(self.label_names, key)
+            for le, count in child.cumulative():
+                bucket_labels = _format_labels(self.label_names, key, f'le="{le:g}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            inf_labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {child.count}")
+            lines.append(f"{self.name}_sum{labels} {child.total_ns / 1e9}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+def render_prometheus(metrics: Optional[List[Metric]] = None) -> str:
+    """All registered metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in metrics if metrics is not None else _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Presence processing (cogs.activity_xp)
+PRESENCE_PREFILTERED = Counter("ayame_presence_prefiltered_total", "Presence updates discarded before any database work", ("reason",))
+PRESENCE_FILTERED = Counter("ayame_presence_filtered_total", "Presence updates dropped before awarding XP", ("reason",))
+PRESENCE_NEW_ACTIVITY = Counter("ayame_presence_new_activity_total", "Presence updates that logged a new activity")
+# An update that passes the pre-filter ends filtered or as a new activity;
+# "session_ended" counts hourly awards, not updates
+PRESENCE_PROCESSED = DerivedCounter(
+    "ayame_presence_processed_total", "Presence updates that passed the pre-filter",
+    lambda: PRESENCE_FILTERED.total() - PRESENCE_FILTERED.value("session_ended") + PRESENCE_NEW_ACTIVITY.value()
+)
+PRESENCE_EVENTS = DerivedCounter(
+    "ayame_presence_events_total", "Presence updates received",
+    lambda: PRESENCE_PREFILTERED.total() + PRESENCE_PROCESSED.value()
+)
+PRESENCE_AWARDED = Counter("ayame_presence_awarded_total", "Hourly activity XP awards")
+PRESENCE_XP = Counter("ayame_presence_xp_total", "XP points awarded from presence")
+PRESENCE_LOGGED = Counter("ayame_presence_logged_total", "Activity log entries by outcome (queued, merged, dropped, sent)", ("result",))
+LOG_DIGEST_MESSAGES = Counter("ayame_log_digest_messages_total", "Batched activity log messages sent to Discord", ("result",))
+PRESENCE_LATENCY = Histogram("ayame_presence_seconds", "End-to-end handling time of presence updates that log a new activity (sampled)")
+PRESENCE_STAGE = Histogram("ayame_presence_stage_seconds", "New-activity presence update handling time per stage (sampled)", ("stage",))
+PRESENCE_SESSIONS_EVICTED = Counter("ayame_presence_sessions_evicted_total", "Presence state records evicted", ("reason",))
+AWARD_TICK = Histogram("ayame_award_tick_seconds", "Time to award every activity session due in one scheduler tick")
+PRESENCE_PREFILTER_RATIO = Gauge(
+    "ayame_presence_prefilter_ratio", "Share of presence updates discarded by the pre-filter",
+    lambda: PRESENCE_PREFILTERED.total() / max(PRESENCE_EVENTS.value(), 1)
+)
+
+# XP write-behind buffer (xp_buffer)
+XP_BUFFER_DROPPED = Counter("ayame_xp_buffer_dropped_total", "Members whose unsaved XP and streak changes were dropped after failed flushes")
+
+# Reward role sync (role_sync)
+ROLE_SYNC_MEMBERS = Counter("ayame_role_sync_members_total", "Members handled by reward role syncs", ("result",))
+ROLE_API_CALLS_SAVED = Counter("ayame_role_api_calls_saved_total", "Role API calls avoided by applying reward-role changes in one member edit")
+ROLE_AUDIT_MEMBERS = Counter("ayame_role_audit_members_total", "Members handled by the reward role audit", ("result",))
+
+# Application command sync (command_sync)
+COMMAND_SYNCS = Counter("ayame_command_syncs_total", "Application command tree syncs by outcome (synced, skipped)", ("result",))
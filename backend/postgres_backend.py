@@ -0,0 +1,403 @@
+"""
+PostgreSQL storage backend (asyncpg).
+Same API and return shapes as AsyncDatabase, so several bot processes can
+share one database instead of a single-writer SQLite file. Enabled by
+setting DATABASE_URL; asyncpg is only needed when it is used.
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+PG_POOL_MIN = 1
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", 10))   # Connections per bot process
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_xp (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        xp BIGINT DEFAULT 0,
+        level BIGINT DEFAULT 0,
+        last_xp_time TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(guild_id, user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS activity_streaks (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        user_id BIGINT NOT NULL,
+        activity_name TEXT,
+        streak_count BIGINT DEFAULT 0,
+        last_activity_time TIMESTAMP,
+        UNIQUE(guild_id, user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id BIGINT PRIMARY KEY,
+        enabled BOOLEAN DEFAULT FALSE,
+        log_channel BIGINT,
+        target_role BIGINT,
+        auto_roles BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS custom_xp_roles (
+        id BIGSERIAL PRIMARY KEY,
+        guild_id BIGINT NOT NULL,
+        level BIGINT NOT NULL,
+        role_id BIGINT NOT NULL,
+        UNIQUE(guild_id, level)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS role_sync_jobs (
+        guild_id BIGINT NOT NULL,
+        level BIGINT NOT NULL,
+        role_id BIGINT NOT NULL,
+        old_role_id BIGINT,
+        cursor BIGINT DEFAULT 0,
+        added BIGINT DEFAULT 0,
+        removed BIGINT DEFAULT 0,
+        skipped BIGINT DEFAULT 0,
+        failed BIGINT DEFAULT 0,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (guild_id, level)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS role_audits (
+        guild_id BIGINT PRIMARY KEY,
+        cursor BIGINT DEFAULT 0,
+        finished_at BIGINT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_user_xp_user ON user_xp(user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_user_xp_rank ON user_xp(guild_id, xp DESC, user_id) INCLUDE (level)',
+    'CREATE INDEX IF NOT EXISTS idx_streaks_top ON activity_streaks(guild_id, streak_count DESC, user_id) INCLUDE (activity_name)',
+]
+
+CONFIG_FIELDS = ("enabled", "log_channel", "target_role", "auto_roles")
+ROLE_SYNC_FIELDS = ("guild_id", "level", "role_id", "old_role_id", "cursor", "added", "removed", "skipped", "failed")
+
+class PostgresBackend:
+    """
+    asyncpg pool implementing the StorageBackend protocol.
+    The pool and schema are created on first use, inside the running loop.
+    """
+
+    def __init__(self, dsn: str, min_size: int = PG_POOL_MIN, max_size: int = PG_POOL_MAX):
+        if asyncpg is None:
+            raise RuntimeError("DATABASE_URL is set but asyncpg is not installed (pip install asyncpg)")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def pool(self):
+        """Get the connection pool, creating it and the schema on first use."""
+        if self._pool is not None:
+            return self._pool
+        async with self._pool_lock:
+            if self._pool is None:
+                pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        for statement in SCHEMA:
+                            await conn.execute(statement)
+                self._pool = pool
+                logger.info(f"PostgreSQL pool ready ({self.min_size}-{self.max_size} connections)")
+        return self._pool
+
+    def close(self):
+        """Close all pooled connections."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    # User XP Methods
+    async def get_user_xp(self, guild_id: int, user_id: int) -> dict:
+        row = await (await self.pool()).fetchrow(
+            'SELECT xp, level, last_xp_time FROM user_xp WHERE guild_id = $1 AND user_id = $2',
+            guild_id, user_id
+        )
+        if row:
+            last_xp_time = row["last_xp_time"]
+            return {
+                "xp": row["xp"],
+                "level": row["level"],
+                # Same text form SQLite stores, so callers parse it the same way
+                "last_xp_time": last_xp_time.isoformat(" ") if last_xp_time else None
+            }
+        return {"xp": 0, "level": 0, "last_xp_time": None}
+
+    async def add_xp(self, guild_id: int, user_id: int, xp_amount: int) -> Tuple[bool, int]:
+        new_xp, new_level = await (await self.pool()).fetchrow('''
+            INSERT INTO user_xp (guild_id, user_id, xp, level, last_xp_time)
+            VALUES ($1, $2, $3::bigint, $3::bigint / 100, $4)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                xp = user_xp.xp + EXCLUDED.xp,
+                level = (user_xp.xp + EXCLUDED.xp) / 100,
+                last_xp_time = EXCLUDED.last_xp_time
+            RETURNING xp, level
+        ''', guild_id, user_id, xp_amount, datetime.now())
+        return new_level > (new_xp - xp_amount) // 100, new_level
+
+    async def get_leaderboard(self, guild_id: int, limit: int = 100) -> List[Tuple]:
+        rows = await (await self.pool()).fetch(
+            'SELECT user_id, xp, level FROM user_xp WHERE guild_id = $1 ORDER BY xp DESC LIMIT $2',
+            guild_id, limit
+        )
+        return [tuple(row) for row in rows]
+
+    async def get_leaderboard_page(self, guild_id: int, offset: int = 0, limit: int = 10) -> List[Tuple]:
+        # RANK() is evaluated over the whole guild before LIMIT/OFFSET apply
+        rows = await (await self.pool()).fetch('''
+            SELECT RANK() OVER (ORDER BY xp DESC), user_id, xp, level FROM user_xp
+            WHERE guild_id = $1
+            ORDER BY xp DESC, user_id
+            LIMIT $2 OFFSET $3
+        ''', guild_id, limit, offset)
+        return [tuple(row) for row in rows]
+
+    async def get_rank_and_neighbors(self, guild_id: int, user_id: int, radius: int = 2) -> Optional[dict]:
+        row = await (await self.pool()).fetchrow('''
+            SELECT
+                (SELECT COUNT(*) FROM user_xp WHERE guild_id = $1 AND xp > me.xp),
+                (SELECT COUNT(*) FROM user_xp WHERE guild_id = $1 AND xp = me.xp AND user_id < $2)
+            FROM user_xp AS me
+            WHERE me.guild_id = $1 AND me.user_id = $2
+        ''', guild_id, user_id)
+        if not row:
+            return None
+
+        above, tied_before = row
+        position = above + tied_before + 1
+        offset = max(0, position - 1 - radius)
+        return {
+            "rank": above + 1,
+            "position": position,
+            "neighbors": await self.get_leaderboard_page(guild_id, offset, radius * 2 + 1)
+        }
+
+    async def get_guild_xp_totals(self, guild_id: int) -> List[Tuple]:
+        rows = await (await self.pool()).fetch('SELECT user_id, xp FROM user_xp WHERE guild_id = $1', guild_id)
+        return [tuple(row) for row in rows]
+
+    async def get_user_levels(self, guild_id: int, min_level: int = 0, after_user_id: int = 0,
+                              limit: Optional[int] = None) -> List[Tuple]:
+        # LIMIT NULL means no limit
+        rows = await (await self.pool()).fetch('''
+            SELECT user_id, level FROM user_xp
+            WHERE guild_id = $1 AND user_id > $2 AND level >= $3
+            ORDER BY user_id
+            LIMIT $4
+        ''', guild_id, after_user_id, min_level, limit)
+        return [tuple(row) for row in rows]
+
+    async def get_user_rank(self, guild_id: int, user_id: int) -> Optional[int]:
+        return await (await self.pool()).fetchval('''
+            SELECT COUNT(*) + 1 FROM user_xp
+            WHERE guild_id = $1 AND xp > (
+                SELECT xp FROM user_xp WHERE guild_id = $1 AND user_id = $2
+            )
+        ''', guild_id, user_id)
+
+    async def get_total_users(self, guild_id: int) -> int:
+        return await (await self.pool()).fetchval('SELECT COUNT(*) FROM user_xp WHERE guild_id = $1', guild_id)
+
+    # Streak Methods
+    async def get_streak(self, guild_id: int, user_id: int) -> dict:
+        row = await (await self.pool()).fetchrow('''
+            SELECT activity_name, streak_count, last_activity_time FROM activity_streaks
+            WHERE guild_id = $1 AND user_id = $2
+        ''', guild_id, user_id)
+        if row:
+            return {"activity": row[0], "count": row[1], "last_time": row[2]}
+        return {"activity": None, "count": 0, "last_time": None}
+
+    async def update_streak(self, guild_id: int, user_id: int, activity_name: str, streak_count: int):
+        await (await self.pool()).execute('''
+            INSERT INTO activity_streaks (guild_id, user_id, activity_name, streak_count, last_activity_time)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                activity_name = EXCLUDED.activity_name,
+                streak_count = EXCLUDED.streak_count,
+                last_activity_time = EXCLUDED.last_activity_time
+        ''', guild_id, user_id, activity_name, streak_count, datetime.now())
+
+    async def get_top_streaks(self, guild_id: int, limit: int = 10) -> List[Tuple]:
+        rows = await (await self.pool()).fetch('''
+            SELECT user_id, activity_name, streak_count FROM activity_streaks
+            WHERE guild_id = $1 AND streak_count > 0
+            ORDER BY streak_count DESC
+            LIMIT $2
+        ''', guild_id, limit)
+        return [tuple(row) for row in rows]
+
+    # Batched Writes
+    async def apply_xp_batch(self, xp_rows: List[Tuple], streak_rows: List[Tuple]):
+        """
+        Apply coalesced XP deltas and streak updates in a single transaction.
+        Each table is one INSERT ... SELECT FROM unnest(...) round trip; rows
+        must be unique per (guild_id, user_id), which the write buffer ensures.
+        """
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                if xp_rows:
+                    await conn.execute('''
+                        INSERT INTO user_xp (guild_id, user_id, xp, level, last_xp_time)
+                        SELECT g, u, d, d / 100, t
+                        FROM unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::timestamp[]) AS r(g, u, d, t)
+                        ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                            xp = user_xp.xp + EXCLUDED.xp,
+                            level = (user_xp.xp + EXCLUDED.xp) / 100,
+                            last_xp_time = EXCLUDED.last_xp_time
+                    ''', *map(list, zip(*xp_rows)))
+                if streak_rows:
+                    await conn.execute('''
+                        INSERT INTO activity_streaks (guild_id, user_id, activity_name, streak_count, last_activity_time)
+                        SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::text[], $4::bigint[], $5::timestamp[])
+                        ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                            activity_name = EXCLUDED.activity_name,
+                            streak_count = EXCLUDED.streak_count,
+                            last_activity_time = EXCLUDED.last_activity_time
+                    ''', *map(list, zip(*streak_rows)))
+
+    # Guild Config Methods
+    async def get_guild_config(self, guild_id: int) -> dict:
+        row = await (await self.pool()).fetchrow(
+            'SELECT enabled, log_channel, target_role, auto_roles FROM guild_config WHERE guild_id = $1',
+            guild_id
+        )
+        if row:
+            return {
+                "enabled": bool(row[0]),
+                "log_channel": row[1],
+                "target_role": row[2],
+                "auto_roles": bool(row[3])
+            }
+        return {
+            "enabled": False,
+            "log_channel": None,
+            "target_role": None,
+            "auto_roles": False
+        }
+
+    async def get_enabled_guild_ids(self) -> List[int]:
+        rows = await (await self.pool()).fetch('SELECT guild_id FROM guild_config WHERE enabled')
+        return [row[0] for row in rows]
+
+    async def get_enabled_guild_configs(self) -> Dict[int, Tuple[dict, Dict[int, int]]]:
+        pool = await self.pool()
+        rows = await pool.fetch(
+            'SELECT guild_id, enabled, log_channel, target_role, auto_roles FROM guild_config WHERE enabled'
+        )
+        configs = {
+            row[0]: ({"enabled": row[1], "log_channel": row[2], "target_role": row[3], "auto_roles": row[4]}, {})
+            for row in rows
+        }
+        rows = await pool.fetch('''
+            SELECT r.guild_id, r.level, r.role_id FROM custom_xp_roles r
+            JOIN guild_config g ON g.guild_id = r.guild_id
+            WHERE g.enabled
+        ''')
+        for guild_id, level, role_id in rows:
+            configs[guild_id][1][level] = role_id
+        return configs
+
+    async def update_guild_config(self, guild_id: int, **kwargs):
+        fields = [key for key in kwargs if key in CONFIG_FIELDS]
+        if not fields:
+            return
+
+        values = [bool(kwargs[key]) if key in ("enabled", "auto_roles") else kwargs[key] for key in fields]
+        placeholders = ", ".join(f"${i}" for i in range(2, len(fields) + 2))
+        updates = ", ".join(f"{key} = EXCLUDED.{key}" for key in fields)
+        await (await self.pool()).execute(f'''
+            INSERT INTO guild_config (guild_id, {", ".join(fields)})
+            VALUES ($1, {placeholders})
+            ON CONFLICT (guild_id) DO UPDATE SET {updates}
+        ''', guild_id, *values)
+
+    # Custom Roles Methods
+    async def add_custom_role(self, guild_id: int, level: int, role_id: int):
+        await (await self.pool()).execute('''
+            INSERT INTO custom_xp_roles (guild_id, level, role_id)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (guild_id, level) DO UPDATE SET role_id = EXCLUDED.role_id
+        ''', guild_id, level, role_id)
+
+    async def get_custom_roles(self, guild_id: int) -> Dict[int, int]:
+        rows = await (await self.pool()).fetch(
+            'SELECT level, role_id FROM custom_xp_roles WHERE guild_id = $1', guild_id
+        )
+        return {level: role_id for level, role_id in rows}
+
+    async def remove_custom_role(self, guild_id: int, level: int):
+        await (await self.pool()).execute(
+            'DELETE FROM custom_xp_roles WHERE guild_id = $1 AND level = $2', guild_id, level
+        )
+
+    async def purge_guild(self, guild_id: int) -> Dict[str, int]:
+        deleted = {}
+        async with (await self.pool()).acquire() as conn:
+            async with conn.transaction():
+                for table in ("user_xp", "activity_streaks", "custom_xp_roles", "guild_config"):
+                    status = await conn.execute(f'DELETE FROM {table} WHERE guild_id = $1', guild_id)
+                    deleted[table] = int(status.split()[-1])
+                await conn.execute('DELETE FROM role_sync_jobs WHERE guild_id = $1', guild_id)
+                await conn.execute('DELETE FROM role_audits WHERE guild_id = $1', guild_id)
+
+        logger.info(f"Purged guild {guild_id}: {deleted}")
+        return deleted
+
+    # Role Sync Job Methods
+    async def save_role_sync_job(self, job: dict):
+        placeholders = ", ".join(f"${i}" for i in range(1, len(ROLE_SYNC_FIELDS) + 1))
+        updates = ", ".join(f"{field} = EXCLUDED.{field}" for field in ROLE_SYNC_FIELDS[2:])
+        await (await self.pool()).execute(f'''
+            INSERT INTO role_sync_jobs ({", ".join(ROLE_SYNC_FIELDS)})
+            VALUES ({placeholders})
+            ON CONFLICT (guild_id, level) DO UPDATE SET {updates}
+        ''', *[job[field] for field in ROLE_SYNC_FIELDS])
+
+    async def get_role_sync_jobs(self) -> List[dict]:
+        rows = await (await self.pool()).fetch(
+            f'SELECT {", ".join(ROLE_SYNC_FIELDS)} FROM role_sync_jobs ORDER BY started_at'
+        )
+        return [dict(row) for row in rows]
+
+    async def delete_role_sync_job(self, guild_id: int, level: int):
+        await (await self.pool()).execute(
+            'DELETE FROM role_sync_jobs WHERE guild_id = $1 AND level = $2', guild_id, level
+        )
+
+    # Role Audit Methods
+    async def get_role_audits(self) -> Dict[int, Tuple]:
+        rows = await (await self.pool()).fetch('SELECT guild_id, cursor, finished_at FROM role_audits')
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    async def save_role_audit(self, guild_id: int, cursor: int, finished_at: Optional[int] = None):
+        await (await self.pool()).execute('''
+            INSERT INTO role_audits (guild_id, cursor, finished_at)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (guild_id) DO UPDATE SET
+                cursor = EXCLUDED.cursor,
+                finished_at = COALESCE(EXCLUDED.finished_at, role_audits.finished_at)
+        ''', guild_id, cursor, finished_at)
@@ -1,18 +1,59 @@
 """
 Bot recovery system - restores XP system configuration on startup.
-Ensures guild settings and reward roles are maintained even after crashes.
+Ensures guild settings and reward roles are maintained even after crashes,
+and a background audit repairs members whose reward roles drifted.
+Startup recovery runs in the background; recovery_ready is set once it is done.
 """
 
+import time
+import asyncio
 import discord
 import logging
-from database import db
+from typing import List, Optional, Tuple
+import metrics
+from storage import StorageBackend, storage
+from guild_cache import guild_cache
+from role_sync import apply_role_plan, plan_member_roles
 
 logger = logging.getLogger(__name__)
 
+RECOVERY_NOTIFY_CONCURRENCY = 10  # Recovery notices in flight at once
+
+# Reward-role audit
+AUDIT_CHUNK_SIZE = 500           # user_xp rows streamed per query; the cursor is saved after each chunk
+AUDIT_INTERVAL_HOURS = 24        # A guild is audited again this long after its last full pass
+AUDIT_FIXES_PER_SECOND = 2       # Background pace, leaving the rate limit to level-ups and syncs
+AUDIT_QUEUE_SIZE = 100           # Fixes waiting for the worker before the reader pauses
+
+# Set once startup recovery has finished (the /ready endpoint and role audit wait on it)
+recovery_ready = asyncio.Event()
+_recovery_task: Optional[asyncio.Task] = None
+
+def start_recovery(bot: discord.Client, started: float) -> bool:
+    """
+    Run startup recovery in the background, once per process, so on_ready
+    doesn't wait on it. `started` is the process start (time.monotonic()).
+    """
+    global _recovery_task
+    if _recovery_task is not None:
+        return False
+    _recovery_task = asyncio.create_task(run_recovery(bot, started))
+    return True
+
+async def run_recovery(bot: discord.Client, started: float):
+    try:
+        await restore_guild_configs(bot)
+        await verify_bot_health(bot)
+    finally:
+        recovery_ready.set()
+        logger.info(f"✅ Ready {time.monotonic() - started:.1f}s after startup")
+
 async def restore_guild_configs(bot: discord.Client):
     """
     Restore all guild configurations on bot startup.
     This ensures XP system settings persist across crashes/restarts.
+    Every enabled guild's config and reward roles are loaded in one bulk
+    query and primed into the guild cache.
     """
     logger.info("🔄 Starting guild configuration recovery...")
     
@@ -20,110 +61,95 @@ async def restore_guild_configs(bot: discord.Client):
         # Wait for bot to be ready
         await bot.wait_until_ready()
         
-        restored_count = 0
+        configs = await storage.get_enabled_guild_configs()
+        guild_cache.prime(configs)
+        restored: List[Tuple[discord.Guild, dict]] = []
         
         for guild in bot.guilds:
+            # Skip if XP system not enabled
+            if guild.id not in configs:
+                continue
+            config, custom_roles = configs[guild.id]
+            
             try:
-                config = db.get_guild_config(guild.id)
-                
-                # Skip if XP system not enabled
-                if not config.get("enabled"):
-                    continue
-                
-                logger.info(f"📋 Restoring config for {guild.name} (ID: {guild.id})")
+                logger.debug(f"📋 Restoring config for {guild.name} (ID: {guild.id})")
                 
                 # Verify log channel still exists
                 log_channel_id = config.get("log_channel")
-                if log_channel_id:
-                    log_channel = guild.get_channel(log_channel_id)
-                    if not log_channel:
-                        logger.warning(f"⚠️ Log channel {log_channel_id} not found in {guild.name}")
-                        # Update config to remove invalid channel
-                        db.update_guild_config(guild.id, log_channel=None)
-                    else:
-                        logger.info(f"✅ Log channel verified: {log_channel.name}")
+                if log_channel_id and not guild.get_channel(log_channel_id):
+                    logger.warning(f"⚠️ Log channel {log_channel_id} not found in {guild.name}")
+                    # Update config to remove invalid channel
+                    await storage.update_guild_config(guild.id, log_channel=None)
+                    config["log_channel"] = None
+                    guild_cache.invalidate(guild.id)
                 
-                # Verify and restore reward roles
-                custom_roles = db.get_custom_roles(guild.id)
-                if custom_roles:
-                    valid_roles = 0
-                    invalid_roles = []
-                    
-                    for level_str, role_id in custom_roles.items():
-                        role = guild.get_role(role_id)
-                        if role:
-                            valid_roles += 1
-                            logger.info(f"  ✅ Level {level_str}: {role.name}")
-                        else:
-                            invalid_roles.append((level_str, role_id))
-                            logger.warning(f"  ⚠️ Level {level_str}: Role {role_id} not found")
-                    
-                    # Remove invalid roles from database
-                    for level_str, role_id in invalid_roles:
-                        db.remove_custom_role(guild.id, int(level_str))
-                    
-                    logger.info(f"📊 {guild.name}: {valid_roles} valid roles, {len(invalid_roles)} removed")
-                
-                restored_count += 1
+                # Remove reward roles that were deleted from the guild
+                invalid_levels = [level for level, role_id in custom_roles.items() if not guild.get_role(role_id)]
+                for level in invalid_levels:
+                    logger.warning(f"  ⚠️ Level {level}: Role {custom_roles[level]} not found in {guild.name}")
+                    await storage.remove_custom_role(guild.id, level)
+                if invalid_levels:
+                    guild_cache.invalidate(guild.id)
                 
+                logger.debug(f"📊 {guild.name}: {len(custom_roles) - len(invalid_levels)} valid roles, {len(invalid_levels)} removed")
+                restored.append((guild, config))
+            
             except Exception as e:
                 logger.error(f"❌ Error restoring config for {guild.name}: {e}")
         
-        logger.info(f"✅ Recovery complete: {restored_count} guilds restored")
+        logger.info(f"✅ Recovery complete: {len(restored)} guilds restored")
         
         # Send recovery notification to log channels
-        await notify_recovery(bot, restored_count)
-        
+        await notify_recovery(restored)
+    
     except Exception as e:
         logger.error(f"❌ Recovery failed: {e}")
 
-async def notify_recovery(bot: discord.Client, restored_count: int):
+async def notify_recovery(restored: List[Tuple[discord.Guild, dict]]):
     """
-    Send recovery notification to all configured log channels.
+    Send recovery notification to the log channel of every restored guild,
+    RECOVERY_NOTIFY_CONCURRENCY at a time.
     """
-    try:
-        notified = 0
+    limit = asyncio.Semaphore(RECOVERY_NOTIFY_CONCURRENCY)
+    
+    async def notify(guild: discord.Guild, log_channel) -> bool:
+        embed = discord.Embed(
+            title="🤖 Bot Recovery Complete",
+            description="Your XP system has been restored!",
+            color=discord.Color.green()
+        )
+        embed.add_field(
+            name="What was restored",
+            value="✅ Guild settings\n✅ Reward roles\n✅ User XP data",
+            inline=False
+        )
+        embed.add_field(
+            name="Status",
+            value=f"All systems operational",
+            inline=False
+        )
+        embed.set_footer(text="Use /help to see all commands")
         
-        for guild in bot.guilds:
-            config = db.get_guild_config(guild.id)
-            if not config.get("enabled"):
-                continue
-            
-            log_channel_id = config.get("log_channel")
-            if not log_channel_id:
-                continue
-            
-            log_channel = guild.get_channel(log_channel_id)
-            if not log_channel:
-                continue
-            
+        async with limit:
             try:
-                embed = discord.Embed(
-                    title="🤖 Bot Recovery Complete",
-                    description="Your XP system has been restored!",
-                    color=discord.Color.green()
-                )
-                embed.add_field(
-                    name="What was restored",
-                    value="✅ Guild settings\n✅ Reward roles\n✅ User XP data",
-                    inline=False
-                )
-                embed.add_field(
-                    name="Status",
-                    value=f"All systems operational",
-                    inline=False
-                )
-                embed.set_footer(text="Use /help to see all commands")
-                
                 await log_channel.send(embed=embed)
-                notified += 1
-                logger.info(f"📢 Recovery notification sent to {guild.name}")
-                
+                logger.debug(f"📢 Recovery notification sent to {guild.name}")
+                return True
             except Exception as e:
                 logger.warning(f"Could not send recovery notification to {guild.name}: {e}")
+                return False
+    
+    try:
+        sends = []
+        for guild, config in restored:
+            log_channel_id = config.get("log_channel")
+            log_channel = guild.get_channel(log_channel_id) if log_channel_id else None
+            if log_channel:
+                sends.append(notify(guild, log_channel))
         
+        notified = sum(await asyncio.gather(*sends))
         logger.info(f"📢 Recovery notifications sent to {notified} channels")
-        
+    
     except Exception as e:
         logger.error(f"Error sending recovery notifications: {e}")
 
@@ -135,8 +161,8 @@ async def verify_bot_health(bot: discord.Client):
     logger.info("🏥 Running health check...")
     
     try:
-        # Check database connectivity
-        test_config = db.get_guild_config(0)
+        # Check database connectivity (one bulk query for every enabled guild)
+        configs = await storage.get_enabled_guild_configs()
         logger.info("✅ Database: OK")
         
         # Check bot connection
@@ -149,12 +175,12 @@ async def verify_bot_health(bot: discord.Client):
         # Check for any corrupted data
         issues_found = 0
         for guild in bot.guilds:
-            config = db.get_guild_config(guild.id)
-            if config.get("enabled"):
-                custom_roles = db.get_custom_roles(guild.id)
-                for level_str, role_id in custom_roles.items():
+            if guild.id in configs:
+                custom_roles = configs[guild.id][1]
+                for role_id in custom_roles.values():
                     if not guild.get_role(role_id):
                         issues_found += 1
+
         
         if issues_found > 0:
             logger.warning(f"⚠️ Found {issues_found} invalid roles across guilds")
@@ -167,3 +193,134 @@ async def verify_bot_health(bot: discord.Client):
     except Exception as e:
         logger.error(f"❌ Health check failed: {e}")
         return False
+
+class RoleAudit:
+    """
+    Background pass that checks members hold the reward role for their
+    stored level. It streams user_xp per guild in keyset chunks, compares
+    it with cached member roles, and queues only the members that drifted
+    to a single paced worker. Progress is checkpointed per guild, so the
+    pass picks up where it stopped after a restart.
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.storage = backend
+        self.task: Optional[asyncio.Task] = None
+        # Guilds where the bot lacks permission; their remaining fixes are dropped
+        self._forbidden = set()
+
+    def start(self, bot: discord.Client) -> bool:
+        """Start a pass in the background unless one is already running."""
+        if self.task is not None and not self.task.done():
+            return False
+        self.task = asyncio.create_task(self.run(bot))
+        return True
+
+    async def run(self, bot: discord.Client):
+        try:
+            await bot.wait_until_ready()
+            # Audit against restored configs, not ones recovery is about to fix
+            await recovery_ready.wait()
+            started = time.monotonic()
+            configs = await self.storage.get_enabled_guild_configs()
+            audits = await self.storage.get_role_audits()
+            due_before = time.time() - AUDIT_INTERVAL_HOURS * 3600
+            queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+            worker = asyncio.create_task(self._worker(bot, queue))
+            self._forbidden.clear()
+
+            audited = checked = queued = 0
+            try:
+                # Only enabled guilds with reward roles have anything to audit
+                for guild_id, (config, custom_roles) in configs.items():
+                    guild = bot.get_guild(guild_id)
+                    if guild is None or guild.unavailable or not custom_roles:
+                        continue
+                    cursor, finished_at = audits.get(guild_id, (0, None))
+                    # cursor > 0: interrupted mid-guild, always resume
+                    if cursor == 0 and finished_at and finished_at > due_before:
+                        continue
+                    guild_checked, guild_queued = await self.audit_guild(guild, cursor, queue)
+                    audited += 1
+                    checked += guild_checked
+                    queued += guild_queued
+            finally:
+                worker.cancel()
+
+            if audited:
+                logger.info(
+                    f"🔍 Role audit: {audited} guild(s), {checked} member(s) checked, "
+                    f"{queued} fix(es) queued in {time.monotonic() - started:.1f}s"
+                )
+        except Exception as e:
+            logger.error(f"❌ Role audit failed: {e}")
+
+    async def audit_guild(self, guild: discord.Guild, cursor: int, queue: asyncio.Queue):
+        """Audit one guild from `cursor` on. Returns (members checked, fixes queued)."""
+        settings = await guild_cache.get(guild.id)
+        if not settings.config.get("enabled") or not settings.ladder:
+            # Disabled or its reward roles removed since the configs were read
+            return 0, 0
+
+        checked = queued = 0
+        # Below the first reward level there is nothing to hold
+        min_level = settings.ladder.levels[0]
+        while guild.id not in self._forbidden:
+            rows = await self.storage.get_user_levels(guild.id, min_level, cursor, AUDIT_CHUNK_SIZE)
+            if not rows:
+                break
+            for user_id, level in rows:
+                member = guild.get_member(user_id)
+                if member is None:
+                    continue
+                checked += 1
+                if plan_member_roles(member, level, settings.ladder) is not None:
+                    # The worker plans the fix again when its turn comes
+                    await queue.put((guild.id, user_id, level))
+                    queued += 1
+            metrics.ROLE_AUDIT_MEMBERS.inc("checked", amount=len(rows))
+            # Only checkpoint once this chunk's fixes are applied
+            await queue.join()
+            cursor = rows[-1][0]
+            await self.storage.save_role_audit(guild.id, cursor)
+
+        await self.storage.save_role_audit(guild.id, 0, int(time.time()))
+        if queued:
+            logger.info(f"🔍 Role audit for {guild.name}: {queued} member(s) out of sync")
+        return checked, queued
+
+    async def _worker(self, bot: discord.Client, queue: asyncio.Queue):
+        """
+        Apply queued fixes one at a time, AUDIT_FIXES_PER_SECOND at most.
+        A fix can wait in the queue for a while, so the member, the reward
+        roles and the stored level are all read again just before the edit.
+        """
+        while True:
+            guild_id, user_id, level = await queue.get()
+            try:
+                guild = bot.get_guild(guild_id)
+                member = guild.get_member(user_id) if guild is not None else None
+                if member is None or guild_id in self._forbidden:
+                    continue
+                settings = await guild_cache.get(guild_id)
+                stored = await self.storage.get_user_xp(guild_id, user_id)
+                plan = plan_member_roles(member, max(level, stored["level"]), settings.ladder)
+                if plan is None:
+                    # Fixed meanwhile, by a level-up or a moderator
+                    metrics.ROLE_AUDIT_MEMBERS.inc("skipped")
+                    continue
+                await apply_role_plan(plan, reason="Reward role audit")
+                metrics.ROLE_AUDIT_MEMBERS.inc("fixed")
+            except discord.Forbidden as e:
+                self._forbidden.add(guild_id)
+                metrics.ROLE_AUDIT_MEMBERS.inc("failed")
+                logger.warning(f"⚠️ Role audit skipping {guild.name}: {e}")
+            except Exception as e:
+                metrics.ROLE_AUDIT_MEMBERS.inc("failed")
+                logger.warning(f"⚠️ Role audit could not fix member {user_id} in {guild_id}: {e}")
+            finally:
+                queue.task_done()
+            await asyncio.sleep(1 / AUDIT_FIXES_PER_SECOND)
+
+# Global reward-role audit
+role_audit = RoleAudit(storage)
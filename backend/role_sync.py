@@ -0,0 +1,255 @@
+"""
+Reward-role reconciliation and background sync.
+A member's target roles come from the reward ladder: the highest reward role
+their level qualifies for and no other reward role. Any change is applied in
+a single member.edit(roles=...) call, for level-ups and syncs alike.
+
+When a reward role is set or replaced, a background job reconciles every
+member at that level or above. Each member is diffed just before their
+edit, so members who are already correct are skipped and nobody gets a role
+list that went stale while the job waited; edits run with bounded concurrency
+per guild (member edits share one per-guild rate-limit bucket; discord.py
+waits out 429s). Progress is checkpointed by user_id so a restart resumes
+the job.
+"""
+
+import asyncio
+import os
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+import metrics
+from storage import StorageBackend, storage
+from guild_cache import guild_cache
+
+logger = logging.getLogger(__name__)
+
+ROLE_SYNC_CONCURRENCY = int(os.getenv("ROLE_SYNC_CONCURRENCY", 4))   # Member edits in flight per guild
+CHECKPOINT_EVERY = 50          # Members per chunk; the cursor is saved after each
+PROGRESS_SECONDS = 5           # Minimum time between progress callbacks
+
+class RoleSyncJob:
+    """State of one (guild, level) sync; the counters and cursor are checkpointed."""
+    __slots__ = ("guild_id", "level", "role_id", "old_role_id", "cursor",
+                 "added", "removed", "skipped", "failed", "done", "total", "finished")
+
+    def __init__(self, guild_id: int, level: int, role_id: int, old_role_id: Optional[int] = None,
+                 cursor: int = 0, added: int = 0, removed: int = 0, skipped: int = 0, failed: int = 0):
+        self.guild_id = guild_id
+        self.level = level
+        self.role_id = role_id
+        self.old_role_id = old_role_id
+        # Every member with user_id <= cursor has been handled
+        self.cursor = cursor
+        self.added = added
+        self.removed = removed
+        self.skipped = skipped
+        self.failed = failed
+        # Members handled / planned in this run (not persisted)
+        self.done = 0
+        self.total = 0
+        self.finished = False
+
+    def as_row(self) -> dict:
+        return {
+            "guild_id": self.guild_id, "level": self.level, "role_id": self.role_id,
+            "old_role_id": self.old_role_id, "cursor": self.cursor, "added": self.added,
+            "removed": self.removed, "skipped": self.skipped, "failed": self.failed
+        }
+
+ProgressCallback = Callable[[RoleSyncJob], Awaitable[None]]
+
+class RolePlan:
+    """One member's reward-role change, applied as a single member.edit call."""
+    __slots__ = ("member", "roles", "added", "removed")
+
+    def __init__(self, member, roles: list, added, removed: list):
+        self.member = member
+        # Full role list to send (without @everyone, which is implicit)
+        self.roles = roles
+        self.added = added
+        self.removed = removed
+
+    @property
+    def calls_replaced(self) -> int:
+        """API calls the old per-role path needed: one remove_roles per role, one add_roles."""
+        return len(self.removed) + (self.added is not None)
+
+def plan_member_roles(member, level: int, ladder, stale_role_ids: Iterable[int] = ()) -> Optional[RolePlan]:
+    """
+    Target state for a member at `level`: the highest reward role they qualify
+    for and no other reward role (nor any stale one, e.g. a replaced reward
+    role). None if they already match, or don't qualify for any reward role.
+    """
+    qualified = ladder.current_for(level)
+    if qualified is None:
+        return None
+    target = member.guild.get_role(qualified[1])
+    if target is None:
+        return None
+
+    other_rewards = set(ladder.role_ids)
+    other_rewards.update(stale_role_ids)
+    other_rewards.discard(target.id)
+    roles = member.roles
+    removed = [r for r in roles if r.id in other_rewards]
+    added = None if target in roles else target
+    if added is None and not removed:
+        return None
+
+    new_roles = [r for r in roles if not r.is_default() and r.id not in other_rewards]
+    if added is not None:
+        new_roles.append(added)
+    return RolePlan(member, new_roles, added, removed)
+
+async def apply_role_plan(plan: RolePlan, reason: Optional[str] = None):
+    """Apply a RolePlan in one request instead of one per role changed."""
+    await plan.member.edit(roles=plan.roles, reason=reason)
+    metrics.ROLE_API_CALLS_SAVED.inc(amount=plan.calls_replaced - 1)
+
+async def reconcile_member_roles(member, level: int, ladder, stale_role_ids: Iterable[int] = (),
+                                 reason: Optional[str] = None) -> Optional[RolePlan]:
+    """Bring a member's reward roles in line with their level. Returns the applied plan, or None."""
+    plan = plan_member_roles(member, level, ladder, stale_role_ids)
+    if plan is not None:
+        await apply_role_plan(plan, reason)
+    return plan
+
+class RoleSyncEngine:
+    def __init__(self, backend: StorageBackend, concurrency: int = ROLE_SYNC_CONCURRENCY):
+        self.storage = backend
+        self.concurrency = concurrency
+        self.tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        self.jobs: Dict[Tuple[int, int], RoleSyncJob] = {}
+        self._limits: Dict[int, asyncio.Semaphore] = {}
+
+    def running(self, guild_id: int) -> List[RoleSyncJob]:
+        return [job for (gid, _), job in self.jobs.items() if gid == guild_id]
+
+    async def start(self, guild, level: int, role, old_role=None,
+                    progress: Optional[ProgressCallback] = None) -> RoleSyncJob:
+        """Checkpoint a new job and run it in the background, replacing any job for the same level."""
+        key = (guild.id, level)
+        previous = self.tasks.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        job = RoleSyncJob(guild.id, level, role.id, old_role.id if old_role else None)
+        await self.storage.save_role_sync_job(job.as_row())
+        self._spawn(guild, job, progress)
+        return job
+
+    async def resume(self, bot) -> int:
+        """
+        Restart the checkpointed jobs of guilds this process sees. A job whose
+        reward role was deleted is dropped; jobs of guilds that are missing
+        or unavailable are kept for later.
+        """
+        resumed = 0
+        for row in await self.storage.get_role_sync_jobs():
+            job = RoleSyncJob(**row)
+            guild = bot.get_guild(job.guild_id)
+            if guild is None or guild.unavailable:
+                # Another shard's guild, or one in an outage: the checkpoint waits for it
+                continue
+            if guild.get_role(job.role_id) is None:
+                await self.storage.delete_role_sync_job(job.guild_id, job.level)
+                continue
+            if (job.guild_id, job.level) not in self.tasks:
+                self._spawn(guild, job, None)
+                resumed += 1
+        return resumed
+
+    def cancel_guild(self, guild_id: int):
+        for key in [key for key in self.tasks if key[0] == guild_id]:
+            self.tasks.pop(key).cancel()
+            self.jobs.pop(key, None)
+
+    def _spawn(self, guild, job: RoleSyncJob, progress: Optional[ProgressCallback]):
+        key = (job.guild_id, job.level)
+        self.jobs[key] = job
+        task = self.tasks[key] = asyncio.create_task(self._run(guild, job, progress))
+        task.add_done_callback(lambda t, key=key: self._forget(key, t))
+
+    def _forget(self, key: Tuple[int, int], task: asyncio.Task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+            self.jobs.pop(key, None)
+
+    async def _run(self, guild, job: RoleSyncJob, progress: Optional[ProgressCallback]):
+        started = time.monotonic()
+        stale = (job.old_role_id,) if job.old_role_id else ()
+        limit = self._limits.setdefault(guild.id, asyncio.Semaphore(self.concurrency))
+        reason = f"Reward role for Level {job.level}"
+
+        try:
+            rows = await self.storage.get_user_levels(guild.id, job.level, job.cursor)
+            job.total = len(rows)
+            logger.info(f"Role sync for {guild.name} level {job.level}: {len(rows)} member(s) from user {job.cursor}")
+
+            async def edit(user_id: int, level: int):
+                async with limit:
+                    # Planned only now, from the member as cached at this point:
+                    # their roles may have changed while the edit waited its turn
+                    member = guild.get_member(user_id)
+                    if member is None:
+                        return
+                    ladder = (await guild_cache.get(guild.id)).ladder
+                    # `level` was read when the job started; a level-up since then
+                    # already handed out its reward role, which must not be taken back
+                    held = [reward_level for reward_level, role_id in ladder if member.get_role(role_id)]
+                    plan = plan_member_roles(member, max([level, *held]), ladder, stale)
+                    if plan is None:
+                        job.skipped += 1
+                        metrics.ROLE_SYNC_MEMBERS.inc("skipped")
+                        return
+                    try:
+                        await apply_role_plan(plan, reason)
+                    except discord.Forbidden:
+                        raise
+                    except Exception as e:
+                        job.failed += 1
+                        metrics.ROLE_SYNC_MEMBERS.inc("failed")
+                        logger.error(f"Failed to sync reward role for {member.name}: {e}")
+                        return
+                # Counted from the plan: the member cache only catches up with the gateway event
+                job.added += plan.added is not None and plan.added.id == job.role_id
+                job.removed += any(r.id == job.old_role_id for r in plan.removed)
+                metrics.ROLE_SYNC_MEMBERS.inc("edited")
+
+            last_report = time.monotonic()
+            for start in range(0, len(rows), CHECKPOINT_EVERY):
+                chunk = rows[start:start + CHECKPOINT_EVERY]
+                # Members already correct cost no request, only a diff
+                await asyncio.gather(*(edit(user_id, level) for user_id, level in chunk))
+                job.done += len(chunk)
+                job.cursor = chunk[-1][0]
+                await self.storage.save_role_sync_job(job.as_row())
+                if progress is not None and time.monotonic() - last_report >= PROGRESS_SECONDS:
+                    last_report = time.monotonic()
+                    await progress(job)
+        except discord.Forbidden as e:
+            # Missing permissions or role hierarchy: every other member would fail too
+            logger.error(f"Role sync for {guild.name} level {job.level} stopped: {e}")
+            job.failed += 1
+        except asyncio.CancelledError:
+            # Replaced by a newer job for the level, or the guild was reset
+            raise
+        except Exception as e:
+            # The checkpoint stays, so the job resumes on the next restart
+            logger.error(f"Role sync for {guild.name} level {job.level} failed: {e}")
+            return
+
+        job.finished = True
+        await self.storage.delete_role_sync_job(job.guild_id, job.level)
+        logger.info(
+            f"Role sync for {guild.name} level {job.level} done in {time.monotonic() - started:.1f}s: "
+            f"added={job.added} removed={job.removed} skipped={job.skipped} failed={job.failed}"
+        )
+        if progress is not None:
+            await progress(job)
+
+# Global role sync engine
+role_sync = RoleSyncEngine(storage)
@@ -0,0 +1,46 @@
+"""
+Sampled, lazily formatted logging for high-volume event handlers.
+Each event is tagged with a reason; only 1 in N events per reason is
+written (at DEBUG, formatted only if DEBUG is enabled), and a periodic
+summary line reports how many events of each reason were seen.
+"""
+
+import logging
+import time
+from typing import Dict, Optional
+
+DEFAULT_SAMPLE_EVERY = 100     # Log 1 in N events of a reason unless overridden
+
+class SampledLogger:
+    def __init__(self, logger: logging.Logger, sample_every: Optional[Dict[str, int]] = None,
+                 default_every: int = DEFAULT_SAMPLE_EVERY, level: int = logging.DEBUG):
+        self.logger = logger
+        self.sample_every = sample_every or {}
+        self.default_every = default_every
+        self.level = level
+        # Counts since the last summary, and since start for sampling
+        self._window: Dict[str, int] = {}
+        self._seen: Dict[str, int] = {}
+        self._window_started = time.monotonic()
+
+    def event(self, reason: str, msg: str, *args):
+        """Count an event; log it (lazily formatted) if it is this reason's Nth."""
+        seen = self._seen.get(reason, 0)
+        self._seen[reason] = seen + 1
+        self._window[reason] = self._window.get(reason, 0) + 1
+        if seen % self.sample_every.get(reason, self.default_every):
+            return
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "[%s #%d] " + msg, reason, seen + 1, *args)
+
+    def summary(self, title: str) -> Optional[str]:
+        """Log and reset the per-reason counts for the current window."""
+        if not self._window:
+            return None
+        elapsed = time.monotonic() - self._window_started
+        counts = " ".join(f"{reason}={count}" for reason, count in sorted(self._window.items()))
+        line = f"📊 {title} ({elapsed:.0f}s): {counts}"
+        self.logger.info(line)
+        self._window = {}
+        self._window_started = time.monotonic()
+        return line
@@ -0,0 +1,101 @@
+"""
+Bounded presence state for activity XP.
+One small record per (guild, member) with a tracked activity: the last
+processed activity fingerprint and the activity that was logged. Records
+live in recency order, expire after SESSION_TTL without a presence update
+and are capped at MAX_SESSIONS, oldest evicted first.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import metrics
+from award_scheduler import award_scheduler
+
+SESSION_TTL = 3 * 3600         # Seconds without a presence update or award before a record expires
+MAX_SESSIONS = int(os.getenv("PRESENCE_MAX_SESSIONS", 200000))
+
+def session_key(guild_id: int, user_id: int) -> int:
+    """Pack two snowflakes into one int (snowflakes fit in 64 bits)."""
+    return (guild_id << 64) | user_id
+
+class PresenceState:
+    """What was last processed for one member in one guild."""
+    __slots__ = ("fingerprint", "current", "touched")
+
+    def __init__(self, touched: float):
+        self.fingerprint = None
+        # Tracked name of the logged activity, e.g. "Playing: Minecraft"
+        self.current = None
+        self.touched = touched
+
+class SessionStore:
+    """LRU of PresenceState records with TTL expiry and a hard cap."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = MAX_SESSIONS,
+                 on_evict: Optional[Callable[[int, int], object]] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Called with (guild_id, user_id) when a record expires or is pushed out
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[int, PresenceState]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[PresenceState]:
+        """Record for a member, marking it recently seen, or None."""
+        key = session_key(guild_id, user_id)
+        state = self._entries.get(key)
+        if state is not None:
+            state.touched = time.monotonic()
+            self._entries.move_to_end(key)
+        return state
+
+    def ensure(self, guild_id: int, user_id: int) -> PresenceState:
+        """Record for a member, created if missing."""
+        state = self.get(guild_id, user_id)
+        if state is not None:
+            return state
+        now = time.monotonic()
+        self.expire(now)
+        while len(self._entries) >= self.max_entries:
+            self._evict("cap")
+        state = self._entries[session_key(guild_id, user_id)] = PresenceState(now)
+        return state
+
+    def discard(self, guild_id: int, user_id: int) -> Optional[PresenceState]:
+        return self._entries.pop(session_key(guild_id, user_id), None)
+
+    def discard_guild(self, guild_id: int) -> int:
+        keys = [key for key in self._entries if key >> 64 == guild_id]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Evict records not seen for ttl seconds; cost is proportional to the evictions."""
+        deadline = (time.monotonic() if now is None else now) - self.ttl
+        expired = 0
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest.touched > deadline:
+                break
+            self._evict("ttl")
+            expired += 1
+        return expired
+
+    def _evict(self, reason: str):
+        key, _ = self._entries.popitem(last=False)
+        metrics.PRESENCE_SESSIONS_EVICTED.inc(reason)
+        if self.on_evict is not None:
+            self.on_evict(key >> 64, key & 0xFFFFFFFFFFFFFFFF)
+
+    def clear(self):
+        self._entries.clear()
+
+# Global presence state; evicting a member also ends their award session
+presence_sessions = SessionStore(on_evict=award_scheduler.stop)
+metrics.Gauge("ayame_presence_sessions", "Members with tracked presence state", lambda: len(presence_sessions))
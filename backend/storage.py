@@ -0,0 +1,80 @@
+"""
+Storage backend selection.
+The bot reads and writes XP, streaks, guild config and reward roles through
+the StorageBackend protocol. SQLite (AsyncDatabase) is the default; setting
+DATABASE_URL to a postgres:// URL switches to PostgresBackend so several bot
+processes can share one database.
+"""
+
+import os
+import logging
+from typing import Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+from database import AsyncDatabase, async_db
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """Async storage API shared by every backend. Return shapes match AsyncDatabase."""
+
+    # User XP
+    async def get_user_xp(self, guild_id: int, user_id: int) -> dict: ...
+    async def add_xp(self, guild_id: int, user_id: int, xp_amount: int) -> Tuple[bool, int]: ...
+    async def get_leaderboard(self, guild_id: int, limit: int = 100) -> List[Tuple]: ...
+    async def get_leaderboard_page(self, guild_id: int, offset: int = 0, limit: int = 10) -> List[Tuple]: ...
+    async def get_rank_and_neighbors(self, guild_id: int, user_id: int, radius: int = 2) -> Optional[dict]: ...
+    async def get_guild_xp_totals(self, guild_id: int) -> List[Tuple]: ...
+    async def get_user_levels(self, guild_id: int, min_level: int = 0, after_user_id: int = 0,
+                              limit: Optional[int] = None) -> List[Tuple]: ...
+    async def get_user_rank(self, guild_id: int, user_id: int) -> Optional[int]: ...
+    async def get_total_users(self, guild_id: int) -> int: ...
+
+    # Streaks
+    async def get_streak(self, guild_id: int, user_id: int) -> dict: ...
+    async def update_streak(self, guild_id: int, user_id: int, activity_name: str, streak_count: int): ...
+    async def get_top_streaks(self, guild_id: int, limit: int = 10) -> List[Tuple]: ...
+
+    # Batched writes: xp_rows (guild_id, user_id, xp_delta, last_xp_time),
+    # streak_rows (guild_id, user_id, activity_name, streak_count, last_activity_time)
+    async def apply_xp_batch(self, xp_rows: List[Tuple], streak_rows: List[Tuple]): ...
+
+    # Guild config and reward roles
+    async def get_guild_config(self, guild_id: int) -> dict: ...
+    async def get_enabled_guild_ids(self) -> List[int]: ...
+    async def get_enabled_guild_configs(self) -> Dict[int, Tuple[dict, Dict[int, int]]]: ...
+    async def update_guild_config(self, guild_id: int, **kwargs): ...
+    async def add_custom_role(self, guild_id: int, level: int, role_id: int): ...
+    async def get_custom_roles(self, guild_id: int) -> Dict[int, int]: ...
+    async def remove_custom_role(self, guild_id: int, level: int): ...
+    async def purge_guild(self, guild_id: int) -> Dict[str, int]: ...
+
+    # Role sync checkpoints, keyed by (guild_id, level); see database.ROLE_SYNC_FIELDS
+    async def save_role_sync_job(self, job: dict): ...
+    async def get_role_sync_jobs(self) -> List[dict]: ...
+    async def delete_role_sync_job(self, guild_id: int, level: int): ...
+
+    # Reward-role audit progress: {guild_id: (cursor, finished_at unix time)}
+    async def get_role_audits(self) -> Dict[int, Tuple]: ...
+    async def save_role_audit(self, guild_id: int, cursor: int, finished_at: Optional[int] = None): ...
+
+    def close(self): ...
+
+def create_storage(url: str = DATABASE_URL) -> StorageBackend:
+    """Backend for a database URL; empty means the local SQLite file."""
+    if not url:
+        return async_db
+    if url.startswith(("postgres://", "postgresql://")):
+        from postgres_backend import PostgresBackend
+        logger.info("Using PostgreSQL storage backend")
+        return PostgresBackend(url)
+    raise ValueError(f"Unsupported DATABASE_URL scheme: {url.split(':', 1)[0]}")
+
+def is_sqlite(backend: StorageBackend) -> bool:
+    """Snapshots and NDJSON backups only exist for the SQLite backend."""
+    return isinstance(backend, AsyncDatabase)
+
+# Global storage instance
+storage = create_storage()
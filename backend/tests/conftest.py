@@ -0,0 +1,103 @@
+"""
+Shared fixtures and Discord stand-ins. Run from backend/:
+
+    python -m pytest tests
+
+Set DATABASE_URL to a PostgreSQL URL (and install asyncpg) to also run the
+storage conformance suite against PostgresBackend. It works in a scratch
+schema that is dropped afterwards.
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+import discord
+import pytest
+from discord.utils import SnowflakeList
+
+# Only the conformance suite talks to PostgreSQL; everything else (and the
+# global storage instance) stays on SQLite
+POSTGRES_URL = os.environ.pop("DATABASE_URL", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database creates its global instance on import; keep it out of the working tree
+os.chdir(tempfile.mkdtemp(prefix="ayame-tests-"))
+
+from database import AsyncDatabase, Database
+
+# Discord stand-ins: guilds with a log channel and reward roles for levels 5 and 10
+GUILD_ID = 100
+ROLE_5 = 105
+ROLE_10 = 110
+LOG_CHANNEL = 200
+USERS = range(1, 7)
+
+@pytest.fixture
+def postgres_url():
+    if not POSTGRES_URL.startswith(("postgres://", "postgresql://")):
+        pytest.skip("DATABASE_URL is not a PostgreSQL URL")
+    pytest.importorskip("asyncpg")
+    return POSTGRES_URL
+
+@pytest.fixture
+def database(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    yield db
+    db.close()
+
+@pytest.fixture
+def adb(database):
+    async_database = AsyncDatabase(database)
+    yield async_database
+    async_database.close()
+
+class RateLimitedHTTP:
+    """
+    Stand-in for discord.py's HTTPClient: member edits share one bucket and
+    go out one per `interval`. The member cache is updated once an edit
+    lands, as the GUILD_MEMBER_UPDATE that follows would.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.bucket = asyncio.Lock()
+        self.guilds = {}
+        self.edits = []
+        self.on_edit = None
+
+    async def edit_member(self, guild_id, user_id, *, reason=None, **fields):
+        async with self.bucket:
+            await asyncio.sleep(self.interval)
+            self.edits.append((user_id, sorted(fields["roles"])))
+            self.guilds[guild_id].get_member(user_id)._roles = SnowflakeList(fields["roles"])
+        if self.on_edit is not None:
+            self.on_edit(user_id)
+        return member_data(user_id, fields["roles"])
+
+def member_data(user_id: int, roles=()) -> dict:
+    return {
+        "user": {"id": user_id, "username": f"user-{user_id}", "discriminator": "0", "avatar": None},
+        "roles": list(roles), "joined_at": None, "deaf": False, "mute": False, "flags": 0,
+    }
+
+def make_guild(state, guild_id: int = GUILD_ID) -> discord.Guild:
+    roles = [
+        {"id": role_id, "name": name, "permissions": "0", "position": position, "color": 0,
+         "hoist": False, "managed": False, "mentionable": False}
+        for position, (role_id, name) in enumerate([(guild_id, "@everyone"), (ROLE_5, "Level 5"), (ROLE_10, "Level 10")])
+    ]
+    guild = discord.Guild(state=state, data={
+        "id": guild_id, "name": f"guild-{guild_id}", "roles": roles, "emojis": [], "stickers": [],
+        "channels": [{"id": LOG_CHANNEL, "type": 0, "name": "xp-log", "position": 0, "permission_overwrites": []}],
+    })
+    for user_id in USERS:
+        guild._add_member(discord.Member(state=state, guild=guild, data=member_data(user_id)))
+    state.http.guilds[guild_id] = guild
+    return guild
+
+def make_state() -> discord.Client:
+    client = discord.Client(intents=discord.Intents.all())
+    client._connection.http = RateLimitedHTTP()
+    return client
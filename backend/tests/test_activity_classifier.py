@@ -0,0 +1,69 @@
+import discord
+
+import activity_classifier
+from activity_classifier import CACHE_MAX_ENTRIES, CACHE_TTL, ClassificationCache
+
+MINECRAFT = (discord.Game("Minecraft"),)
+TERRARIA = (discord.Game("Terraria"),)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def test_classification_is_reused_until_it_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(activity_classifier, "time", clock)
+    cache = ClassificationCache()
+
+    first = cache.classify(1, MINECRAFT)
+    clock.now += CACHE_TTL - 0.1
+    reused = cache.classify(1, MINECRAFT)
+    clock.now += 0.1
+    expired = cache.classify(1, MINECRAFT)
+
+    assert reused is first
+    assert expired is not first and expired.name == first.name == "Playing: Minecraft"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_full_cache_sweeps_expired_entries_then_everything(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(activity_classifier, "time", clock)
+    cache = ClassificationCache()
+    assert cache.max_entries == CACHE_MAX_ENTRIES == 10000
+
+    half = CACHE_MAX_ENTRIES // 2
+    for user_id in range(half):
+        cache.classify(user_id, MINECRAFT)
+    clock.now += CACHE_TTL
+    for user_id in range(half, CACHE_MAX_ENTRIES):
+        cache.classify(user_id, MINECRAFT)
+    # Full: the expired half is swept to make room
+    cache.classify(CACHE_MAX_ENTRIES, MINECRAFT)
+    swept = len(cache)
+
+    for user_id in range(CACHE_MAX_ENTRIES + 1, CACHE_MAX_ENTRIES + half):
+        cache.classify(user_id, MINECRAFT)
+    # Full of fresh entries: nothing to sweep, so everything goes
+    cache.classify(2 * CACHE_MAX_ENTRIES, MINECRAFT)
+
+    assert swept == half + 1
+    assert len(cache) == 1
+
+def test_new_activity_is_classified_again_for_every_mutual_guild(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(activity_classifier, "time", clock)
+    cache = ClassificationCache()
+
+    # discord.py dispatches the same update once per mutual guild
+    before = [cache.classify(1, MINECRAFT) for _ in range(3)]
+    after = [cache.classify(1, TERRARIA) for _ in range(3)]
+    # Another member with the same game doesn't share the result
+    other = cache.classify(2, TERRARIA)
+
+    assert [c.name for c in before] == ["Playing: Minecraft"] * 3
+    assert [c.name for c in after] == ["Playing: Terraria"] * 3
+    assert all(c is after[0] for c in after) and other is not after[0]
+    assert (cache.hits, cache.misses) == (4, 3)
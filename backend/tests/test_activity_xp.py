@@ -0,0 +1,147 @@
+import asyncio
+
+import discord
+
+from award_scheduler import award_scheduler
+from activity_classifier import activity_fingerprint, classify_activities
+from cogs import activity_xp
+from cogs.activity_xp import ActivityXP
+from conftest import GUILD_ID, LOG_CHANNEL, make_guild, make_state, member_data
+from guild_cache import guild_cache
+from session_store import presence_sessions
+from storage import storage
+
+SEED_GUILD = GUILD_ID + 10
+RESET_GUILD = GUILD_ID + 20
+PREFILTER_GUILD = GUILD_ID + 30
+BOT_USER = 99  # Not a conftest member, so the cached user doesn't override its bot flag
+
+class SlowPurge:
+    """Storage whose purge_guild waits for the test before it runs."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    async def purge_guild(self, guild_id):
+        self.started.set()
+        await self.release.wait()
+        return await self.backend.purge_guild(guild_id)
+
+def test_restart_seeds_sessions_from_current_presences():
+    async def scenario():
+        client = make_state()
+        guild = make_guild(client._connection, SEED_GUILD)
+        await storage.update_guild_config(SEED_GUILD, enabled=True, log_channel=LOG_CHANNEL)
+        guild.get_member(1).activities = (discord.Game("Minecraft"),)
+        guild.get_member(2).activities = (discord.CustomActivity("brb"),)
+        guild.get_member(3).activities = (discord.Game("Terraria"),)
+        # A presence update got to member 3 before the seeding did
+        earlier = award_scheduler.start(SEED_GUILD, 3, classify_activities([discord.Game("Terraria")]))
+
+        class Bot:
+            def get_guild(self, guild_id):
+                return guild if guild_id == SEED_GUILD else None
+
+        try:
+            seeded = await ActivityXP(Bot()).seed_sessions()
+            sessions = {user_id: award_scheduler.get(SEED_GUILD, user_id) for user_id in (1, 2, 3)}
+            state = presence_sessions.get(SEED_GUILD, 1)
+            return seeded, sessions, earlier, state.current
+        finally:
+            award_scheduler.stop_guild(SEED_GUILD)
+            presence_sessions.discard_guild(SEED_GUILD)
+            await storage.purge_guild(SEED_GUILD)
+            guild_cache.invalidate(SEED_GUILD)
+
+    seeded, sessions, earlier, current = asyncio.run(scenario())
+    assert seeded == 1
+    assert sessions[1].activity.name == current == "Playing: Minecraft"
+    # Custom status isn't tracked; a running session is left alone
+    assert sessions[2] is None and sessions[3] is earlier
+
+def test_reset_leaves_nothing_to_flush_back(monkeypatch):
+    minecraft = classify_activities([discord.Game("Minecraft")])
+
+    async def scenario():
+        slow = SlowPurge(storage)
+        monkeypatch.setattr(activity_xp, "storage", slow)
+        cog = ActivityXP(None)
+        await storage.update_guild_config(RESET_GUILD, enabled=True, log_channel=LOG_CHANNEL)
+        await storage.add_xp(RESET_GUILD, 1, 500)
+        await guild_cache.get(RESET_GUILD)
+        await cog.xp_buffer.add_xp(RESET_GUILD, 2, 40)
+        presence_sessions.ensure(RESET_GUILD, 1)
+        award_scheduler.start(RESET_GUILD, 1, minecraft)
+
+        reset = asyncio.create_task(cog.reset_guild(RESET_GUILD))
+        await slow.started.wait()
+        # Nothing is left to award or flush while the purge runs...
+        during = (award_scheduler.get(RESET_GUILD, 1), presence_sessions.get(RESET_GUILD, 1), len(cog.xp_buffer))
+        # ...but a presence update can still read the old config and start over
+        assert (await guild_cache.get(RESET_GUILD)).config["enabled"]
+        award_scheduler.start(RESET_GUILD, 3, minecraft)
+        await cog.xp_buffer.update_streak(RESET_GUILD, 3, minecraft.name, 1)
+        slow.release.set()
+        deleted = await reset
+
+        await cog.xp_buffer.flush()
+        after = (
+            award_scheduler.get(RESET_GUILD, 3), await storage.get_total_users(RESET_GUILD),
+            (await storage.get_streak(RESET_GUILD, 3))["count"],
+            (await guild_cache.get(RESET_GUILD)).config["enabled"],
+        )
+        guild_cache.invalidate(RESET_GUILD)
+        return deleted, during, after
+
+    deleted, during, after = asyncio.run(scenario())
+    assert deleted["user_xp"] == 1
+    assert during == (None, None, 0)
+    assert after == (None, 0, 0, False)
+
+def test_prefilter_drops_only_updates_that_cannot_change_tracked_state(monkeypatch):
+    monkeypatch.setattr(guild_cache, "_enabled_warm", True)
+    monkeypatch.setattr(guild_cache, "_maybe_enabled", {PREFILTER_GUILD})
+    client = make_state()
+    enabled = make_guild(client._connection, PREFILTER_GUILD)
+    disabled = make_guild(client._connection, PREFILTER_GUILD + 1)
+    cog = ActivityXP(None)
+    minecraft, terraria = (discord.Game("Minecraft"),), (discord.Game("Terraria"),)
+
+    def prefilter(guild, user_id, before, after, bot=False):
+        data = member_data(user_id)
+        data["user"]["bot"] = bot
+        old = discord.Member(state=client._connection, guild=guild, data=data)
+        new = discord.Member(state=client._connection, guild=guild, data=data)
+        old.activities, new.activities = before, after
+        return cog.prefilter_presence(old, new, activity_fingerprint(after))
+
+    processed = presence_sessions.ensure(PREFILTER_GUILD, 1)
+    processed.fingerprint, processed.current = activity_fingerprint(minecraft), "Playing: Minecraft"
+    presence_sessions.ensure(PREFILTER_GUILD, 2).current = "Playing: Minecraft"
+    try:
+        dropped = [
+            prefilter(enabled, BOT_USER, (), minecraft, bot=True),
+            prefilter(disabled, 3, (), minecraft),
+            # Status flip while still playing the game last processed
+            prefilter(enabled, 1, minecraft, minecraft),
+            # Nothing before, nothing after, nothing tracked
+            prefilter(enabled, 3, (), ()),
+        ]
+        passed = [
+            prefilter(enabled, 1, minecraft, terraria),
+            prefilter(enabled, 3, (), minecraft),
+            # Same game, but not processed since the state was evicted or the bot restarted
+            prefilter(enabled, 3, minecraft, minecraft),
+            # No activity, but a stale one to clear
+            prefilter(enabled, 2, (), ()),
+        ]
+    finally:
+        presence_sessions.discard_guild(PREFILTER_GUILD)
+
+    assert dropped == [activity_xp.SKIP_BOT, activity_xp.SKIP_GUILD_DISABLED, activity_xp.SKIP_UNCHANGED, activity_xp.SKIP_UNCHANGED]
+    assert passed == [None] * 4
@@ -0,0 +1,90 @@
+import asyncio
+
+from discord import app_commands
+
+import command_sync
+from command_sync import sync_command_tree
+from conftest import make_state
+
+def make_tree():
+    tree = app_commands.CommandTree(make_state())
+    syncs = []
+
+    @tree.command(name="rank", description="Show your XP rank")
+    async def rank(interaction):
+        pass
+
+    async def sync():
+        syncs.append(tree.get_commands())
+        return tree.get_commands()
+
+    tree.sync = sync
+    return tree, syncs
+
+def restart(monkeypatch):
+    """A new process: nothing synced yet, only the saved hash is left."""
+    monkeypatch.setattr(command_sync, "_in_sync", False)
+
+def test_unchanged_tree_skips_sync_and_a_changed_description_syncs(monkeypatch, tmp_path):
+    path = str(tmp_path / "command_tree.json")
+
+    async def scenario():
+        tree, syncs = make_tree()
+        restart(monkeypatch)
+        first = await sync_command_tree(tree, path)
+        # A reconnect in the same process, then a restart with the same tree
+        reconnect = await sync_command_tree(tree, path)
+        restart(monkeypatch)
+        unchanged = await sync_command_tree(tree, path)
+
+        restart(monkeypatch)
+        tree.get_command("rank").description = "Show anyone's XP rank"
+        changed = await sync_command_tree(tree, path)
+        return first, reconnect, unchanged, changed, len(syncs)
+
+    first, reconnect, unchanged, changed, syncs = asyncio.run(scenario())
+    assert [c.name for c in first] == ["rank"]
+    assert reconnect is None and unchanged is None
+    assert [c.description for c in changed] == ["Show anyone's XP rank"]
+    assert syncs == 2
+
+def test_unknown_serializer_signature_falls_back_to_syncing(monkeypatch, tmp_path):
+    path = str(tmp_path / "command_tree.json")
+
+    def to_dict(self, tree, context):
+        raise AssertionError("not reached")
+
+    # A future discord.py whose serializer wants more than the tree
+    monkeypatch.setattr(app_commands.Command, "to_dict", to_dict)
+
+    async def scenario():
+        tree, syncs = make_tree()
+        for _ in range(2):
+            restart(monkeypatch)
+            await sync_command_tree(tree, path)
+        return len(syncs)
+
+    assert asyncio.run(scenario()) == 2
+
+def test_tree_argument_of_newer_discord_py_is_passed(monkeypatch, tmp_path):
+    path = str(tmp_path / "command_tree.json")
+    original = app_commands.Command.to_dict
+    trees = []
+
+    def to_dict(self, tree):
+        trees.append(tree)
+        return original(self)
+
+    # discord.py 2.4: to_dict(tree)
+    monkeypatch.setattr(app_commands.Command, "to_dict", to_dict)
+
+    async def scenario():
+        tree, syncs = make_tree()
+        for _ in range(2):
+            restart(monkeypatch)
+            await sync_command_tree(tree, path)
+        return tree, len(syncs)
+
+    tree, syncs = asyncio.run(scenario())
+    assert syncs == 1
+    assert trees and all(t is tree for t in trees)
@@ -0,0 +1,46 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+GUILD_ID = 1
+
+def test_add_xp_parallel_awards_keep_every_increment(database):
+    members = [101, 102, 103, 104, 105]
+    awards = [(members[i % len(members)], 10) for i in range(1600)]
+
+    # Each worker thread gets its own pooled connection, so the upserts really race
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda award: (award[0], database.add_xp(GUILD_ID, *award)), awards))
+
+    expected_xp = len(awards) // len(members) * 10
+    level_ups = Counter(user_id for user_id, (leveled_up, _) in results if leveled_up)
+    for user_id in members:
+        data = database.get_user_xp(GUILD_ID, user_id)
+        assert data["xp"] == expected_xp
+        assert data["level"] == expected_xp // 100
+        # Every level is crossed by exactly one award
+        assert level_ups[user_id] == expected_xp // 100
+
+def test_add_xp_reports_level_ups(database):
+    assert database.add_xp(GUILD_ID, 7, 150) == (True, 1)
+    assert database.add_xp(GUILD_ID, 7, 40) == (False, 1)
+    assert database.add_xp(GUILD_ID, 7, 10) == (True, 2)
+    assert database.get_user_xp(GUILD_ID, 7)["xp"] == 200
+
+def test_ndjson_backup_round_trip_keeps_every_field(database, tmp_path):
+    database.apply_xp_batch([(GUILD_ID, 5, 250, "2026-01-01 10:00:00"), (2, 5, 90, None)],
+                            [(GUILD_ID, 5, "Playing: Minecraft", 4, "2026-01-01 11:00:00")])
+    database.update_guild_config(GUILD_ID, enabled=True, log_channel=10, target_role=20, auto_roles=True)
+    database.add_custom_role(GUILD_ID, 5, 500)
+    filename = str(tmp_path / "backup.ndjson.gz")
+
+    stats = database.export_ndjson(filename, guild_id=GUILD_ID, compress=True)
+    assert stats["rows"] == 4
+    database.purge_guild(GUILD_ID)
+    assert database.import_ndjson(filename)["rows"] == 4
+
+    assert database.get_user_xp(GUILD_ID, 5) == {"xp": 250, "level": 2, "last_xp_time": "2026-01-01 10:00:00"}
+    assert database.get_streak(GUILD_ID, 5)["count"] == 4
+    assert database.get_guild_config(GUILD_ID) == {"enabled": True, "log_channel": 10, "target_role": 20, "auto_roles": True}
+    assert database.get_custom_roles(GUILD_ID) == {5: 500}
+    # Other guilds were neither exported nor touched
+    assert database.get_user_xp(2, 5)["xp"] == 90
@@ -0,0 +1,72 @@
+import asyncio
+
+import discord
+
+from log_digest import HIGH, LOW, MAX_FULL_EMBEDS, LogDigest
+
+class Channel:
+    """Log channel that records each message's embeds."""
+
+    def __init__(self, channel_id: int = 1):
+        self.id = channel_id
+        self.name = "xp-log"
+        self.sent = []
+
+    async def send(self, embeds):
+        self.sent.append(embeds)
+
+def activity(digest: LogDigest, channel: Channel, user_id: int, name: str = "Minecraft"):
+    line = f"<@{user_id}> is playing {name}"
+    digest.post(channel, discord.Embed(description=line), line, key=("activity", user_id), priority=LOW)
+
+def descriptions(channel: Channel) -> list:
+    return [embed.description for embeds in channel.sent for embed in embeds]
+
+def test_burst_is_sent_as_a_few_summary_messages():
+    async def scenario():
+        digest, channel = LogDigest(), Channel()
+        for user_id in range(500):
+            activity(digest, channel, user_id)
+        await digest.flush()
+        return channel, len(digest)
+
+    channel, pending = asyncio.run(scenario())
+    assert 1 < len(channel.sent) <= 6
+    lines = "\n".join(descriptions(channel)).splitlines()
+    assert lines == [f"<@{user_id}> is playing Minecraft" for user_id in range(500)]
+    assert pending == 0
+
+def test_newer_entries_replace_pending_ones_with_the_same_key():
+    async def scenario():
+        digest, channel = LogDigest(), Channel()
+        for level in (5, 6, 7):
+            line = f"<@1> reached Level {level}"
+            digest.post(channel, discord.Embed(title="LEVEL UP!", description=line), line,
+                        key=("level_up", 1), priority=HIGH)
+        activity(digest, channel, 1, "Minecraft")
+        activity(digest, channel, 2, "Minecraft")
+        activity(digest, channel, 1, "Terraria")
+        await digest.flush()
+        return channel
+
+    channel = asyncio.run(scenario())
+    # Few enough entries to go out as full embeds, in the order first queued
+    assert len(channel.sent) == 1
+    assert descriptions(channel) == ["<@1> reached Level 7", "<@1> is playing Terraria", "<@2> is playing Minecraft"]
+
+def test_overflow_drops_the_oldest_low_priority_entries_and_reports_them():
+    async def scenario():
+        digest, channel = LogDigest(max_pending=MAX_FULL_EMBEDS), Channel()
+        for user_id in range(MAX_FULL_EMBEDS + 5):
+            activity(digest, channel, user_id)
+        # A level-up still gets in, pushing out another low-priority entry
+        digest.post(channel, discord.Embed(description="<@99> reached Level 5"), "<@99> reached Level 5",
+                    key=("level_up", 99), priority=HIGH)
+        await digest.flush()
+        return channel
+
+    channel = asyncio.run(scenario())
+    lines = "\n".join(descriptions(channel)).splitlines()
+    assert lines[0] == "<@6> is playing Minecraft"
+    assert lines[-2:] == ["<@99> reached Level 5", "… and 6 more update(s) not shown"]
+    assert len(lines) == MAX_FULL_EMBEDS + 1
@@ -0,0 +1,107 @@
+import sqlite3
+
+import pytest
+
+from database import MIGRATIONS, Database
+
+# Tables and indexes as created before the migration framework existed
+BASELINE_SCHEMA = '''
+    CREATE TABLE user_xp (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        xp INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 0,
+        last_xp_time TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(guild_id, user_id)
+    );
+    CREATE TABLE activity_streaks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        activity_name TEXT,
+        streak_count INTEGER DEFAULT 0,
+        last_activity_time TIMESTAMP,
+        UNIQUE(guild_id, user_id)
+    );
+    CREATE TABLE guild_config (
+        guild_id INTEGER PRIMARY KEY,
+        enabled BOOLEAN DEFAULT 0,
+        log_channel INTEGER,
+        target_role INTEGER,
+        auto_roles BOOLEAN DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE custom_xp_roles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        UNIQUE(guild_id, level)
+    );
+    CREATE INDEX idx_user_xp_guild ON user_xp(guild_id);
+    CREATE INDEX idx_user_xp_user ON user_xp(user_id);
+    CREATE INDEX idx_user_xp_xp ON user_xp(xp DESC);
+    CREATE INDEX idx_streaks_guild ON activity_streaks(guild_id);
+'''
+
+GUILD_ID = 1
+
+@pytest.fixture
+def migrated(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO user_xp (guild_id, user_id, xp, level) VALUES (?, ?, ?, ?)',
+                     [(guild_id, user_id, user_id * 37 % 500, user_id * 37 % 500 // 100)
+                      for guild_id in (GUILD_ID, 2) for user_id in range(200)])
+    conn.executemany('INSERT INTO activity_streaks (guild_id, user_id, activity_name, streak_count) VALUES (?, ?, ?, ?)',
+                     [(GUILD_ID, user_id, "Playing: Minecraft", user_id % 9) for user_id in range(200)])
+    conn.commit()
+    conn.close()
+
+    database = Database(path)
+    yield database
+    database.close()
+
+def query_plans(database: Database, call) -> dict:
+    """EXPLAIN QUERY PLAN of every SELECT the call runs, keyed by its SQL."""
+    conn = database.get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return {
+        sql: [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+        for sql in statements if sql.lstrip().upper().startswith("SELECT")
+    }
+
+def test_migrations_upgrade_baseline_schema(migrated):
+    conn = migrated.get_connection()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_user_xp_rank", "idx_streaks_top", "idx_user_xp_user"} <= indexes
+    assert not indexes & {"idx_user_xp_guild", "idx_user_xp_xp", "idx_streaks_guild"}
+    # Data survives the upgrade
+    assert migrated.get_total_users(GUILD_ID) == 200
+
+def test_migrations_are_idempotent(migrated):
+    migrated.run_migrations()
+    conn = migrated.get_connection()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+
+@pytest.mark.parametrize("name, index, call", [
+    ("leaderboard page", "idx_user_xp_rank", lambda db: db.get_leaderboard_page(GUILD_ID, 20, 10)),
+    ("rank and neighbors", "idx_user_xp_rank", lambda db: db.get_rank_and_neighbors(GUILD_ID, 42)),
+    ("top streaks", "idx_streaks_top", lambda db: db.get_top_streaks(GUILD_ID)),
+])
+def test_queries_use_covering_indexes(migrated, name, index, call):
+    plans = query_plans(migrated, lambda: call(migrated))
+    assert plans, name
+    covered = [line for steps in plans.values() for line in steps if f"USING COVERING INDEX {index}" in line]
+    assert covered, plans
+    for sql, steps in plans.items():
+        assert not any("TEMP B-TREE" in line for line in steps), (sql, steps)
@@ -0,0 +1,59 @@
+import asyncio
+
+from discord.utils import SnowflakeList
+
+import recovery
+from conftest import GUILD_ID, ROLE_5, ROLE_10, USERS, make_guild, make_state
+from guild_cache import guild_cache
+from recovery import RoleAudit
+
+NO_ROLES_GUILD = GUILD_ID + 1
+OTHER_SHARD_GUILD = GUILD_ID + 2
+
+def test_audit_replans_queued_fixes_and_checkpoints_audited_guilds(database, adb, monkeypatch):
+    monkeypatch.setattr(recovery, "AUDIT_FIXES_PER_SECOND", 1000)
+
+    async def scenario():
+        monkeypatch.setattr(recovery, "recovery_ready", asyncio.Event())
+        recovery.recovery_ready.set()
+        client = make_state()
+        http = client._connection.http
+        guilds = {guild_id: make_guild(client._connection, guild_id) for guild_id in (GUILD_ID, NO_ROLES_GUILD)}
+        for guild_id in (GUILD_ID, NO_ROLES_GUILD, OTHER_SHARD_GUILD):
+            await adb.update_guild_config(guild_id, enabled=True)
+        for guild_id in (GUILD_ID, OTHER_SHARD_GUILD):
+            await adb.add_custom_role(guild_id, 5, ROLE_5)
+            await adb.add_custom_role(guild_id, 10, ROLE_10)
+        for user_id in USERS:
+            await adb.add_xp(GUILD_ID, user_id, 500)  # Level 5
+        guild_cache.prime(await adb.get_enabled_guild_configs())
+
+        def meanwhile(user_id):
+            # While the other fixes wait in the queue, member 4 reaches level 10
+            # (and gets its role) and a moderator gives member 5 the level 5 role
+            if user_id == 1:
+                database.add_xp(GUILD_ID, 4, 500)
+                guilds[GUILD_ID].get_member(4)._roles = SnowflakeList([ROLE_10])
+                guilds[GUILD_ID].get_member(5)._roles = SnowflakeList([ROLE_5])
+
+        class Bot:
+            async def wait_until_ready(self):
+                pass
+
+            def get_guild(self, guild_id):
+                return guilds.get(guild_id)
+
+        http.on_edit = meanwhile
+        try:
+            await RoleAudit(adb).run(Bot())
+        finally:
+            for guild_id in (GUILD_ID, NO_ROLES_GUILD, OTHER_SHARD_GUILD):
+                guild_cache.invalidate(guild_id)
+        return guilds[GUILD_ID], http.edits, await adb.get_role_audits()
+
+    guild, edits, audits = asyncio.run(scenario())
+    assert [user_id for user_id, _ in edits] == [1, 2, 3, 6]
+    assert [r.id for r in guild.get_member(4).roles if not r.is_default()] == [ROLE_10]
+    # Guilds without reward roles, or not on this shard, get no checkpoint
+    assert list(audits) == [GUILD_ID]
+    assert audits[GUILD_ID][0] == 0 and audits[GUILD_ID][1]
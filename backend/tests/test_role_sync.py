@@ -0,0 +1,72 @@
+import asyncio
+
+from discord.utils import SnowflakeList
+
+from conftest import GUILD_ID, ROLE_5, ROLE_10, USERS, make_guild, make_state
+from guild_cache import guild_cache
+from role_sync import RoleSyncEngine
+
+def test_sync_plans_each_member_when_their_edit_runs(adb):
+    async def scenario():
+        client = make_state()
+        http = client._connection.http
+        guild = make_guild(client._connection)
+        for user_id in USERS:
+            await adb.add_xp(GUILD_ID, user_id, 500)  # Level 5
+        guild_cache.prime({GUILD_ID: ({"enabled": True}, {5: ROLE_5, 10: ROLE_10})})
+
+        def meanwhile(user_id):
+            # While the rest of the chunk waits on the bucket, member 4 levels up
+            # (and gets the level 10 role) and a moderator gives member 5 theirs
+            if user_id == 1:
+                guild.get_member(4)._roles = SnowflakeList([ROLE_10])
+                guild.get_member(5)._roles = SnowflakeList([ROLE_5])
+
+        http.on_edit = meanwhile
+        engine = RoleSyncEngine(adb, concurrency=1)
+        try:
+            job = await engine.start(guild, 5, guild.get_role(ROLE_5))
+            await engine.tasks[(GUILD_ID, 5)]
+        finally:
+            guild_cache.invalidate(GUILD_ID)
+        return guild, http.edits, job, await adb.get_role_sync_jobs()
+
+    guild, edits, job, checkpoints = asyncio.run(scenario())
+    assert [user_id for user_id, _ in edits] == [1, 2, 3, 6]
+    assert [r.id for r in guild.get_member(4).roles if not r.is_default()] == [ROLE_10]
+    assert job.added == 4 and job.skipped == 2 and job.failed == 0
+    assert checkpoints == []
+
+def test_resume_keeps_checkpoints_of_guilds_it_does_not_see(adb):
+    async def scenario():
+        client = make_state()
+        present = make_guild(client._connection, GUILD_ID)
+        outage = make_guild(client._connection, GUILD_ID + 1)
+        outage.unavailable = True
+        role_gone = make_guild(client._connection, GUILD_ID + 2)
+        role_gone._remove_role(ROLE_5)
+        guilds = {guild.id: guild for guild in (present, outage, role_gone)}
+        # GUILD_ID + 3 belongs to another shard
+        for guild_id in (GUILD_ID, GUILD_ID + 1, GUILD_ID + 2, GUILD_ID + 3):
+            await adb.save_role_sync_job({
+                "guild_id": guild_id, "level": 5, "role_id": ROLE_5, "old_role_id": None,
+                "cursor": 0, "added": 0, "removed": 0, "skipped": 0, "failed": 0,
+            })
+
+        class Bot:
+            def get_guild(self, guild_id):
+                return guilds.get(guild_id)
+
+        engine = RoleSyncEngine(adb)
+        guild_cache.prime({GUILD_ID: ({"enabled": True}, {5: ROLE_5})})
+        try:
+            resumed = await engine.resume(Bot())
+            await asyncio.gather(*engine.tasks.values())
+        finally:
+            guild_cache.invalidate(GUILD_ID)
+        return resumed, sorted(job["guild_id"] for job in await adb.get_role_sync_jobs())
+
+    resumed, checkpoints = asyncio.run(scenario())
+    assert resumed == 1
+    # The resumed job finished; the deleted role's job was dropped
+    assert checkpoints == [GUILD_ID + 1, GUILD_ID + 3]
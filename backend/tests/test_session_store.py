@@ -0,0 +1,63 @@
+import discord
+
+import metrics
+from activity_classifier import classify_activities
+from award_scheduler import AwardScheduler
+from session_store import SessionStore
+
+GUILD_ID = 1
+
+def store_with_scheduler(**kwargs):
+    scheduler = AwardScheduler()
+    store = SessionStore(on_evict=scheduler.stop, **kwargs)
+    minecraft = classify_activities([discord.Game("Minecraft")])
+
+    def track(user_id):
+        state = store.ensure(GUILD_ID, user_id)
+        state.current = minecraft.name
+        scheduler.start(GUILD_ID, user_id, minecraft)
+        return state
+
+    return store, scheduler, track
+
+def test_records_expire_after_ttl_and_end_their_award_session():
+    store, scheduler, track = store_with_scheduler(ttl=60)
+    evicted = metrics.PRESENCE_SESSIONS_EVICTED.value("ttl")
+    # Members 1 and 2 were last seen two minutes ago, member 3 just now
+    states = [track(user_id) for user_id in (1, 2, 3)]
+    states[0].touched -= 120
+    states[1].touched -= 120
+
+    assert store.expire() == 2
+    assert store.get(GUILD_ID, 1) is None and store.get(GUILD_ID, 2) is None
+    assert [scheduler.get(GUILD_ID, u) is None for u in (1, 2, 3)] == [True, True, False]
+    assert metrics.PRESENCE_SESSIONS_EVICTED.value("ttl") == evicted + 2
+    # Inserting a member expires stale records first
+    store.get(GUILD_ID, 3).touched -= 61
+    track(4)
+    assert len(store) == 1 and len(scheduler) == 1 and store.get(GUILD_ID, 4) is not None
+
+def test_cap_evicts_the_least_recently_seen_member():
+    store, scheduler, track = store_with_scheduler(max_entries=2)
+    evicted = metrics.PRESENCE_SESSIONS_EVICTED.value("cap")
+    track(1)
+    track(2)
+    store.get(GUILD_ID, 1)  # Member 1 is seen again, member 2 is now the oldest
+    track(3)
+
+    assert len(store) == 2
+    assert store.get(GUILD_ID, 2) is None and scheduler.get(GUILD_ID, 2) is None
+    assert store.get(GUILD_ID, 1) is not None and scheduler.get(GUILD_ID, 1) is not None
+    assert metrics.PRESENCE_SESSIONS_EVICTED.value("cap") == evicted + 1
+
+def test_discard_and_discard_guild_are_not_evictions():
+    store, scheduler, track = store_with_scheduler()
+    for user_id in (1, 2):
+        track(user_id)
+    store.ensure(GUILD_ID + 1, 1)
+
+    assert store.discard(GUILD_ID, 1) is not None
+    assert store.discard_guild(GUILD_ID) == 1
+    assert len(store) == 1 and store.get(GUILD_ID + 1, 1) is not None
+    # The cog ends award sessions itself when it discards
+    assert len(scheduler) == 2
@@ -0,0 +1,45 @@
+import asyncio
+
+from snapshots import create_snapshot, list_snapshots, restore_guild
+
+GUILD_A = 1
+GUILD_B = 2
+
+def test_restore_replaces_one_guild_and_leaves_the_others(adb, tmp_path):
+    directory = str(tmp_path / "snapshots")
+
+    async def scenario():
+        for guild_id in (GUILD_A, GUILD_B):
+            await adb.update_guild_config(guild_id, enabled=True, log_channel=10)
+            await adb.add_custom_role(guild_id, 5, 105)
+            for user_id in (1, 2, 3):
+                await adb.add_xp(guild_id, user_id, 100 * user_id)
+                await adb.update_streak(guild_id, user_id, "Playing: Minecraft", user_id)
+        before = {guild_id: await guild_rows(guild_id) for guild_id in (GUILD_A, GUILD_B)}
+
+        stats = await create_snapshot(adb, directory=directory)
+        # Both guilds change after the snapshot
+        for guild_id in (GUILD_A, GUILD_B):
+            await adb.add_xp(guild_id, 1, 1000)
+            await adb.add_xp(guild_id, 4, 50)
+            await adb.update_streak(guild_id, 2, "Playing: Terraria", 9)
+            await adb.update_guild_config(guild_id, log_channel=20)
+            await adb.remove_custom_role(guild_id, 5)
+        changed_b = await guild_rows(GUILD_B)
+
+        restored = await restore_guild(adb, stats["name"], GUILD_A, directory=directory)
+        return stats, before, changed_b, restored, {g: await guild_rows(g) for g in (GUILD_A, GUILD_B)}
+
+    async def guild_rows(guild_id):
+        return (
+            await adb.get_leaderboard(guild_id),
+            [await adb.get_streak(guild_id, user_id) for user_id in (1, 2, 3, 4)],
+            await adb.get_guild_config(guild_id),
+            await adb.get_custom_roles(guild_id),
+        )
+
+    stats, before, changed_b, restored, after = asyncio.run(scenario())
+    assert list_snapshots(directory) == [stats["name"]]
+    assert restored == {"user_xp": 3, "activity_streaks": 3, "guild_config": 1, "custom_xp_roles": 1}
+    assert after[GUILD_A] == before[GUILD_A]
+    assert after[GUILD_B] == changed_b != before[GUILD_B]
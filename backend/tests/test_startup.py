@@ -0,0 +1,72 @@
+import asyncio
+import importlib
+
+import recovery
+
+def test_on_ready_returns_before_recovery_and_ready_flips_after_health_check(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "test-token")
+    main = importlib.import_module("main")
+
+    async def scenario():
+        ready = asyncio.Event()
+        restored, health_checked = asyncio.Event(), asyncio.Event()
+        release_restore, release_health = asyncio.Event(), asyncio.Event()
+        monkeypatch.setattr(recovery, "recovery_ready", ready)
+        monkeypatch.setattr(main, "recovery_ready", ready)
+        monkeypatch.setattr(recovery, "_recovery_task", None)
+
+        async def restore_guild_configs(bot):
+            await release_restore.wait()
+            restored.set()
+
+        async def verify_bot_health(bot):
+            await release_health.wait()
+            health_checked.set()
+            return True
+
+        monkeypatch.setattr(recovery, "restore_guild_configs", restore_guild_configs)
+        monkeypatch.setattr(recovery, "verify_bot_health", verify_bot_health)
+
+        class Loop:
+            def is_running(self):
+                return True
+
+        class Audit:
+            def start(self, bot):
+                pass
+
+        class Bot:
+            class user:
+                id = 1
+            guilds = []
+            tree = None
+
+            async def change_presence(self, **kwargs):
+                pass
+
+        async def sync_command_tree(tree):
+            return []
+
+        monkeypatch.setattr(main, "bot", Bot())
+        monkeypatch.setattr(main, "role_audit", Audit())
+        monkeypatch.setattr(main, "rotate_status", Loop())
+        monkeypatch.setattr(main, "health_check_task", Loop())
+        monkeypatch.setattr(main, "sync_command_tree", sync_command_tree)
+
+        # on_ready doesn't wait on recovery
+        await asyncio.wait_for(main.on_ready(), timeout=1)
+        states = [(ready.is_set(), (await main.ready_check(None)).status)]
+
+        release_restore.set()
+        await restored.wait()
+        await asyncio.sleep(0)
+        # Configs are restored but the health check is still running
+        states.append((ready.is_set(), (await main.ready_check(None)).status))
+
+        release_health.set()
+        await recovery._recovery_task
+        states.append((health_checked.is_set() and ready.is_set(), (await main.ready_check(None)).status))
+        return states
+
+    states = asyncio.run(scenario())
+    assert states == [(False, 503), (False, 503), (True, 200)]
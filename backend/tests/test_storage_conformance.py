@@ -0,0 +1,207 @@
+"""
+Every StorageBackend must behave the same: each test runs against
+AsyncDatabase (SQLite) and PostgresBackend.
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from database import AsyncDatabase, Database
+
+SCRATCH_SCHEMA = "ayame_conformance"
+GUILD_ID = 1
+OTHER_GUILD_ID = 2
+
+async def _postgres_backend(url: str):
+    import asyncpg
+    from postgres_backend import PostgresBackend
+
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE')
+        await conn.execute(f'CREATE SCHEMA {SCRATCH_SCHEMA}')
+    finally:
+        await conn.close()
+    # Unknown DSN parameters become server settings in asyncpg
+    separator = "&" if "?" in url else "?"
+    return PostgresBackend(f"{url}{separator}search_path={SCRATCH_SCHEMA}")
+
+async def _drop_scratch_schema(url: str):
+    import asyncpg
+
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute(f'DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE')
+    finally:
+        await conn.close()
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def conformance(request, tmp_path):
+    """Run `scenario(backend)` against a fresh, empty backend of each kind."""
+    kind = request.param
+    url = request.getfixturevalue("postgres_url") if kind == "postgres" else None
+
+    def run(scenario):
+        async def main():
+            if kind == "sqlite":
+                backend = AsyncDatabase(Database(str(tmp_path / "conformance.db")))
+            else:
+                backend = await _postgres_backend(url)
+            try:
+                return await scenario(backend)
+            finally:
+                backend.close()
+                if url:
+                    await _drop_scratch_schema(url)
+        return asyncio.run(main())
+    return run
+
+def test_add_xp_upserts_and_reports_level_ups(conformance):
+    async def scenario(backend):
+        assert await backend.get_user_xp(GUILD_ID, 5) == {"xp": 0, "level": 0, "last_xp_time": None}
+        assert await backend.add_xp(GUILD_ID, 5, 150) == (True, 1)
+        assert await backend.add_xp(GUILD_ID, 5, 40) == (False, 1)
+        assert await backend.add_xp(GUILD_ID, 5, 10) == (True, 2)
+        data = await backend.get_user_xp(GUILD_ID, 5)
+        assert (data["xp"], data["level"]) == (200, 2)
+        # Timestamps come back as SQLite-style text on every backend
+        assert datetime.fromisoformat(data["last_xp_time"])
+        assert (await backend.get_user_xp(OTHER_GUILD_ID, 5))["xp"] == 0
+    conformance(scenario)
+
+def test_parallel_add_xp_keeps_every_increment(conformance):
+    async def scenario(backend):
+        await asyncio.gather(*(backend.add_xp(GUILD_ID, 5 + i % 3, 10) for i in range(90)))
+        for user_id in (5, 6, 7):
+            assert (await backend.get_user_xp(GUILD_ID, user_id))["xp"] == 300
+    conformance(scenario)
+
+def test_apply_xp_batch_accumulates_and_upserts_streaks(conformance):
+    async def scenario(backend):
+        now = datetime(2026, 1, 1, 12, 0, 0)
+        await backend.add_xp(GUILD_ID, 5, 50)
+        await backend.apply_xp_batch(
+            [(GUILD_ID, 5, 60, now), (GUILD_ID, 6, 250, now), (OTHER_GUILD_ID, 5, 30, now)],
+            [(GUILD_ID, 5, "Playing: Minecraft", 3, now), (GUILD_ID, 6, "Listening: Spotify", 1, now)]
+        )
+        await backend.apply_xp_batch([(GUILD_ID, 6, 50, now)], [(GUILD_ID, 5, "Playing: Minecraft", 4, now)])
+        await backend.apply_xp_batch([], [])
+
+        assert (await backend.get_user_xp(GUILD_ID, 5))["xp"] == 110
+        data = await backend.get_user_xp(GUILD_ID, 6)
+        assert (data["xp"], data["level"], data["last_xp_time"]) == (300, 3, "2026-01-01 12:00:00")
+        assert (await backend.get_user_xp(OTHER_GUILD_ID, 5))["xp"] == 30
+
+        streak = await backend.get_streak(GUILD_ID, 5)
+        assert (streak["activity"], streak["count"]) == ("Playing: Minecraft", 4)
+        assert streak["last_time"] == now
+        assert await backend.get_streak(GUILD_ID, 99) == {"activity": None, "count": 0, "last_time": None}
+        await backend.update_streak(GUILD_ID, 6, "Playing: Terraria", 2)
+        assert await backend.get_top_streaks(GUILD_ID) == [(5, "Playing: Minecraft", 4), (6, "Playing: Terraria", 2)]
+    conformance(scenario)
+
+def test_leaderboard_paging_ranks_ties_like_rank(conformance):
+    async def scenario(backend):
+        # xp 500, 400, 400, 400, 300, 300, 100 for users 1..7
+        totals = {1: 500, 2: 400, 3: 400, 4: 400, 5: 300, 6: 300, 7: 100}
+        now = datetime(2026, 1, 1)
+        await backend.apply_xp_batch([(GUILD_ID, u, xp, now) for u, xp in totals.items()], [])
+        await backend.add_xp(OTHER_GUILD_ID, 1, 9999)
+
+        full = await backend.get_leaderboard_page(GUILD_ID, 0, 10)
+        assert full == [(1, 1, 500, 5), (2, 2, 400, 4), (2, 3, 400, 4), (2, 4, 400, 4),
+                        (5, 5, 300, 3), (5, 6, 300, 3), (7, 7, 100, 1)]
+        # A page starting inside a tie keeps the tie's rank
+        assert await backend.get_leaderboard_page(GUILD_ID, 2, 3) == full[2:5]
+        assert await backend.get_leaderboard_page(GUILD_ID, 5, 10) == full[5:]
+        assert await backend.get_leaderboard_page(GUILD_ID, 7, 10) == []
+
+        standing = await backend.get_rank_and_neighbors(GUILD_ID, 4, radius=1)
+        assert (standing["rank"], standing["position"]) == (2, 4)
+        assert standing["neighbors"] == full[2:5]
+        assert await backend.get_rank_and_neighbors(GUILD_ID, 99) is None
+
+        assert await backend.get_user_rank(GUILD_ID, 6) == 5
+        assert await backend.get_total_users(GUILD_ID) == 7
+        top = await backend.get_leaderboard(GUILD_ID, 2)
+        assert top[0] == (1, 500, 5) and top[1][1:] == (400, 4)
+        assert sorted(await backend.get_guild_xp_totals(GUILD_ID)) == sorted(totals.items())
+
+        assert await backend.get_user_levels(GUILD_ID, 3) == [(1, 5), (2, 4), (3, 4), (4, 4), (5, 3), (6, 3)]
+        assert await backend.get_user_levels(GUILD_ID, 3, after_user_id=2, limit=2) == [(3, 4), (4, 4)]
+    conformance(scenario)
+
+def test_guild_config_and_reward_roles(conformance):
+    async def scenario(backend):
+        assert await backend.get_guild_config(GUILD_ID) == {
+            "enabled": False, "log_channel": None, "target_role": None, "auto_roles": False
+        }
+        await backend.update_guild_config(GUILD_ID, enabled=True, log_channel=10)
+        await backend.update_guild_config(GUILD_ID, target_role=20, auto_roles=True)
+        await backend.update_guild_config(GUILD_ID, unknown_field=1)
+        await backend.update_guild_config(OTHER_GUILD_ID, enabled=False, log_channel=30)
+        assert await backend.get_guild_config(GUILD_ID) == {
+            "enabled": True, "log_channel": 10, "target_role": 20, "auto_roles": True
+        }
+        assert await backend.get_enabled_guild_ids() == [GUILD_ID]
+
+        await backend.add_custom_role(GUILD_ID, 5, 500)
+        await backend.add_custom_role(GUILD_ID, 10, 1000)
+        await backend.add_custom_role(GUILD_ID, 5, 555)
+        await backend.add_custom_role(OTHER_GUILD_ID, 5, 777)
+        assert await backend.get_custom_roles(GUILD_ID) == {5: 555, 10: 1000}
+        await backend.remove_custom_role(GUILD_ID, 10)
+        assert await backend.get_custom_roles(GUILD_ID) == {5: 555}
+
+        assert await backend.get_enabled_guild_configs() == {
+            GUILD_ID: ({"enabled": True, "log_channel": 10, "target_role": 20, "auto_roles": True}, {5: 555})
+        }
+    conformance(scenario)
+
+def test_purge_guild_counts_rows_and_spares_other_guilds(conformance):
+    async def scenario(backend):
+        now = datetime(2026, 1, 1)
+        await backend.apply_xp_batch(
+            [(GUILD_ID, 5, 10, now), (GUILD_ID, 6, 10, now), (OTHER_GUILD_ID, 5, 10, now)],
+            [(GUILD_ID, 5, "Playing: Minecraft", 1, now)]
+        )
+        await backend.update_guild_config(GUILD_ID, enabled=True)
+        await backend.add_custom_role(GUILD_ID, 5, 500)
+        await backend.save_role_sync_job({"guild_id": GUILD_ID, "level": 5, "role_id": 500, "old_role_id": None,
+                                          "cursor": 0, "added": 0, "removed": 0, "skipped": 0, "failed": 0})
+        await backend.save_role_audit(GUILD_ID, 6)
+
+        assert await backend.purge_guild(GUILD_ID) == {
+            "user_xp": 2, "activity_streaks": 1, "custom_xp_roles": 1, "guild_config": 1
+        }
+        assert await backend.get_total_users(GUILD_ID) == 0
+        assert await backend.get_role_sync_jobs() == []
+        assert await backend.get_role_audits() == {}
+        assert await backend.get_total_users(OTHER_GUILD_ID) == 1
+        assert await backend.purge_guild(GUILD_ID) == {
+            "user_xp": 0, "activity_streaks": 0, "custom_xp_roles": 0, "guild_config": 0
+        }
+    conformance(scenario)
+
+def test_role_sync_and_audit_checkpoints(conformance):
+    async def scenario(backend):
+        job = {"guild_id": GUILD_ID, "level": 5, "role_id": 500, "old_role_id": 400,
+               "cursor": 0, "added": 0, "removed": 0, "skipped": 0, "failed": 0}
+        await backend.save_role_sync_job(job)
+        await backend.save_role_sync_job(dict(job, cursor=123, added=7, removed=2, skipped=40, failed=1))
+        await backend.save_role_sync_job(dict(job, guild_id=OTHER_GUILD_ID, level=10, role_id=900, old_role_id=None))
+        jobs = await backend.get_role_sync_jobs()
+        assert dict(job, cursor=123, added=7, removed=2, skipped=40, failed=1) in jobs
+        assert len(jobs) == 2
+        await backend.delete_role_sync_job(GUILD_ID, 5)
+        assert [j["guild_id"] for j in await backend.get_role_sync_jobs()] == [OTHER_GUILD_ID]
+
+        await backend.save_role_audit(GUILD_ID, 50)
+        assert await backend.get_role_audits() == {GUILD_ID: (50, None)}
+        await backend.save_role_audit(GUILD_ID, 0, 1700000000)
+        # A later checkpoint without finished_at keeps the last finish time
+        await backend.save_role_audit(GUILD_ID, 80)
+        assert await backend.get_role_audits() == {GUILD_ID: (80, 1700000000)}
+    conformance(scenario)
@@ -0,0 +1,92 @@
+import asyncio
+
+import metrics
+from leaderboard_index import LeaderboardIndex
+from xp_buffer import XPWriteBuffer
+
+GUILD_ID = 1
+
+class SlowCommit:
+    """Backend whose apply_xp_batch commits, then holds the caller until released."""
+
+    def __init__(self, adb):
+        self.adb = adb
+        self.committed = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.adb, name)
+
+    async def apply_xp_batch(self, xp_rows, streak_rows):
+        await self.adb.apply_xp_batch(xp_rows, streak_rows)
+        self.committed.set()
+        await self.release.wait()
+
+def test_reads_during_a_flush_count_the_batch_once(adb):
+    async def scenario():
+        backend = SlowCommit(adb)
+        index = LeaderboardIndex(backend, max_guilds=10)
+        buffer = XPWriteBuffer(backend, leaderboard=index)
+        await adb.add_xp(GUILD_ID, 6, 500)
+        await buffer.add_xp(GUILD_ID, 5, 150)
+
+        flush = asyncio.create_task(buffer.flush())
+        # The batch is on disk but flush() hasn't resumed yet
+        await backend.committed.wait()
+        reader = asyncio.create_task(buffer.get_user_xp(GUILD_ID, 5))
+        warmup = asyncio.create_task(index.get_rank_and_neighbors(GUILD_ID, 5))
+        await asyncio.sleep(0.05)
+        backend.release.set()
+        await flush
+        return await reader, await warmup, await index.get_rank_and_neighbors(GUILD_ID, 5)
+
+    data, standing, later = asyncio.run(scenario())
+    assert data["xp"] == 150 and data["level"] == 1
+    assert standing["neighbors"][-1][1:3] == (5, 150)
+    assert later["rank"] == 2 and later["neighbors"][-1][1:3] == (5, 150)
+
+def test_failed_flush_keeps_awards_and_releases_readers(adb):
+    class Failing:
+        def __getattr__(self, name):
+            return getattr(adb, name)
+
+        async def apply_xp_batch(self, xp_rows, streak_rows):
+            raise RuntimeError("disk full")
+
+    async def scenario():
+        index = LeaderboardIndex(Failing(), max_guilds=10)
+        buffer = XPWriteBuffer(Failing(), leaderboard=index)
+        await buffer.add_xp(GUILD_ID, 5, 40)
+        assert await buffer.flush() == 0
+        return len(buffer), await buffer.get_user_xp(GUILD_ID, 5), await index.get_total_users(GUILD_ID)
+
+    pending, data, total = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert pending == 1
+    assert data["xp"] == 40
+    assert total == 0
+
+def test_repeated_flush_failures_keep_only_the_newest_members(adb):
+    class Failing:
+        def __getattr__(self, name):
+            return getattr(adb, name)
+
+        async def apply_xp_batch(self, xp_rows, streak_rows):
+            raise RuntimeError("disk full")
+
+    async def scenario():
+        buffer = XPWriteBuffer(Failing(), max_pending=3, max_retained=5)
+        # Every award from the third on fills the buffer and fails a flush
+        for user_id in range(1, 9):
+            await buffer.add_xp(GUILD_ID, user_id, 10)
+            await buffer.update_streak(GUILD_ID, user_id, "Playing: Minecraft", 1)
+        # A member still queued keeps their place and their earlier award
+        await buffer.add_xp(GUILD_ID, 4, 10)
+        assert await buffer.flush() == 0
+        return len(buffer), sorted(user_id for _, user_id in buffer._pending), await buffer.get_user_xp(GUILD_ID, 4)
+
+    dropped = metrics.XP_BUFFER_DROPPED.value()
+    pending, members, data = asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert pending == 5
+    assert members == [4, 5, 6, 7, 8]
+    assert data["xp"] == 20
+    assert metrics.XP_BUFFER_DROPPED.value() - dropped == 3
@@ -0,0 +1,167 @@
+"""
+Write-behind buffer for presence-driven XP and streak updates.
+Awards are coalesced per (guild_id, user_id) in memory and flushed to the
+database in one transaction, instead of committing every award separately.
+"""
+
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import metrics
+from storage import StorageBackend
+from leaderboard_index import LeaderboardIndex
+
+logger = logging.getLogger(__name__)
+
+# Flush every FLUSH_INTERVAL seconds, or as soon as MAX_PENDING members have
+# unsaved changes. A crash loses at most one interval / MAX_PENDING members.
+# While flushes fail, batches are kept for retry up to MAX_RETAINED members;
+# past that the oldest unsaved changes are dropped (ayame_xp_buffer_dropped_total).
+FLUSH_INTERVAL = 10
+MAX_PENDING = 500
+MAX_RETAINED = 10 * MAX_PENDING
+
+class PendingWrite:
+    """Unsaved changes for one member."""
+    __slots__ = ("xp_delta", "last_xp_time", "streak")
+
+    def __init__(self):
+        self.xp_delta = 0
+        self.last_xp_time = None
+        self.streak = None  # (activity_name, streak_count, last_activity_time)
+
+class XPWriteBuffer:
+    def __init__(self, database: StorageBackend, max_pending: int = MAX_PENDING,
+                 leaderboard: Optional[LeaderboardIndex] = None, max_retained: int = MAX_RETAINED):
+        self.adb = database
+        self.max_pending = max_pending
+        self.max_retained = max(max_retained, max_pending)
+        # Kept in step with committed XP so leaderboard lookups stay off the disk
+        self.leaderboard = leaderboard
+        self._pending: Dict[Tuple[int, int], PendingWrite] = {}
+        self._flush_lock = asyncio.Lock()
+        # Bumped when a flush starts and when it ends, so readers can detect a race
+        self._generation = 0
+        # Set while no flush is writing
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _entry(self, guild_id: int, user_id: int) -> PendingWrite:
+        key = (guild_id, user_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = PendingWrite()
+        return entry
+
+    async def get_user_xp(self, guild_id: int, user_id: int) -> dict:
+        """Get user XP data including unsaved awards."""
+        while True:
+            await self._idle.wait()
+            generation = self._generation
+            data = await self.adb.get_user_xp(guild_id, user_id)
+            # Retry if a flush started while we were reading: the read may
+            # or may not include its batch
+            if generation == self._generation:
+                break
+
+        # No flush is in flight here, so only queued awards are missing
+        entry = self._pending.get((guild_id, user_id))
+        if entry and entry.last_xp_time:
+            data["xp"] += entry.xp_delta
+            data["level"] = data["xp"] // 100
+            data["last_xp_time"] = entry.last_xp_time.isoformat(" ")
+        return data
+
+    async def add_xp(self, guild_id: int, user_id: int, xp_amount: int) -> Tuple[bool, int]:
+        """Queue an XP award and return (leveled_up, new_level)."""
+        current = await self.get_user_xp(guild_id, user_id)
+        new_xp = current["xp"] + xp_amount
+        new_level = new_xp // 100
+
+        entry = self._entry(guild_id, user_id)
+        entry.xp_delta += xp_amount
+        entry.last_xp_time = datetime.now()
+
+        await self._flush_if_full()
+        return new_level > current["level"], new_level
+
+    async def update_streak(self, guild_id: int, user_id: int, activity_name: str, streak_count: int):
+        """Queue a streak update (last write wins)."""
+        entry = self._entry(guild_id, user_id)
+        entry.streak = (activity_name, streak_count, datetime.now())
+        await self._flush_if_full()
+
+    async def _flush_if_full(self):
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write all pending changes in one transaction. Returns members flushed."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            xp_rows = []
+            streak_rows = []
+            for (guild_id, user_id), entry in batch.items():
+                if entry.last_xp_time:
+                    xp_rows.append((guild_id, user_id, entry.xp_delta, entry.last_xp_time))
+                if entry.streak:
+                    streak_rows.append((guild_id, user_id) + entry.streak)
+
+            self._generation += 1
+            self._idle.clear()
+            if self.leaderboard:
+                self.leaderboard.begin_commit()
+            try:
+                await self.adb.apply_xp_batch(xp_rows, streak_rows)
+            except Exception as e:
+                logger.error(f"Failed to flush XP buffer ({len(batch)} members), will retry: {e}")
+                self._restore(batch)
+                xp_rows = []
+                return 0
+            finally:
+                self._generation += 1
+                self._idle.set()
+                if self.leaderboard:
+                    self.leaderboard.apply_committed(xp_rows)
+
+            logger.debug(f"Flushed XP buffer: {len(xp_rows)} XP rows, {len(streak_rows)} streak rows")
+            return len(batch)
+
+    def discard_guild(self, guild_id: int) -> int:
+        """Drop unsaved changes for a guild (before a reset or restore overwrites it)."""
+        keys = [key for key in self._pending if key[0] == guild_id]
+        for key in keys:
+            del self._pending[key]
+        return len(keys)
+
+    def _restore(self, batch: Dict[Tuple[int, int], PendingWrite]):
+        """
+        Merge a failed batch back under anything queued since. Members keep
+        their place from the failed batch, so the map stays oldest first and
+        anything past max_retained is dropped from the front.
+        """
+        for key, newer in self._pending.items():
+            old = batch.get(key)
+            if old is None:
+                batch[key] = newer
+                continue
+            old.xp_delta += newer.xp_delta
+            old.last_xp_time = newer.last_xp_time or old.last_xp_time
+            old.streak = newer.streak or old.streak
+        self._pending = batch
+
+        overflow = len(self._pending) - self.max_retained
+        if overflow > 0:
+            for key in list(itertools.islice(self._pending, overflow)):
+                del self._pending[key]
+            metrics.XP_BUFFER_DROPPED.inc(amount=overflow)
+            logger.error(f"XP buffer over {self.max_retained} members after failed flushes, dropped the {overflow} oldest")
@@ -19,3 +19,5 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         print("👋 Bot shutting down gracefully...")
+    finally:
+        storage.close()